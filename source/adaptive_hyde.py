@@ -0,0 +1,169 @@
+# =============================================================================
+# 【概要】
+# 「普通の検索で十分なら HyDE を使わない」適応型の HyDE リトリーバです。
+#
+# section6_3_1.py の hyde_rag_chain は、どんな質問でも検索の前に
+# 仮想回答を作る LLM 呼び出しを 1 回挟むため、簡単な質問でも
+# その分の待ち時間と料金がかかります。
+#
+# AdaptiveHyDERetriever は――
+#   1. まず質問そのものでベクトル検索し、上位のコサイン類似度を調べる
+#   2. 「1 位の類似度が min_similarity 以上」かつ「1 位と 2 位の差が min_margin 以上」
+#      なら自信ありとみなし、その結果をそのまま返す
+#   3. 自信が無いときだけ HyDE（hyde_cache.CachedHyDERetriever）で検索し直す
+# を行い、質問ごとの判断と所要時間を記録します。stats() は
+# 「HyDE を使った質問の平均所要時間 − 直接検索で済んだ質問の平均所要時間」
+# × 直接検索で済んだ回数 を、節約できた時間の推定値として返します。
+#
+# ※ 閾値は埋め込みモデルとコーパスで変わるので、decisions を見ながら調整してください。
+# =============================================================================
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+DEFAULT_MIN_SIMILARITY = 0.55  # 1 位のコサイン類似度がこれ未満なら HyDE へ
+DEFAULT_MIN_MARGIN = 0.02  # 1 位と 2 位の差がこれ未満（団子状態）なら HyDE へ
+DEFAULT_MAX_DECISIONS = 1000  # decisions に残す直近の判断の数
+
+
+@dataclass
+class HyDEDecision:
+    """1 つの質問に対する判断の記録"""
+
+    question: str
+    top_similarity: Optional[float]
+    margin: Optional[float]
+    used_hyde: bool
+    elapsed: float  # この質問の検索にかかった秒数
+
+
+def cosine_from_distance(distance: float, space: str) -> float:
+    """Chroma の距離をコサイン類似度に直す（埋め込みは長さ 1 に正規化済みとする）"""
+    if space == "l2":  # Chroma の l2 は二乗距離：|a-b|^2 = 2 - 2cos
+        return 1.0 - distance / 2.0
+    return 1.0 - distance  # cosine / ip はどちらも 1 - 類似度
+
+
+class AdaptiveHyDERetriever(BaseRetriever):
+    """直接検索の自信度を見て、必要なときだけ HyDE を使うリトリーバ"""
+
+    vectorstore: Any  # Chroma
+    hyde_retriever: Any  # CachedHyDERetriever など（質問 → Document のリスト）
+    min_similarity: float = DEFAULT_MIN_SIMILARITY
+    min_margin: float = DEFAULT_MIN_MARGIN
+    search_kwargs: dict = {"k": 4}
+    verbose: bool = False  # 質問ごとの判断を print する
+    max_decisions: int = DEFAULT_MAX_DECISIONS
+    # 内部状態（_decisions の長さは model_post_init で max_decisions に合わせる）
+    _decisions: deque = PrivateAttr(default_factory=deque)  # 直近の HyDEDecision
+    _counts: dict = PrivateAttr(  # 起動からの累計（hyde / direct の回数と秒数）
+        default_factory=lambda: {
+            "hyde": 0,
+            "direct": 0,
+            "hyde_seconds": 0.0,
+            "direct_seconds": 0.0,
+        }
+    )
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._decisions = deque(maxlen=self.max_decisions)
+
+    @property
+    def decisions(self) -> list[HyDEDecision]:
+        """直近 max_decisions 件の判断（古い順）"""
+        with self._lock:
+            return list(self._decisions)
+
+    def _distance_space(self) -> str:
+        """コレクションの距離の種類（l2 / cosine / ip）"""
+        # langchain_chroma には距離の種類を返す公開 API が無く、
+        # similarity_search_by_vector_with_relevance_scores も生の距離を返すため、
+        # ここ 1 か所だけ chromadb の Collection（_collection）のメタデータを読む。
+        metadata = self.vectorstore._collection.metadata or {}
+        return metadata.get("hnsw:space", "l2")
+
+    def _direct_search(self, query: str) -> list[tuple[Document, float]]:
+        vector = self.vectorstore.embeddings.embed_query(query)
+        results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            vector, **self.search_kwargs
+        )
+        space = self._distance_space()
+        return [(doc, cosine_from_distance(d, space)) for doc, d in results]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        started = time.perf_counter()
+
+        # ① 質問そのもので検索し、上位の類似度から自信度を判断
+        scored = self._direct_search(query)
+        similarities = [similarity for _, similarity in scored]
+        top = similarities[0] if similarities else None
+        margin = similarities[0] - similarities[1] if len(similarities) > 1 else None
+        confident = (
+            top is not None
+            and top >= self.min_similarity
+            and (margin is None or margin >= self.min_margin)
+        )
+
+        # ② 自信が無いときだけ HyDE で検索し直す
+        if confident:
+            documents = [doc for doc, _ in scored]
+        else:
+            documents = self.hyde_retriever.invoke(query)
+
+        decision = HyDEDecision(
+            question=query,
+            top_similarity=top,
+            margin=margin,
+            used_hyde=not confident,
+            elapsed=time.perf_counter() - started,
+        )
+        kind = "hyde" if decision.used_hyde else "direct"
+        with self._lock:
+            self._decisions.append(decision)
+            self._counts[kind] += 1
+            self._counts[f"{kind}_seconds"] += decision.elapsed
+        if self.verbose:
+            print(
+                f"[adaptive-hyde] {'hyde' if decision.used_hyde else 'direct'}: "
+                f"top={_fmt(top)} margin={_fmt(margin)} "
+                f"{decision.elapsed:.2f}s ({query[:40]})"
+            )
+        return documents
+
+    def stats(self) -> dict:
+        """HyDE を使った割合・平均所要時間・節約できたと推定される時間（累計）"""
+        with self._lock:
+            counts = dict(self._counts)
+        hyde, direct = counts["hyde"], counts["direct"]
+        mean_hyde = counts["hyde_seconds"] / hyde if hyde else None
+        mean_direct = counts["direct_seconds"] / direct if direct else None
+        saved = (
+            (mean_hyde - mean_direct) * direct
+            if mean_hyde is not None and mean_direct is not None
+            else None
+        )
+        total = hyde + direct
+        seconds = counts["hyde_seconds"] + counts["direct_seconds"]
+        return {
+            "queries": total,
+            "hyde": hyde,
+            "direct": direct,
+            "hyde_ratio": hyde / total if total else 0.0,
+            "mean_latency": seconds / total if total else 0.0,
+            "estimated_saved_seconds": saved,  # HyDE を 1 回も使っていなければ None
+        }
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}"
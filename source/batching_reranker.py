@@ -0,0 +1,186 @@
+# =============================================================================
+# 【概要】
+# 同時に届いたリランク要求を短い時間窓でまとめ、1 回の採点で処理する
+# マイクロバッチ方式のリランカーです。
+#
+# section6_4.py の rerank_rag_chain を多くの利用者が同時に呼ぶと、
+# リクエストごとに 1 回ずつリランク（モデル推論や API 呼び出し）が走り、
+# 1 回あたりの固定コストがリクエスト数だけ積み上がります。
+#
+# BatchingReranker は――
+#   1. rerank() の (質問, 文書) を待ち行列に入れ、呼び出し元は結果を待つ
+#   2. 裏のスレッドが、最初の要求から max_wait 秒以内に届いた要求を
+#      max_batch_size 件（文書数で max_pairs 組）までまとめる
+#   3. 包んだリランカーの score_batch() で一度に採点し、結果を各要求へ返す
+# を行います。待ち時間の上乗せは「max_wait ＋ 1 バッチ分の採点時間」までに
+# 抑えられ、バッチの大きさにも上限があるので p99 が青天井に伸びません。
+# 採点が timeout 秒以内に返らなければ、呼び出し元には concurrent.futures.TimeoutError を返します。
+#
+# ※ まとめて得をするのは score_batch() を上書きして 1 回で採点できるリランカー
+#    （CrossEncoderReranker など）だけです。BM25Reranker や CohereReranker のように
+#    1 件ずつ採点するものをまとめても、待ち時間が増えるだけで速くならないため、
+#    既定（batching=None）ではそのまま包んだリランカーを直接呼びます。
+#
+# 使い方:
+#   reranker = BatchingReranker(CrossEncoderReranker(), max_wait=0.01)
+#   chain = ... | RunnablePassthrough.assign(context=reranker.as_runnable())
+#   chain.batch(questions)  # 同時に来た要求はまとめて採点される
+# =============================================================================
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+from langchain_core.documents import Document
+
+from reranker import Reranker, StageTimer
+
+DEFAULT_MAX_BATCH_SIZE = 32  # 1 バッチにまとめる要求の数
+DEFAULT_MAX_PAIRS = 512  # 1 バッチで採点する (質問, 文書) の組の数
+DEFAULT_MAX_WAIT = 0.005  # 最初の要求から何秒まで後続を待つか
+DEFAULT_TIMEOUT = 60.0  # 採点結果を待つ秒数の上限（None なら無制限）
+
+
+def supports_batching(reranker: Reranker) -> bool:
+    """reranker が score_batch() を上書きしている（まとめて採点すると速くなる）か"""
+    return type(reranker).score_batch is not Reranker.score_batch
+
+
+@dataclass
+class _Request:
+    query: str
+    documents: Sequence[Document]
+    enqueued: float = field(default_factory=time.perf_counter)
+    future: Future = field(default_factory=Future)
+
+
+_STOP = object()  # ワーカースレッドを止める合図
+
+
+class BatchingReranker(Reranker):
+    """同時に届いた要求をまとめて、包んだリランカーの score_batch() に渡す"""
+
+    def __init__(
+        self,
+        reranker: Reranker,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_pairs: int = DEFAULT_MAX_PAIRS,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        batching: Optional[bool] = None,
+        timer: Optional[StageTimer] = None,
+    ):
+        """batching: None なら score_batch() を上書きしているリランカーだけまとめる"""
+        super().__init__(timer or reranker.timer)
+        self.reranker = reranker
+        self.batching = supports_batching(reranker) if batching is None else batching
+        self.name = f"batched-{reranker.name}" if self.batching else reranker.name
+        self.max_batch_size = max_batch_size
+        self.max_pairs = max_pairs
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.batches = 0  # 処理したバッチの数（ワーカースレッドだけが更新する）
+        self.requests = 0  # そのバッチに含まれていた要求の数の合計
+        self._queue: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ---------- 1. 要求を待ち行列に入れて結果を待つ ----------
+    def score(self, query: str, documents: Sequence[Document]) -> list[float]:
+        if not documents:
+            return []
+        if not self.batching:
+            return self.reranker.score(query, documents)
+        self._ensure_worker()
+        request = _Request(query, documents)
+        self._queue.put(request)
+        try:
+            return request.future.result(timeout=self.timeout)
+        except FutureTimeoutError:  # 3.11 未満では組み込みの TimeoutError と別物
+            # まだ採点が始まっていなければ取り消す（始まっていれば結果は捨てられる）
+            request.future.cancel()
+            raise
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=f"{self.name}-worker", daemon=True
+                )
+                self._worker.start()
+
+    # ---------- 2. 時間窓の間に届いた要求をまとめる ----------
+    def _collect(self, first: _Request) -> tuple[list[_Request], bool]:
+        batch, pairs = [first], len(first.documents)
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size and pairs < self.max_pairs:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()  # 窓を過ぎても、もう届いている分は拾う
+                )
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            pairs += len(item.documents)
+        return batch, False
+
+    # ---------- 3. まとめて採点し、結果を各要求へ返す ----------
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            # 待ちきれずに取り消された要求は採点しない
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            started = time.perf_counter()
+            for request in batch:
+                self.timer.record("rerank:queue_wait", started - request.enqueued)
+            try:
+                results = self.reranker.score_batch(
+                    [(request.query, request.documents) for request in batch]
+                )
+            except Exception as e:  # 1 件の失敗でワーカーを止めず、全員に例外を返す
+                for request in batch:
+                    request.future.set_exception(e)
+            else:
+                for request, scores in zip(batch, results):
+                    request.future.set_result(scores)
+            if batch:
+                self.timer.record("rerank:batch", time.perf_counter() - started)
+                self.batches += 1
+                self.requests += len(batch)
+            if stop:
+                return
+
+    def close(self) -> None:
+        """ワーカースレッドを止める（待ち行列に残った要求は処理してから止まる）"""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None and worker.is_alive():
+            self._queue.put(_STOP)
+            worker.join()
+
+    def __enter__(self) -> "BatchingReranker":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def stats(self) -> dict:
+        """バッチ数・平均バッチサイズと、段階ごとの所要時間"""
+        batches, requests = self.batches, self.requests
+        return {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "timings": self.timer.stats(),
+        }
@@ -0,0 +1,86 @@
+# =============================================================================
+# 【概要】
+# 同時に届くリランク要求を 1 件ずつ処理する場合と、BatchingReranker で
+# まとめて処理する場合のスループットと p50 / p99 レイテンシを比べるベンチマークです。
+#
+# cross-encoder や Rerank API は「1 回の呼び出しの固定コスト＋組ごとのコスト」が
+# かかり、同じモデルを同時に 1 つの推論しか走らせられません。
+# ここではその性質を SimulatedReranker（固定 20ms＋1 組 0.2ms、ロックで直列化）で
+# 再現するので、モデルのダウンロードや API キーなしで実行できます。
+#
+# 実行例:
+#   python bench_batching_reranker.py
+# =============================================================================
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
+
+from langchain_core.documents import Document
+
+from batching_reranker import BatchingReranker
+from reranker import Reranker, StageTimer
+
+CALL_OVERHEAD = 0.020  # 1 回の推論（API 呼び出し）の固定コスト（秒）
+PAIR_COST = 0.0002  # (質問, 文書) 1 組あたりのコスト（秒）
+DOCS_PER_REQUEST = 4  # db.as_retriever() の既定 k
+REQUESTS = 200
+
+
+class SimulatedReranker(Reranker):
+    """1 つのモデルを共有する cross-encoder の待ち時間だけを真似る"""
+
+    name = "simulated"
+
+    def __init__(self, timer=None):
+        super().__init__(timer)
+        self._model_lock = threading.Lock()
+
+    def score(self, query: str, documents: Sequence[Document]) -> list[float]:
+        return self.score_batch([(query, documents)])[0]
+
+    def score_batch(self, requests):
+        pairs = sum(len(documents) for _, documents in requests)
+        with self._model_lock:
+            time.sleep(CALL_OVERHEAD + PAIR_COST * pairs)
+        return [[float(len(doc.page_content)) for doc in docs] for _, docs in requests]
+
+
+def run(reranker: Reranker, concurrency: int) -> tuple[float, dict]:
+    documents = [Document(page_content="x" * i) for i in range(DOCS_PER_REQUEST)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(
+            executor.map(
+                lambda i: reranker.rerank(f"question {i}", documents),
+                range(REQUESTS),
+            )
+        )
+    throughput = REQUESTS / (time.perf_counter() - started)
+    return throughput, reranker.timer.stats()[f"rerank:{reranker.name}"]
+
+
+def main() -> None:
+    for concurrency in (1, 8, 32, 64):
+        direct = SimulatedReranker(timer=StageTimer())
+        direct_rps, direct_stats = run(direct, concurrency)
+        with BatchingReranker(
+            SimulatedReranker(timer=StageTimer()), max_wait=0.005
+        ) as batched:
+            batched_rps, batched_stats = run(batched, concurrency)
+            mean_batch = batched.stats()["mean_batch_size"]
+        print(
+            f"concurrency={concurrency:>2}: "
+            f"per-request {direct_rps:6.1f} req/s "
+            f"p50={direct_stats['p50'] * 1000:6.1f}ms "
+            f"p99={direct_stats['p99'] * 1000:6.1f}ms | "
+            f"batched {batched_rps:6.1f} req/s "
+            f"p50={batched_stats['p50'] * 1000:6.1f}ms "
+            f"p99={batched_stats['p99'] * 1000:6.1f}ms "
+            f"(mean batch {mean_batch:.1f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
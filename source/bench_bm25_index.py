@@ -0,0 +1,90 @@
+# =============================================================================
+# 【概要】
+# BM25Retriever.from_documents()（起動のたびにメモリ上で作り直す）と、
+# bm25_index.BM25Index（ディスクに保存して mmap で開く）の
+# 起動時間・検索時間を、コーパスの大きさを変えながら比べるベンチマークです。
+#
+# 文書は Zipf 分布に従う単語列の合成データです（API キーやリポジトリは不要）。
+# 分かち書きは両方とも text_tokenizer.tokenize にそろえています。
+#
+# 実行例:
+#   python bench_bm25_index.py
+# =============================================================================
+
+import random
+import shutil
+import tempfile
+import time
+
+from langchain_community.retrievers import BM25Retriever
+from langchain_core.documents import Document
+
+from bm25_index import BM25Index
+from text_tokenizer import tokenize
+
+VOCABULARY = 50_000
+QUERIES = 50
+K = 4
+
+
+def make_corpus(rng: random.Random, size: int) -> list[Document]:
+    documents = []
+    for i in range(size):
+        words = [
+            f"w{min(int(rng.paretovariate(0.8)), VOCABULARY)}"
+            for _ in range(rng.randint(50, 200))
+        ]
+        documents.append(Document(id=f"doc{i}", page_content=" ".join(words)))
+    return documents
+
+
+def make_queries(rng: random.Random) -> list[str]:
+    return [
+        " ".join(f"w{rng.randint(1, 2_000)}" for _ in range(rng.randint(2, 5)))
+        for _ in range(QUERIES)
+    ]
+
+
+def mean_query_ms(retriever, queries: list[str]) -> float:
+    started = time.perf_counter()
+    for query in queries:
+        retriever.invoke(query)
+    return (time.perf_counter() - started) / len(queries) * 1000
+
+
+def main() -> None:
+    rng = random.Random(0)
+    queries = make_queries(rng)
+    for size in (5_000, 20_000, 80_000):
+        documents = make_corpus(rng, size)
+
+        started = time.perf_counter()
+        in_memory = BM25Retriever.from_documents(
+            documents, preprocess_func=tokenize, k=K
+        )
+        in_memory_startup = time.perf_counter() - started
+        in_memory_query = mean_query_ms(in_memory, queries)
+
+        directory = tempfile.mkdtemp()
+        try:
+            started = time.perf_counter()
+            with BM25Index(directory) as index:
+                index.add(documents)
+            build = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with BM25Index(directory) as index:  # 2 回目以降の起動＝開くだけ
+                startup = time.perf_counter() - started
+                query = mean_query_ms(index.as_retriever(k=K), queries)
+        finally:
+            shutil.rmtree(directory)
+
+        print(
+            f"{size:>6} docs: BM25Retriever startup {in_memory_startup:6.2f}s "
+            f"query {in_memory_query:7.2f}ms | BM25Index build {build:6.2f}s "
+            f"startup {startup * 1000:6.2f}ms query {query:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
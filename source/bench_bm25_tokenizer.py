@@ -0,0 +1,127 @@
+# =============================================================================
+# 【概要】
+# BM25 の分かち書き（空白区切り / 文字 n-gram / 形態素解析）ごとに、
+# 日本語の質問での検索精度と、インデックス作成・検索の速さを比べるベンチマークです。
+#
+# コーパスは日英混在のテキストとして、このリポジトリの source/*.py
+# （日本語のコメント＋英語のコード）を 1000 文字ずつに分割して使います。
+# --repo を渡すと、その下の .mdx（英語のドキュメント）も混ぜます。
+# 評価用の質問は「この質問ならこのファイルが出てほしい」を手で付けたものです。
+#
+# 指標
+#   hit@4 : 上位 4 件に正解ファイルのチャンクが入った質問の割合
+#   MRR@10: 正解ファイルの最初の順位の逆数の平均（10 位までに無ければ 0）
+#
+# 実行例:
+#   python bench_bm25_tokenizer.py
+#   python bench_bm25_tokenizer.py --repo ./langchain
+# =============================================================================
+
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from bm25_index import BM25Index
+from text_tokenizer import make_tokenizer
+
+QUERIES = {
+    "ほぼ同じ内容のチャンクを登録しないようにしたい": "near_dedup.py",
+    "埋め込みの結果をキャッシュして API 呼び出しを減らしたい": "embedding_cache.py",
+    "HyDE の仮想回答をキャッシュするには": "hyde_cache.py",
+    "検索の自信度が低いときだけ仮想回答を作る": "adaptive_hyde.py",
+    "Chroma を使わずに NumPy でベクトル検索したい": "local_vector_index.py",
+    "同時に来たリランク要求をまとめて処理する": "batching_reranker.py",
+    "Cohere が使えないときのローカルなリランカー": "reranker.py",
+    "複数の検索結果を順位で統合する方法": "rank_fusion.py",
+    "複数のクエリをまとめて埋め込んで検索する": "multi_query_retriever.py",
+    "クエリ生成のストリームを読みながら検索を始める": "streaming_query_retriever.py",
+    "Git の差分だけを読み込みたい": "git_incremental_loader.py",
+    "mdx を見出しの単位で分割する": "mdx_splitter.py",
+    "有効期限付きのキャッシュ": "ttl_cache.py",
+    "BM25 のインデックスをディスクに保存する": "bm25_index.py",
+    "ドキュメントを mmap で読み込むキャッシュ": "document_store.py",
+    "埋め込みをバッチに分けて並列に実行する": "embedding_pipeline.py",
+}
+TOKENIZERS = ["whitespace", "ngram:2", "ngram:3", "morph"]
+
+
+def load_corpus(repo: Optional[str]) -> list[Document]:
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = sorted(glob.glob(os.path.join(here, "*.py")))
+    paths = [path for path in paths if path != os.path.abspath(__file__)]  # 質問を含む
+    if repo:
+        paths += sorted(glob.glob(os.path.join(repo, "**", "*.mdx"), recursive=True))
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+    documents = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        source = os.path.basename(path)
+        for i, chunk in enumerate(splitter.split_text(text)):
+            documents.append(
+                Document(
+                    id=f"{path}#{i}", page_content=chunk, metadata={"source": source}
+                )
+            )
+    return documents
+
+
+def build_tokenizer(spec: str):
+    kind, _, n = spec.partition(":")
+    return make_tokenizer(kind, n=int(n)) if n else make_tokenizer(kind)
+
+
+def evaluate(spec: str, documents: list[Document]) -> str:
+    try:
+        tokenizer = build_tokenizer(spec)
+    except ImportError as e:
+        return f"{spec:>10}: skipped ({e})"
+
+    directory = tempfile.mkdtemp()
+    try:
+        with BM25Index(directory, tokenizer=tokenizer) as index:
+            started = time.perf_counter()
+            index.add(documents)
+            build = time.perf_counter() - started
+
+            hits, reciprocal_ranks, elapsed = 0, 0.0, 0.0
+            for query, expected in QUERIES.items():
+                started = time.perf_counter()
+                results = index.search(query, k=10)
+                elapsed += time.perf_counter() - started
+                sources = [doc.metadata["source"] for doc, _ in results]
+                if expected in sources[:4]:
+                    hits += 1
+                if expected in sources:
+                    reciprocal_ranks += 1 / (sources.index(expected) + 1)
+    finally:
+        shutil.rmtree(directory)
+
+    return (
+        f"{tokenizer.name:>10}: hit@4 {hits / len(QUERIES):.2f} "
+        f"MRR@10 {reciprocal_ranks / len(QUERIES):.2f} | "
+        f"build {build:5.2f}s query {elapsed / len(QUERIES) * 1000:6.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repo", help=".mdx を混ぜるリポジトリのパス")
+    args = parser.parse_args()
+
+    documents = load_corpus(args.repo)
+    print(f"{len(documents)} chunks, {len(QUERIES)} queries")
+    for spec in TOKENIZERS:
+        print(evaluate(spec, documents))
+
+
+if __name__ == "__main__":
+    main()
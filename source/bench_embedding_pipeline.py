@@ -0,0 +1,50 @@
+# =============================================================================
+# 【概要】
+# embedding_pipeline.py のスループット（チャンク/秒）を、
+# fake_embedding_server.py（ローカルの偽 API）相手に計測するスクリプトです。
+# API キー・ネットワーク不要で、同時実行数や 429 への追従を確認できます。
+#
+# 実行例:
+#   python bench_embedding_pipeline.py
+# =============================================================================
+
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+
+from embedding_pipeline import EmbeddingPipeline
+from fake_embedding_server import start_fake_server
+
+# ---------- 1. 計測用のダミー文書（.mdx 風のテキスト）を用意 ----------
+raw_docs = [
+    Document(
+        page_content="\n\n".join(
+            f"# Section {i}-{j}\nLangChain のドキュメント {i} の段落 {j} です。" * 5
+            for j in range(20)
+        ),
+        metadata={"source": f"docs/page_{i}.mdx"},
+    )
+    for i in range(200)
+]
+
+# section4_6_1.py と同じ設定で分割する
+text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+
+# ---------- 2. 偽サーバを起動（1 秒 20 リクエストを超えると 429） ----------
+server = start_fake_server(rate_limit_rps=20, latency=0.05)
+
+# ---------- 3. 同時実行数を変えて計測 ----------
+for max_concurrency in (1, 4, 16):
+    pipeline = EmbeddingPipeline(
+        model="text-embedding-3-small",
+        max_concurrency=max_concurrency,
+        max_tokens_per_request=4_000,  # 小さめにしてリクエスト数を増やす
+        base_url=server.base_url,
+        api_key="fake",
+    )
+    chunks = (  # ジェネレータで 1 件ずつ流す（全チャンクをためない）
+        chunk for doc in raw_docs for chunk in text_splitter.split_documents([doc])
+    )
+    pipeline.embed(chunks)
+    print(f"concurrency={max_concurrency}: {pipeline.stats}")
+
+server.shutdown()
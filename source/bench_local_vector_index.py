@@ -0,0 +1,125 @@
+# =============================================================================
+# 【概要】
+# local_vector_index.py の LocalVectorIndex について、exact（総当たり）と
+# ivf（近似）の検索レイテンシと再現率を、Chroma もネットワークも使わずに測る
+# ベンチマークです。
+#
+#   - 既定ではクラスタ構造を持つ乱数ベクトルを作って使う
+#   - --from-chroma を付けると、vector_index.py で永続化したコレクションの
+#     埋め込みを書き出して使う（埋め込み API は呼ばない）
+#   - どちらも一度ディスクに保存し、mmap で開き直してから計測する
+#   - 再現率 = ivf の上位 k 件のうち、exact の上位 k 件に含まれる割合
+#
+# 実行例:
+#   python bench_local_vector_index.py --count 200000 --dimensions 256
+#   python bench_local_vector_index.py --from-chroma
+# =============================================================================
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from local_vector_index import LocalVectorIndex
+from vector_index import DEFAULT_COLLECTION_NAME, DEFAULT_PERSIST_DIRECTORY
+
+
+def synthetic_corpus(
+    count: int, dimensions: int, clusters: int = 256, seed: int = 0
+) -> tuple[list[Document], np.ndarray]:
+    """クラスタの周りに散らばったベクトル（実際の埋め込みに近い分布）を作る"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.5 * rng.standard_normal(
+        (count, dimensions), dtype=np.float32
+    )
+    documents = [
+        Document(page_content=f"chunk {i}", metadata={"source": f"doc{i}.mdx"})
+        for i in range(count)
+    ]
+    return documents, vectors
+
+
+def chroma_corpus() -> tuple[list[Document], np.ndarray]:
+    """永続化済みの Chroma コレクションから（API を呼ばずに）取り出す"""
+    from langchain_chroma import Chroma
+
+    db = Chroma(
+        collection_name=DEFAULT_COLLECTION_NAME,
+        persist_directory=DEFAULT_PERSIST_DIRECTORY,
+    )
+    index = LocalVectorIndex.from_chroma(db, mode="exact")
+    return list(index.documents), np.asarray(index.vectors)
+
+
+def measure(index: LocalVectorIndex, queries: np.ndarray, k: int, **kwargs):
+    """1 問ずつ検索し、(各問の上位 k 件, p50 ミリ秒, p95 ミリ秒) を返す"""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query, k=k, **kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(set(ids.tolist()))
+    return results, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LocalVectorIndex のベンチマーク")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--from-chroma", action="store_true")
+    args = parser.parse_args()
+
+    # ---------- 1. コーパスを用意 ----------
+    if args.from_chroma:
+        documents, vectors = chroma_corpus()
+    else:
+        documents, vectors = synthetic_corpus(args.count, args.dimensions)
+    print(f"{len(documents)} vectors x {vectors.shape[1]} dims")
+
+    # 質問はコーパス内のベクトルに少しノイズを足したもの
+    rng = np.random.default_rng(1)
+    picked = rng.choice(len(vectors), args.queries, replace=False)
+    queries = vectors[picked] + 0.1 * rng.standard_normal(
+        (args.queries, vectors.shape[1]), dtype=np.float32
+    )
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # ---------- 2. 構築 → 保存 → mmap で開き直す ----------
+        indexes = {}
+        for mode in ("exact", "ivf"):
+            started = time.perf_counter()
+            LocalVectorIndex.build(documents, vectors, mode=mode).save(
+                os.path.join(workdir, mode)
+            )
+            built = time.perf_counter() - started
+            started = time.perf_counter()
+            indexes[mode] = LocalVectorIndex.load(os.path.join(workdir, mode))
+            print(
+                f"{mode:>5}: build+save {built:.2f}s, "
+                f"load {(time.perf_counter() - started) * 1000:.1f}ms"
+            )
+
+        # ---------- 3. レイテンシと再現率 ----------
+        exact, p50, p95 = measure(indexes["exact"], queries, args.k)
+        print(f"exact: p50 {p50:.2f}ms, p95 {p95:.2f}ms")
+        for nprobe in (1, 4, 8, 16, 32):
+            found, p50, p95 = measure(indexes["ivf"], queries, args.k, nprobe=nprobe)
+            recall = np.mean([len(f & e) / len(e) for f, e in zip(found, exact)])
+            print(
+                f"  ivf: nprobe={nprobe:>2}, p50 {p50:.2f}ms, p95 {p95:.2f}ms, "
+                f"recall@{args.k} {recall:.3f}"
+            )
+
+        for index in indexes.values():
+            index.close()  # mmap を閉じてから一時ディレクトリを消す
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# =============================================================================
+# 【概要】
+# section4_6_1.py の CharacterTextSplitter(chunk_size=1000, chunk_overlap=0) と
+# mdx_splitter.py の MdxTextSplitter を、LangChain の .mdx ドキュメントで比べる
+# ベンチマークです。
+#
+#   - チャンク数
+#   - 1 チャンクあたりの平均・最大トークン数（tiktoken で計測）
+#   - トークン予算（MdxTextSplitter の chunk_size）を超えるチャンクの割合
+#   - 検索の命中率：各ドキュメントのタイトル（frontmatter の title: か最初の # 見出し）
+#     を質問とし、そのドキュメントのチャンクが上位 k 件に入るか
+#
+# 実行例:
+#   python bench_mdx_splitter.py
+# =============================================================================
+
+import random
+import re
+import statistics
+from typing import Optional
+
+import tiktoken
+from dotenv import load_dotenv
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_openai import OpenAIEmbeddings
+from langchain_text_splitters import CharacterTextSplitter, TextSplitter
+
+from embedding_cache import CachedEmbeddings
+from mdx_splitter import MdxTextSplitter
+from parallel_loader import ParallelGitLoader
+
+load_dotenv()
+
+CHUNK_TOKENS = 512  # MdxTextSplitter のトークン予算
+SAMPLE_DOCS = 200  # 命中率を測るドキュメント数（埋め込み代の節約）
+TOP_K = 4  # 各スクリプトの retriever（既定 k=4）と同じ
+
+_TITLE_RE = re.compile(r"^title:\s*[\"']?(.+?)[\"']?\s*$", re.M)
+_H1_RE = re.compile(r"^#\s+(.+?)\s*$", re.M)
+
+
+def file_filter(file_path: str) -> bool:
+    """拡張子が .mdx のファイルだけを通すフィルタ関数"""
+    return file_path.endswith(".mdx")
+
+
+def document_title(doc: Document) -> Optional[str]:
+    """frontmatter の title: か、最初の # 見出しを質問文として使う"""
+    match = _TITLE_RE.search(doc.page_content) or _H1_RE.search(doc.page_content)
+    return match.group(1) if match else None
+
+
+def token_stats(chunks: list[Document], encoding) -> dict:
+    counts = [len(encoding.encode(chunk.page_content)) for chunk in chunks]
+    return {
+        "chunks": len(chunks),
+        "avg_tokens": statistics.mean(counts),
+        "max_tokens": max(counts),
+        "over_budget": sum(c > CHUNK_TOKENS for c in counts) / len(counts),
+    }
+
+
+def hit_rate(
+    name: str,
+    splitter: TextSplitter,
+    labeled: list[tuple[str, Document]],
+    embeddings: CachedEmbeddings,
+) -> float:
+    """タイトルで検索し、元ドキュメントのチャンクが上位 TOP_K 件に入る割合"""
+    chunks = splitter.split_documents([doc for _, doc in labeled])
+    db = Chroma.from_documents(chunks, embeddings, collection_name=f"bench_{name}")
+    retriever = db.as_retriever(search_kwargs={"k": TOP_K})
+    hits = 0
+    for query, doc in labeled:
+        sources = {r.metadata["source"] for r in retriever.invoke(query)}
+        hits += doc.metadata["source"] in sources
+    db.delete_collection()
+    return hits / len(labeled)
+
+
+def main() -> None:
+    encoding = tiktoken.encoding_for_model("text-embedding-3-small")
+    splitters: dict[str, TextSplitter] = {
+        # section4_6_1.py と同じ分割設定
+        "character_1000": CharacterTextSplitter(chunk_size=1000, chunk_overlap=0),
+        f"mdx_{CHUNK_TOKENS}tok": MdxTextSplitter(chunk_size=CHUNK_TOKENS),
+    }
+
+    # ---------- 1. 読み込み（分割はここではしない） ----------
+    documents = ParallelGitLoader(
+        clone_url="https://github.com/langchain-ai/langchain",
+        repo_path="./langchain",
+        branch="master",
+        file_filter=file_filter,
+    ).load()
+    print(f"{len(documents)} documents")
+
+    # ---------- 2. チャンク数・トークン数 ----------
+    for name, splitter in splitters.items():
+        stats = token_stats(splitter.split_documents(documents), encoding)
+        print(
+            f"{name:>16}: {stats['chunks']} chunks, "
+            f"avg {stats['avg_tokens']:.0f} tokens, max {stats['max_tokens']}, "
+            f"over {CHUNK_TOKENS} tokens {stats['over_budget']:.1%}"
+        )
+
+    # ---------- 3. 検索の命中率（タイトルを質問にした簡易評価） ----------
+    labeled = [(document_title(doc), doc) for doc in documents]
+    labeled = [(title, doc) for title, doc in labeled if title]
+    random.Random(0).shuffle(labeled)  # 毎回同じサンプルになるよう種を固定
+    labeled = labeled[:SAMPLE_DOCS]
+    if not labeled:
+        print("no titled documents: skip hit rate")
+        return
+
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
+    for name, splitter in splitters.items():
+        rate = hit_rate(name, splitter, labeled, embeddings)
+        print(f"{name:>16}: hit@{TOP_K} {rate:.1%} ({len(labeled)} queries)")
+    print(embeddings.stats())
+
+
+# ParallelGitLoader がワーカーを起動するため main ガードの中で実行
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# =============================================================================
+# 【概要】
+# section6_3_3.py / section6_5_2.py にあった本文キーの recipocal_rank_fusion() と、
+# rank_fusion.py の reciprocal_rank_fusion()（チャンク ID＋NumPy 集計）の
+# 実行時間を、クエリ数 × top-k を変えながら比べるベンチマークです。
+#
+# 検索結果は呼び出しのたびに新しい Document（新しい本文文字列）として
+# 返ってくるため、計測ごとに Document を作り直してから測ります。
+#
+# 実行例:
+#   python bench_rank_fusion.py
+# =============================================================================
+
+import random
+import time
+
+from langchain_core.documents import Document
+
+from rank_fusion import reciprocal_rank_fusion
+
+CHUNK_CHARS = 1000  # 1 チャンクの文字数（CharacterTextSplitter の既定に合わせる）
+POOL_SIZE = 20_000  # 検索対象のチャンク数
+REPEAT = 20
+
+
+def recipocal_rank_fusion(retriever_outputs: list[list[Document]], k: int = 60):
+    """これまでの実装（本文をキーにした辞書で集計し、本文だけを返す）"""
+    content_score_mapping = {}
+    for docs in retriever_outputs:
+        for rank, doc in enumerate(docs):
+            content = doc.page_content
+            if content not in content_score_mapping:
+                content_score_mapping[content] = 0
+            content_score_mapping[content] += 1 / (rank + k)
+    ranked = sorted(content_score_mapping.items(), key=lambda x: x[1], reverse=True)
+    return [content for content, _ in ranked]
+
+
+def retrieve(rng: random.Random, queries: int, top_k: int) -> list[list[Document]]:
+    """Chroma の検索結果と同じく、毎回新しい Document を作って返す"""
+    outputs = []
+    for _ in range(queries):
+        outputs.append(
+            [
+                Document(
+                    page_content=f"{i:06d}" + "x" * CHUNK_CHARS,
+                    metadata={"source": f"doc{i}.mdx", "chunk_id": f"doc{i}.mdx#0"},
+                )
+                for i in rng.sample(range(POOL_SIZE), top_k)
+            ]
+        )
+    return outputs
+
+
+def measure(fusion, queries: int, top_k: int) -> float:
+    rng = random.Random(0)
+    elapsed = 0.0
+    for _ in range(REPEAT):
+        outputs = retrieve(rng, queries, top_k)
+        started = time.perf_counter()
+        fusion(outputs)
+        elapsed += time.perf_counter() - started
+    return elapsed / REPEAT * 1000
+
+
+def main() -> None:
+    for queries, top_k in ((3, 4), (8, 20), (16, 100), (50, 200), (100, 500)):
+        before = measure(recipocal_rank_fusion, queries, top_k)
+        after = measure(reciprocal_rank_fusion, queries, top_k)
+        print(
+            f"queries={queries:>3} x top_k={top_k:>3}: "
+            f"content-keyed {before:7.3f}ms, id-keyed {after:7.3f}ms "
+            f"({before / after:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
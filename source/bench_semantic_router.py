@@ -0,0 +1,119 @@
+# =============================================================================
+# 【概要】
+# section6_5_1.py の LLM ルーター（route_chain）と、semantic_router.SemanticRouter
+# （例文の重心との類似度、迷ったときだけ LLM）の正解率・LLM 呼び出し率・所要時間を、
+# 正解ラベル付きの質問で比べるベンチマークです。
+#
+# 評価用の質問は SemanticRouter の例文とは別に用意しています。
+# LLM ルーターの判断は 1 回だけ求め、min_margin を変えたときの
+# 「LLM に任せる割合」と「正解率」をまとめて表にします。
+#
+# 実行には OPENAI_API_KEY が必要です。
+#
+# 実行例:
+#   python bench_semantic_router.py
+# =============================================================================
+
+import time
+from enum import Enum
+
+import numpy as np
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from pydantic import BaseModel
+
+from embedding_cache import CachedEmbeddings
+from semantic_router import SemanticRouter
+
+MARGINS = [0.0, 0.01, 0.02, 0.03, 0.05, 0.08]
+
+LABELED_QUESTIONS = [
+    ("LangChain とは何ですか", "langchain_document"),
+    ("LCEL でチェーンをつなぐ方法", "langchain_document"),
+    ("RunnablePassthrough の役割は", "langchain_document"),
+    ("ChatPromptTemplate に変数を渡すには", "langchain_document"),
+    ("ベクトルストアを retriever に変換する方法", "langchain_document"),
+    ("LangChain で会話履歴を保持するには", "langchain_document"),
+    ("Tool calling を LangChain で使う方法", "langchain_document"),
+    ("OutputParser の種類を教えて", "langchain_document"),
+    ("LangGraph と LangChain の違いは", "langchain_document"),
+    ("GitLoader でリポジトリを読み込むには", "langchain_document"),
+    ("How do I stream tokens from a chat model in LangChain?", "langchain_document"),
+    ("What does RunnableParallel do?", "langchain_document"),
+    ("札幌の明日の天気", "web"),
+    ("今日のプロ野球の試合結果", "web"),
+    ("ドル円の現在のレート", "web"),
+    ("今年のノーベル賞の受賞者は", "web"),
+    ("新宿で今日開いている美術館", "web"),
+    ("最新の iPhone の価格", "web"),
+    ("今週の台風の進路", "web"),
+    ("首相の今日の会見の内容", "web"),
+    ("週末に行ける近場の温泉", "web"),
+    ("ビットコインの今日の値動き", "web"),
+    ("Who won the football match last night?", "web"),
+    ("Current exchange rate between euro and yen", "web"),
+]
+
+
+# ---------- section6_5_1.py と同じ LLM ルーター ----------
+class Route(str, Enum):
+    langchain_document = "langchain_document"
+    web = "web"
+
+
+class RouteOutput(BaseModel):
+    route: Route
+
+
+def llm_router():
+    model = ChatOpenAI(model="gpt-4.1-nano", temperature=0)
+    route_prompt = ChatPromptTemplate.from_template(
+        """\
+    質問に回答するために、適切なRetrieverを選択してください。
+    質問:{question}
+    """
+    )
+    return (
+        route_prompt | model.with_structured_output(RouteOutput) | (lambda x: x.route)
+    )
+
+
+def main() -> None:
+    questions = [question for question, _ in LABELED_QUESTIONS]
+    labels = np.array([label for _, label in LABELED_QUESTIONS])
+
+    # ① LLM ルーター（質問ごとに 1 往復）
+    route_chain = llm_router()
+    started = time.perf_counter()
+    llm_routes = np.array(
+        [route_chain.invoke({"question": q}).value for q in questions]
+    )
+    llm_latency = (time.perf_counter() - started) / len(questions)
+
+    # ② 埋め込みの類似度（min_margin を変えても埋め込みは同じなので 1 回だけ）
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
+    router = SemanticRouter(embeddings)
+    started = time.perf_counter()
+    similarities = np.array([router.similarities(q) for q in questions])
+    embedding_latency = (time.perf_counter() - started) / len(questions)
+    ordered = np.sort(similarities, axis=1)
+    margins = ordered[:, -1] - ordered[:, -2]
+    local_routes = np.array(router.routes)[np.argmax(similarities, axis=1)]
+
+    print(
+        f"LLM router           : accuracy {np.mean(llm_routes == labels):.2f} "
+        f"LLM calls 100% | {llm_latency * 1000:6.0f} ms/question"
+    )
+    for min_margin in MARGINS:
+        use_llm = margins < min_margin
+        routes = np.where(use_llm, llm_routes, local_routes)
+        latency = embedding_latency + np.mean(use_llm) * llm_latency
+        print(
+            f"semantic (margin {min_margin:.2f}): accuracy {np.mean(routes == labels):.2f} "
+            f"agreement with LLM {np.mean(routes == llm_routes):.2f} "
+            f"LLM calls {np.mean(use_llm):4.0%} | {latency * 1000:6.0f} ms/question"
+        )
+
+
+if __name__ == "__main__":
+    main()
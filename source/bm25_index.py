@@ -0,0 +1,563 @@
+# =============================================================================
+# 【概要】
+# ディスクに保存し、mmap で開く BM25 の転置インデックスです。
+#
+# section6_5_2.py の BM25Retriever.from_documents(documents) は、起動のたびに
+# 全チャンクを分かち書きし直してメモリ上にインデックスを作るため、
+# 起動時間がコーパスの大きさに比例し、差分だけの更新もできません。
+#
+# BM25Index は――
+#   1. 追加されたチャンクを「セグメント」（語 → 文書番号・出現回数の postings、
+#      文書長、語ごとの最大出現回数など）として .npy に書き出す
+#   2. 削除・置き換えは「削除済み」印を付けるだけにし、セグメントは書き換えない
+#      （セグメントが増えすぎたり削除が多くなったら compact() で 1 つにまとめ直す）
+#   3. 開くときは meta.json を読み、各セグメントを np.load(mmap_mode="r") で開くだけ
+#   4. 検索は MaxScore（WAND 系の枝刈り）：語ごとのスコア上限を使い、
+#      上位 k 件に入り得ない文書を採点せずに飛ばす
+# を行います。起動は meta.json とセグメント数に比例するだけで、コーパスが
+# 大きくなっても分かち書きし直しません。
+#
+# 保存形式（ディレクトリ 1 つ）
+#   meta.json                : 形式・分かち書き関数・k1/b・セグメント一覧・件数
+#   seg_NNNNNN/terms_*.npy   : 語の表（UTF-8 のバイト順、二分探索で引く）
+#   seg_NNNNNN/postings_*.npy: 語ごとの postings（文書番号の昇順）
+#   seg_NNNNNN/ids_*.npy     : チャンク ID の表（削除・置き換え用）
+#   seg_NNNNNN/documents.docstore: document_store.py の形式の本文
+#   seg_NNNNNN/deleted_*.npy : 削除済み印（更新のたびに新しい名前で書く）
+# meta.json を最後に os.replace で書き換えるので、途中で落ちても前の状態で開けます。
+#
+# ※ IDF の文書頻度には compact() するまで削除済みの文書も数えます（Lucene と同じ）。
+# =============================================================================
+
+import json
+import math
+import os
+import shutil
+from collections import Counter
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from document_store import DocumentStore
+from text_tokenizer import tokenize
+
+DEFAULT_BM25_DIRECTORY = os.path.join(".rag_cache", "bm25")
+FORMAT_VERSION = 1
+DEFAULT_K1 = 1.5  # rank_bm25（BM25Retriever）と同じ
+DEFAULT_B = 0.75
+MAX_SEGMENTS = 8  # これより増えたら compact()
+MAX_DELETED_RATIO = 0.3  # 削除済みの割合がこれを超えたら compact()
+
+
+def _load(path: str) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:  # 空の配列は mmap できない
+        return np.load(path)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """scores の大きい順に k 個の位置を返す（全件ソートせず argpartition を使う）"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _tokenizer_name(tokenizer: Callable[[str], list[str]]) -> str:
+    """text_tokenizer の分かち書きは name、ただの関数は「モジュール.関数名」"""
+    name = getattr(tokenizer, "name", None)
+    return name or f"{tokenizer.__module__}.{tokenizer.__qualname__}"
+
+
+def _document_id(doc: Document) -> str:
+    """rank_fusion.chunk_key と同じく metadata["chunk_id"] を優先する"""
+    chunk_id = doc.metadata.get("chunk_id") or doc.id
+    if not chunk_id:
+        raise ValueError("BM25Index needs documents with an id (or metadata chunk_id)")
+    return chunk_id
+
+
+# ---------- 文字列の表（語・チャンク ID） ----------
+class _StringTable:
+    """UTF-8 のバイト順に並べた文字列を 1 本のバイト列に詰めた表（二分探索で引く）"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> "_StringTable":
+        return cls(
+            _load(os.path.join(directory, f"{name}_blob.npy")),
+            _load(os.path.join(directory, f"{name}_offsets.npy")),
+        )
+
+    @staticmethod
+    def save(directory: str, name: str, keys: list[bytes]) -> None:
+        """keys はバイト順に並べ済みであること"""
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(key) for key in keys], out=offsets[1:])
+        blob = np.frombuffer(b"".join(keys), dtype=np.uint8)
+        np.save(os.path.join(directory, f"{name}_blob.npy"), blob)
+        np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def key(self, i: int) -> bytes:
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes()
+
+    def find(self, key: bytes) -> int:
+        """key の位置（無ければ -1）"""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self.key(lo) == key else -1
+
+
+# ---------- 1. セグメント（書き出した後は読み取り専用） ----------
+class _Segment:
+    def __init__(self, directory: str, entry: dict[str, Any]):
+        path = os.path.join(directory, entry["name"])
+        self.name = entry["name"]
+        self.path = path
+        self.terms = _StringTable.load(path, "terms")
+        # postings_docs[postings_offsets[t]:postings_offsets[t+1]] が語 t の文書番号
+        self.postings_offsets = _load(os.path.join(path, "postings_offsets.npy"))
+        self.postings_docs = _load(os.path.join(path, "postings_docs.npy"))
+        self.postings_tfs = _load(os.path.join(path, "postings_tfs.npy"))
+        self.term_max_tf = _load(os.path.join(path, "term_max_tf.npy"))
+        self.term_min_length = _load(os.path.join(path, "term_min_length.npy"))
+        self.lengths = _load(os.path.join(path, "lengths.npy"))
+        self.ids = _StringTable.load(path, "ids")
+        self.ids_order = _load(os.path.join(path, "ids_order.npy"))  # 表の位置 → 文書
+        self.ids_rank = _load(os.path.join(path, "ids_rank.npy"))  # 文書 → 表の位置
+        self.documents = DocumentStore(os.path.join(path, "documents.docstore"))
+        self.deleted_file = entry.get("deleted")
+        self.deleted = (
+            np.load(os.path.join(path, self.deleted_file))  # 書き換えるのでコピー
+            if self.deleted_file
+            else np.zeros(len(self.lengths), dtype=bool)
+        )
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def postings(
+        self, term: bytes
+    ) -> Optional[tuple[np.ndarray, np.ndarray, int, int]]:
+        """(文書番号, 出現回数, 最大出現回数, 最短文書長)。語が無ければ None"""
+        t = self.terms.find(term)
+        if t < 0:
+            return None
+        start, end = self.postings_offsets[t], self.postings_offsets[t + 1]
+        return (
+            self.postings_docs[start:end],
+            self.postings_tfs[start:end],
+            int(self.term_max_tf[t]),
+            int(self.term_min_length[t]),
+        )
+
+    def find(self, chunk_id: str) -> int:
+        """チャンク ID のセグメント内の文書番号（無ければ -1）"""
+        position = self.ids.find(chunk_id.encode("utf-8"))
+        return -1 if position < 0 else int(self.ids_order[position])
+
+    def chunk_id(self, local: int) -> str:
+        return self.ids.key(int(self.ids_rank[local])).decode("utf-8")
+
+    def close(self) -> None:
+        self.documents.close()
+
+    @staticmethod
+    def write(
+        path: str,
+        chunk_ids: list[str],
+        documents: list[Document],
+        tokenizer: Callable[[str], list[str]],
+    ) -> int:
+        """文書を分かち書きしてセグメントを書き出し、総トークン数を返す"""
+        os.makedirs(path)
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        lengths = np.zeros(len(documents), dtype=np.int32)
+        for local, doc in enumerate(documents):
+            counts = Counter(tokenizer(doc.page_content))
+            lengths[local] = sum(counts.values())
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(local)
+                tfs.append(tf)
+
+        terms = sorted((term.encode("utf-8"), term) for term in postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[term][0]) for _, term in terms], out=offsets[1:])
+        docs = np.fromiter(
+            (d for _, term in terms for d in postings[term][0]),
+            dtype=np.int32,
+            count=offsets[-1],
+        )
+        tfs = np.fromiter(
+            (tf for _, term in terms for tf in postings[term][1]),
+            dtype=np.int32,
+            count=offsets[-1],
+        )
+        # 語ごとのスコア上限に使う「最大出現回数」と「最短文書長」
+        starts = offsets[:-1]
+        has_postings = len(docs) > 0
+        max_tf = np.maximum.reduceat(tfs, starts) if has_postings else tfs
+        min_length = np.minimum.reduceat(lengths[docs], starts) if has_postings else tfs
+
+        _StringTable.save(path, "terms", [key for key, _ in terms])
+        np.save(os.path.join(path, "postings_offsets.npy"), offsets)
+        np.save(os.path.join(path, "postings_docs.npy"), docs)
+        np.save(os.path.join(path, "postings_tfs.npy"), tfs)
+        np.save(os.path.join(path, "term_max_tf.npy"), max_tf.astype(np.int32))
+        np.save(os.path.join(path, "term_min_length.npy"), min_length.astype(np.int32))
+        np.save(os.path.join(path, "lengths.npy"), lengths)
+
+        encoded_ids = [chunk_id.encode("utf-8") for chunk_id in chunk_ids]
+        order = np.array(
+            sorted(range(len(encoded_ids)), key=encoded_ids.__getitem__),
+            dtype=np.int64,
+        )
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        _StringTable.save(path, "ids", [encoded_ids[i] for i in order])
+        np.save(os.path.join(path, "ids_order.npy"), order)
+        np.save(os.path.join(path, "ids_rank.npy"), rank)
+
+        DocumentStore.write(
+            os.path.join(path, "documents.docstore"), documents, {"segment": path}
+        )
+        return int(lengths.sum())
+
+
+class _QueryTerm:
+    """検索語 1 つ分の postings（全セグメントを通し番号で連結）とスコア上限"""
+
+    def __init__(self, docs: np.ndarray, tfs: np.ndarray, weight: float, bound: float):
+        self.docs = docs
+        self.tfs = tfs
+        self.weight = weight  # IDF × 質問中の出現回数
+        self.bound = bound  # この語だけで得られるスコアの上限
+
+
+class BM25Index:
+    """セグメント単位で追加・削除できる、mmap で開く BM25 インデックス"""
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_BM25_DIRECTORY,
+        tokenizer: Callable[[str], list[str]] = tokenize,
+        k1: float = DEFAULT_K1,
+        b: float = DEFAULT_B,
+    ):
+        self.directory = directory
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.last_candidates = 0  # 直近の検索で実際に採点した文書数
+        os.makedirs(directory, exist_ok=True)
+
+        settings = {
+            "format_version": FORMAT_VERSION,
+            "tokenizer": _tokenizer_name(tokenizer),
+            "k1": k1,
+            "b": b,
+        }
+        meta = self._read_meta()
+        if meta is not None and any(meta.get(k) != v for k, v in settings.items()):
+            print(f"{directory}: settings changed, rebuilding the BM25 index")
+            meta = None
+        if meta is None:
+            meta = {**settings, "generation": 0, "live": 0, "total_length": 0}
+            meta["segments"] = []
+        self.meta = meta
+        self._remove_unreferenced()
+        self.segments = [_Segment(directory, entry) for entry in meta["segments"]]
+        self._arrays: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return self.meta["live"]
+
+    # ---------- meta.json ----------
+    def _read_meta(self) -> Optional[dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self) -> None:
+        path = os.path.join(self.directory, "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)  # これで更新が確定する
+
+    def _next_name(self, prefix: str) -> str:
+        self.meta["generation"] += 1
+        return f"{prefix}_{self.meta['generation']:06d}"
+
+    def _remove_unreferenced(self) -> None:
+        """meta.json に載っていないセグメント（書き出し途中で落ちたもの）を消す"""
+        referenced = {entry["name"] for entry in self.meta["segments"]}
+        for name in os.listdir(self.directory):
+            if name.startswith("seg_") and name not in referenced:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    # ---------- 2. 追加・削除 ----------
+    def add(self, documents: Iterable[Document]) -> None:
+        """文書を 1 セグメントとして追加する（同じ ID の既存の文書は置き換える）"""
+        latest = {_document_id(doc): doc for doc in documents}
+        if not latest:
+            return
+        changed = self._mark_deleted(latest)
+        name = self._next_name("seg")
+        total_length = _Segment.write(
+            os.path.join(self.directory, name),
+            list(latest),
+            list(latest.values()),
+            self.tokenizer,
+        )
+        self.meta["segments"].append({"name": name, "deleted": None})
+        self.meta["live"] += len(latest)
+        self.meta["total_length"] += total_length
+        self._commit(changed)
+        self.segments.append(_Segment(self.directory, self.meta["segments"][-1]))
+        self._maybe_compact()
+
+    def delete(self, chunk_ids: Iterable[str]) -> int:
+        """チャンク ID の文書に削除済みの印を付け、消した件数を返す"""
+        before = len(self)
+        self._commit(self._mark_deleted(chunk_ids))
+        self._maybe_compact()
+        return before - len(self)
+
+    def _mark_deleted(self, chunk_ids: Iterable[str]) -> set[int]:
+        """削除済みの印を付け（まだ保存しない）、変更したセグメントの番号を返す"""
+        changed = set()
+        for chunk_id in chunk_ids:
+            for i, segment in enumerate(self.segments):
+                local = segment.find(chunk_id)
+                if local >= 0 and not segment.deleted[local]:
+                    segment.deleted[local] = True
+                    self.meta["live"] -= 1
+                    self.meta["total_length"] -= int(segment.lengths[local])
+                    changed.add(i)
+        if changed:
+            self._arrays = None
+        return changed
+
+    def _commit(self, changed: set[int]) -> None:
+        """変更したセグメントの削除済み印を新しいファイルに書き、meta.json を更新する"""
+        stale = []
+        for i in changed:
+            segment, entry = self.segments[i], self.meta["segments"][i]
+            name = self._next_name("deleted") + ".npy"
+            np.save(os.path.join(segment.path, name), segment.deleted)
+            if segment.deleted_file:
+                stale.append(os.path.join(segment.path, segment.deleted_file))
+            segment.deleted_file = entry["deleted"] = name
+        self._write_meta()
+        for path in stale:
+            os.remove(path)
+
+    def _maybe_compact(self) -> None:
+        stored = sum(len(segment) for segment in self.segments)
+        deleted = stored - len(self)
+        if len(self.segments) > MAX_SEGMENTS or (
+            stored and deleted / stored > MAX_DELETED_RATIO
+        ):
+            self.compact()
+
+    def compact(self) -> None:
+        """削除済みを除いた全文書を 1 つのセグメントに書き直す"""
+        chunk_ids, documents = [], []
+        for segment in self.segments:
+            for local in np.flatnonzero(~segment.deleted):
+                chunk_ids.append(segment.chunk_id(local))
+                documents.append(segment.documents[local])
+        old = self.segments
+        name = self._next_name("seg")
+        entries = []
+        if documents:
+            path = os.path.join(self.directory, name)
+            self.meta["total_length"] = _Segment.write(
+                path, chunk_ids, documents, self.tokenizer
+            )
+            entries.append({"name": name, "deleted": None})
+        self.meta["segments"] = entries
+        self._write_meta()
+        self.segments = [_Segment(self.directory, entry) for entry in entries]
+        self._arrays = None
+        for segment in old:
+            segment.close()
+            shutil.rmtree(segment.path, ignore_errors=True)
+
+    def ids(self) -> Iterator[str]:
+        """削除されていない文書のチャンク ID"""
+        for segment in self.segments:
+            for local in np.flatnonzero(~segment.deleted):
+                yield segment.chunk_id(local)
+
+    def sync(self, db: Chroma) -> None:
+        """
+        Chroma のコレクションと ID を突き合わせ、違っていれば差分だけ反映する。
+        件数だけでは「1 件消えて 1 件増えた」ずれを見逃すので、ID の集合で比べる
+        （ingest_pipeline の ID は blob の SHA を含むので、本文が変われば ID も変わる）。
+        """
+        stored = set(db.get(include=[])["ids"])
+        known = set(self.ids())
+        if stored == known:
+            return
+        self.delete(known - stored)
+        missing = list(stored - known)
+        if missing:
+            result = db.get(ids=missing, include=["documents", "metadatas"])
+            self.add(
+                Document(id=chunk_id, page_content=text, metadata=metadata or {})
+                for chunk_id, text, metadata in zip(
+                    result["ids"], result["documents"], result["metadatas"]
+                )
+            )
+
+    # ---------- 3〜4. 検索 ----------
+    def _global_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(各セグメントの先頭の通し番号, 文書長, 削除済み印) を全セグメント分つなげる"""
+        if self._arrays is None:
+            sizes = [len(segment) for segment in self.segments]
+            bases = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+            lengths = np.concatenate(
+                [segment.lengths for segment in self.segments] or [np.zeros(0)]
+            )
+            deleted = np.concatenate(
+                [segment.deleted for segment in self.segments] or [np.zeros(0, bool)]
+            )
+            self._arrays = bases, lengths, deleted
+        return self._arrays
+
+    def _query_terms(self, query: str, avgdl: float) -> list[_QueryTerm]:
+        bases = self._global_arrays()[0]
+        k1, b, live = self.k1, self.b, len(self)
+        terms = []
+        for term, count in Counter(self.tokenizer(query)).items():
+            key = term.encode("utf-8")
+            docs, tfs, max_tf, min_length = [], [], 0, None
+            for segment, base in zip(self.segments, bases):
+                found = segment.postings(key)
+                if found is None:
+                    continue
+                docs.append(found[0] + base)
+                tfs.append(found[1])
+                max_tf = max(max_tf, found[2])
+                min_length = min(min_length or found[3], found[3])
+            if not docs:
+                continue
+            df = min(sum(len(d) for d in docs), live)
+            # Lucene と同じく常に正になる IDF（削除済みも数える）
+            weight = count * math.log(1 + (live - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * min_length / avgdl)
+            bound = weight * max_tf * (k1 + 1) / (max_tf + norm)
+            terms.append(
+                _QueryTerm(np.concatenate(docs), np.concatenate(tfs), weight, bound)
+            )
+        return terms
+
+    def _score(
+        self, terms: list[_QueryTerm], candidates: np.ndarray, avgdl: float
+    ) -> np.ndarray:
+        """candidates（昇順の通し番号）を全検索語で採点する"""
+        lengths = self._global_arrays()[1]
+        norm = self.k1 * (1 - self.b + self.b * lengths[candidates] / avgdl)
+        scores = np.zeros(len(candidates))
+        for term in terms:
+            # postings は文書番号の昇順なので二分探索で出現回数を引く
+            position = np.minimum(
+                np.searchsorted(term.docs, candidates), len(term.docs) - 1
+            )
+            tf = np.where(term.docs[position] == candidates, term.tfs[position], 0)
+            scores += term.weight * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        """BM25 スコアの高い順に (Document, スコア) を最大 k 件返す"""
+        if not len(self):
+            return []
+        avgdl = max(self.meta["total_length"] / len(self), 1e-9)
+        terms = self._query_terms(query, avgdl)
+        if not terms:
+            return []
+        deleted = self._global_arrays()[2]
+
+        # ① postings が最短の語の文書だけを採点し、k 位のスコアを暫定の閾値にする
+        seed = min(terms, key=lambda term: len(term.docs))
+        seed_docs = seed.docs[~deleted[seed.docs]]
+        threshold = 0.0
+        if len(seed_docs) >= k:
+            seed_scores = self._score(terms, seed_docs, avgdl)
+            threshold = float(np.partition(seed_scores, -k)[-k])
+
+        # ② 上限の小さい語から足していき、合計が閾値に届かない語だけに出る文書は
+        #    k 位に入れないので候補から外す（MaxScore）
+        essential, bound_sum = [], 0.0
+        for term in sorted(terms, key=lambda term: term.bound):
+            bound_sum += term.bound
+            if bound_sum >= threshold:
+                essential.append(term)
+        candidates = np.unique(np.concatenate([term.docs for term in essential]))
+        candidates = candidates[~deleted[candidates]]
+        self.last_candidates = len(candidates)
+
+        # ③ 残った候補だけを全語で採点して上位 k 件
+        scores = self._score(terms, candidates, avgdl)
+        top = _top_k(scores, k)
+        return [(self._document(candidates[i]), float(scores[i])) for i in top]
+
+    def _document(self, number: int) -> Document:
+        bases = self._global_arrays()[0]
+        i = int(np.searchsorted(bases, number, side="right")) - 1
+        segment, local = self.segments[i], int(number - bases[i])
+        doc = segment.documents[local]
+        return Document(
+            id=segment.chunk_id(local),
+            page_content=doc.page_content,
+            metadata=doc.metadata,
+        )
+
+    def as_retriever(self, k: int = 4) -> "BM25IndexRetriever":
+        """BM25Retriever と同じく上位 k 件（既定 4 件）を返す Retriever"""
+        return BM25IndexRetriever(index=self, k=k)
+
+    # ---------- 後片付け ----------
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self._arrays = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """BM25Index を LangChain の Retriever として使うためのラッパー"""
+
+    index: Any  # BM25Index（pydantic の型検査を避けるため Any）
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return [doc for doc, _ in self.index.search(query, k=self.k)]
@@ -0,0 +1,194 @@
+# =============================================================================
+# 【概要】
+# document.pkl（pickle で List[Document] を丸ごと保存）に代わる
+# 「バージョン付き・mmap 対応」のドキュメントキャッシュです。
+#
+# pickle 方式の問題点
+#   - 読み込み時に全件を一度に復元するため、コーパスが 100 倍になると RAM も 100 倍
+#   - リポジトリが更新されても、file_filter を変えても、古いキャッシュを使い続ける
+#
+# このモジュールのファイル形式（すべてリトルエンディアン）
+#   [MAGIC 8byte][ヘッダ長 uint64][ヘッダ JSON]
+#   [件数 N uint64][オフセット表 (N+1) × uint64][レコード本体（1 件 = 1 JSON）]
+#
+#   - ヘッダ JSON にはローダ設定・リポジトリのコミット・フィルタの指紋を記録し、
+#     どれか 1 つでも変わればキャッシュを自動で作り直す
+#   - オフセット表があるので、i 番目の Document だけを mmap から切り出して復元できる
+# =============================================================================
+
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from collections.abc import Sequence
+from typing import Any, Callable, Iterable, Optional, Union
+
+from langchain_core.documents import Document
+
+MAGIC = b"RAGDOCS1"  # ファイル先頭の識別子
+FORMAT_VERSION = 1  # 形式を変えたら上げる（古いキャッシュは作り直し）
+DEFAULT_CACHE_PATH = os.path.join(".rag_cache", "documents.docstore")
+
+_U64 = struct.Struct("<Q")  # 符号なし 64bit 整数（リトルエンディアン）
+
+
+class DocumentStore(Sequence):
+    """mmap したキャッシュファイルから Document を必要な分だけ復元する読み取り専用列"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a document store file")
+
+        pos = len(MAGIC)
+        (header_len,) = _U64.unpack_from(self._mm, pos)
+        pos += _U64.size
+        self.header: dict[str, Any] = json.loads(self._mm[pos : pos + header_len])
+        pos += header_len
+
+        (self._count,) = _U64.unpack_from(self._mm, pos)
+        pos += _U64.size
+        self._offsets_pos = pos  # オフセット表の開始位置
+        self._body_pos = pos + _U64.size * (self._count + 1)  # 本体の開始位置
+
+    # ---------- Sequence インタフェース ----------
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("document index out of range")
+
+        start, end = struct.unpack_from(
+            "<2Q", self._mm, self._offsets_pos + _U64.size * index
+        )
+        record = json.loads(self._mm[self._body_pos + start : self._body_pos + end])
+        return Document(
+            page_content=record["page_content"], metadata=record["metadata"]
+        )
+
+    # ---------- 後片付け ----------
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------- 書き込み ----------
+    @staticmethod
+    def write(
+        path: str,
+        documents: Iterable[Document],
+        header: Union[dict[str, Any], Callable[[], dict[str, Any]]],
+    ) -> None:
+        """
+        Document を 1 件ずつ書き出す（全件をメモリに載せない）。
+        header に関数を渡すと、全件を書き終えた後に呼び出してヘッダを決める。
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        offsets = [0]
+
+        # 本体は一時ファイルへストリーム書き込みし、件数確定後に連結する
+        with tempfile.TemporaryFile() as body:
+            for doc in documents:
+                record = {"page_content": doc.page_content, "metadata": doc.metadata}
+                data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+                body.write(data)
+                offsets.append(offsets[-1] + len(data))
+
+            if callable(header):
+                header = header()
+            header_bytes = json.dumps(
+                {**header, "format_version": FORMAT_VERSION}, ensure_ascii=False
+            ).encode("utf-8")
+
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(MAGIC)
+                f.write(_U64.pack(len(header_bytes)))
+                f.write(header_bytes)
+                f.write(_U64.pack(len(offsets) - 1))
+                f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+                body.seek(0)
+                shutil.copyfileobj(body, f)
+            os.replace(tmp_path, path)  # 書き込み途中のファイルを読ませない
+
+
+# ---------- キャッシュの「鍵」になる情報 ----------
+def filter_fingerprint(file_filter: Optional[Callable[[str], bool]]) -> Optional[str]:
+    """file_filter のソースコードのハッシュ（中身を書き換えたら別物とみなす）"""
+    if file_filter is None:
+        return None
+    try:
+        source = inspect.getsource(file_filter)
+    except (OSError, TypeError):  # ソースが取れない関数は名前で代用
+        source = getattr(file_filter, "__qualname__", repr(file_filter))
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def repo_commit(repo_path: str, branch: Optional[str]) -> Optional[str]:
+    """ローカルリポジトリのブランチ先頭コミット（未クローンなら None）"""
+    if not os.path.isdir(os.path.join(repo_path, ".git")):
+        return None
+    from git import Repo
+    from gitdb.exc import BadName
+
+    try:
+        return Repo(repo_path).commit(branch or "HEAD").hexsha
+    except BadName:  # ブランチがまだローカルに無い（checkout 前）
+        return None
+
+
+def loader_header(loader: Any) -> dict[str, Any]:
+    """GitLoader の設定からキャッシュヘッダを組み立てる"""
+    return {
+        "format_version": FORMAT_VERSION,
+        "loader": {
+            "class": type(loader).__name__,
+            "clone_url": loader.clone_url,
+            "repo_path": os.path.abspath(loader.repo_path),
+            "branch": loader.branch,
+        },
+        "commit": repo_commit(loader.repo_path, loader.branch),
+        "filter": filter_fingerprint(loader.file_filter),
+    }
+
+
+def load_documents_cached(
+    loader: Any, cache_path: str = DEFAULT_CACHE_PATH
+) -> DocumentStore:
+    """
+    キャッシュが有効ならそれを開き、無効（無い・コミット違い・フィルタ違い）なら
+    loader.lazy_load() から作り直して開く。
+    """
+    expected = loader_header(loader)
+    if expected["commit"] is not None and os.path.exists(cache_path):
+        try:
+            store = DocumentStore(cache_path)
+        except ValueError:  # 旧形式・壊れたファイルは作り直す
+            store = None
+        if store is not None:
+            if store.header == expected:
+                return store
+            store.close()
+
+    # clone/checkout は lazy_load() の中で行われるため、
+    # コミットは全件書き出した後にヘッダへ記録する
+    DocumentStore.write(cache_path, loader.lazy_load(), lambda: loader_header(loader))
+    return DocumentStore(cache_path)
@@ -0,0 +1,183 @@
+# =============================================================================
+# 【概要】
+# OpenAIEmbeddings などの埋め込みモデルの前段に置く「永続キャッシュ」です。
+# どのスクリプトも起動のたびに Chroma.from_documents(documents, embeddings) で
+# コーパス全体を text-embedding-3-small に送り直していますが、
+# 本文が同じなら返ってくるベクトルも同じなので、2 回目以降は API を呼ぶ必要がありません。
+#
+# 仕組み
+#   - キー   : (モデルのキー, sha256(テキスト))  ← 本文そのものは保存しない
+#              モデルのキーはモデル名＋出力を変えるパラメータ（dimensions など）で、
+#              embed_query の結果は "#query" を付けた別のキーに保存する
+#   - 保存先 : SQLite（.rag_cache/embeddings.sqlite3）に float32 のバイト列で保存
+#   - embed_documents / embed_query はまずキャッシュを引き、無い分だけ本物を呼ぶ
+#   - stats() でヒット率と保存バイト数を確認できる
+#
+# 使い方:
+#   embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
+#   db = Chroma.from_documents(documents, embeddings)   # 2 回目以降は API 呼び出し 0 回
+#   print(embeddings.stats())
+# =============================================================================
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = os.path.join(".rag_cache", "embeddings.sqlite3")
+SQLITE_MAX_VARIABLES = 500  # 1 回の IN (...) に渡すキー数（SQLite の上限対策）
+# ベクトルの値や長さを変えるパラメータ（設定されていればモデルのキーに含める）
+OUTPUT_PARAMS = ("dimensions", "model_kwargs", "encode_kwargs")
+QUERY_SUFFIX = "#query"  # embed_query の結果を embed_documents と分けて保存する
+
+
+def text_hash(text: str) -> str:
+    """テキストの sha256（キャッシュキーの後半）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def model_key(embeddings: Embeddings) -> str:
+    """
+    キャッシュキーの前半。モデル名に、出力を変えるパラメータを付けたもの
+    （例: "text-embedding-3-small{"dimensions": 256}"）。
+    同じモデルでも dimensions が違えば、別のベクトルとして保存する。
+    """
+    name = (
+        getattr(embeddings, "model", None)  # OpenAIEmbeddings
+        or getattr(embeddings, "model_name", None)  # HuggingFaceEmbeddings など
+        or type(embeddings).__name__
+    )
+    params = {
+        param: getattr(embeddings, param)
+        for param in OUTPUT_PARAMS
+        if getattr(embeddings, param, None)
+    }
+    if not params:
+        return str(name)
+    return f"{name}{json.dumps(params, sort_keys=True, default=str)}"
+
+
+class CachedEmbeddings(Embeddings):
+    """(モデルのキー, sha256(テキスト)) をキーに SQLite へベクトルを保存する Embeddings"""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        model_name: Optional[str] = None,
+    ):
+        self.underlying = underlying
+        # model_name を渡すと、model_key() の代わりにそのままキーに使う
+        self.model_name = model_name or model_key(underlying)
+        self._query_model = self.model_name + QUERY_SUFFIX
+        self.cache_path = cache_path
+        self.hits = 0  # キャッシュから返せた件数
+        self.misses = 0  # 本物の埋め込みモデルを呼んだ件数
+        self._lock = threading.Lock()  # 1 つの接続を複数スレッドで共有するため
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # 複数プロセスからの読み書き用
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model     TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector    BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    # ---------- キャッシュの読み書き ----------
+    def _lookup(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))  # 同じ本文は 1 回だけ問い合わせ
+        with self._lock:
+            for start in range(0, len(unique), SQLITE_MAX_VARIABLES):
+                batch = unique[start : start + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    "SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def _store(self, model: str, items: dict[str, list[float]]) -> None:
+        rows = [
+            (model, key, array("f", vector).tobytes()) for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    # ---------- Embeddings インタフェース ----------
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(text) for text in texts]
+        cached = self._lookup(self.model_name, hashes)
+
+        # キャッシュに無い本文だけを（重複を除いて）本物のモデルへ送る
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self._store(self.model_name, new_items)
+            cached.update(new_items)
+
+        with self._lock:  # 複数スレッドから同時に呼ばれても数え漏らさない
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        # 質問用と文書用でベクトルが違うモデル（E5 など）があるので、キーを分ける
+        key = text_hash(text)
+        cached = self._lookup(self._query_model, [key])
+        if key in cached:
+            with self._lock:
+                self.hits += 1
+            return cached[key]
+
+        vector = self.underlying.embed_query(text)
+        self._store(self._query_model, {key: vector})
+        with self._lock:
+            self.misses += 1
+        return vector
+
+    # ---------- 統計 ----------
+    def stats(self) -> dict[str, float]:
+        """ヒット率・保存件数・保存バイト数を返す"""
+        with self._lock:
+            count, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings "
+                "WHERE model IN (?, ?)",
+                [self.model_name, self._query_model],
+            ).fetchone()
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "entries": count,
+            "bytes_stored": stored_bytes,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
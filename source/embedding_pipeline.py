@@ -0,0 +1,285 @@
+# =============================================================================
+# 【概要】
+# チャンクをまとめて埋め込み API に送る「バッチ＋並列」埋め込みステージです。
+# Chroma.from_documents に任せると、バッチの大きさも同時実行数も既定値のまま
+# 順番に 1 リクエストずつ送られるため、大きなコーパスでは時間がかかります。
+#
+# このモジュールでは――
+#   1. スプリッタから流れてくるチャンクを 1 件ずつ受け取り（全件をためない）
+#   2. tiktoken でトークン数を数え、1 リクエストの上限トークン数まで詰めて送る
+#   3. asyncio で最大 N 本のリクエストを同時に走らせる
+#   4. 429（Rate Limit）が返ったら同時実行数を半分に絞り、成功が続けば 1 ずつ戻す
+#      （AIMD: 加算増加・乗算減少）
+#   5. 処理件数・リクエスト数・429 回数・チャンク/秒 を EmbeddingStats で報告
+# を行います。base_url を差し替えれば fake_embedding_server.py に向けて試せます。
+#
+# 使い方:
+#   pipeline = EmbeddingPipeline(model="text-embedding-3-small", max_concurrency=4)
+#   for docs, vectors in pipeline.embed(text_splitter.split_documents(raw_docs)):
+#       ...（Chroma などへ登録）...
+#   print(pipeline.stats)
+# =============================================================================
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Union
+
+import tiktoken
+from langchain_core.documents import Document
+from openai import AsyncOpenAI, RateLimitError
+
+MAX_INPUT_TOKENS = 8191  # text-embedding-3-* の 1 入力あたりの上限
+MAX_INPUTS_PER_REQUEST = 2048  # 1 リクエストに入れられる入力数の上限
+DEFAULT_TOKENS_PER_REQUEST = 50_000  # 1 リクエストに詰めるトークン数の目安
+
+
+@dataclass
+class EmbeddingStats:
+    """埋め込みステージのスループット計測結果"""
+
+    chunks: int = 0  # 埋め込んだチャンク数
+    tokens: int = 0  # 送ったトークン数
+    requests: int = 0  # 成功したリクエスト数
+    rate_limited: int = 0  # 429 を受けた回数
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.chunks} chunks / {self.requests} requests in {self.elapsed:.2f}s "
+            f"({self.chunks_per_sec:.1f} chunks/sec, {self.tokens} tokens, "
+            f"{self.rate_limited} rate-limited)"
+        )
+
+
+class AdaptiveLimiter:
+    """429 を受けたら同時実行数を半減、成功が続いたら 1 ずつ増やすセマフォ"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency  # 現在の同時実行数の上限
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def release(self) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_concurrency:
+            self.limit += 1  # 加算増加
+            self._successes = 0
+
+    def on_rate_limited(self) -> None:
+        self.limit = max(1, self.limit // 2)  # 乗算減少
+        self._successes = 0
+
+
+class _TokenBatcher:
+    """チャンクを 1 件ずつ受け取り、上限に達したらバッチを返す"""
+
+    def __init__(
+        self,
+        encoding: tiktoken.Encoding,
+        max_tokens_per_request: int,
+        max_inputs_per_request: int,
+    ):
+        self.encoding = encoding
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self._batch: list[tuple[Document, str, int]] = []
+        self._batch_tokens = 0
+
+    def add(self, chunk: Document) -> Optional[list[tuple[Document, str, int]]]:
+        """チャンクを追加し、入り切らなかった場合は直前までのバッチを返す"""
+        tokens = self.encoding.encode(chunk.page_content)
+        text = chunk.page_content
+        if len(tokens) > MAX_INPUT_TOKENS:  # 1 入力の上限を超える分は切り詰める
+            tokens = tokens[:MAX_INPUT_TOKENS]
+            text = self.encoding.decode(tokens)
+
+        full = None
+        if self._batch and (
+            self._batch_tokens + len(tokens) > self.max_tokens_per_request
+            or len(self._batch) >= self.max_inputs_per_request
+        ):
+            full = self.flush()
+        self._batch.append((chunk, text, len(tokens)))
+        self._batch_tokens += len(tokens)
+        return full
+
+    def flush(self) -> Optional[list[tuple[Document, str, int]]]:
+        batch, self._batch, self._batch_tokens = self._batch, [], 0
+        return batch or None
+
+
+def pack_by_tokens(
+    chunks: Iterable[Document],
+    encoding: tiktoken.Encoding,
+    max_tokens_per_request: int = DEFAULT_TOKENS_PER_REQUEST,
+    max_inputs_per_request: int = MAX_INPUTS_PER_REQUEST,
+) -> Iterator[list[tuple[Document, str, int]]]:
+    """チャンクを (Document, 送る本文, トークン数) のバッチに詰めて順に返す"""
+    batcher = _TokenBatcher(encoding, max_tokens_per_request, max_inputs_per_request)
+    for chunk in chunks:
+        if (batch := batcher.add(chunk)) is not None:
+            yield batch
+    if (batch := batcher.flush()) is not None:
+        yield batch
+
+
+async def apack_by_tokens(
+    chunks: Union[Iterable[Document], AsyncIterable[Document]],
+    encoding: tiktoken.Encoding,
+    max_tokens_per_request: int = DEFAULT_TOKENS_PER_REQUEST,
+    max_inputs_per_request: int = MAX_INPUTS_PER_REQUEST,
+) -> AsyncIterator[list[tuple[Document, str, int]]]:
+    """pack_by_tokens の非同期版（async for で流れてくるチャンクにも使える）"""
+    if not hasattr(chunks, "__aiter__"):
+        for batch in pack_by_tokens(
+            chunks, encoding, max_tokens_per_request, max_inputs_per_request
+        ):
+            yield batch
+        return
+
+    batcher = _TokenBatcher(encoding, max_tokens_per_request, max_inputs_per_request)
+    async for chunk in chunks:
+        if (batch := batcher.add(chunk)) is not None:
+            yield batch
+    if (batch := batcher.flush()) is not None:
+        yield batch
+
+
+class EmbeddingPipeline:
+    """トークン数でバッチを作り、asyncio で並列に埋め込む"""
+
+    def __init__(
+        self,
+        model: str = "text-embedding-3-small",
+        max_concurrency: int = 4,
+        max_tokens_per_request: int = DEFAULT_TOKENS_PER_REQUEST,
+        max_retries: int = 6,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+    ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.api_key = api_key
+        self.encoding = tiktoken.encoding_for_model(model)  # section2_5_3.py と同じ方法
+        self.stats = EmbeddingStats()
+
+    # ---------- 1 バッチ分のリクエスト（429 なら待って再送） ----------
+    async def _embed_batch(
+        self,
+        client: AsyncOpenAI,
+        limiter: AdaptiveLimiter,
+        batch: list[tuple[Document, str, int]],
+    ) -> tuple[list[Document], list[list[float]]]:
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await client.embeddings.create(
+                        model=self.model, input=[text for _, text, _ in batch]
+                    )
+                    break
+                except RateLimitError as e:
+                    self.stats.rate_limited += 1
+                    limiter.on_rate_limited()
+                    if attempt == self.max_retries:
+                        raise
+                    # Retry-After があれば従い、無ければ指数バックオフ＋ジッタ
+                    retry_after = e.response.headers.get("retry-after")
+                    delay = float(retry_after) if retry_after else 0.5 * 2**attempt
+                    await asyncio.sleep(delay * (1 + random.random() * 0.1))
+        finally:
+            await limiter.release()
+
+        limiter.on_success()
+        self.stats.requests += 1
+        self.stats.chunks += len(batch)
+        self.stats.tokens += sum(n_tokens for _, _, n_tokens in batch)
+        vectors = [
+            item.embedding for item in sorted(response.data, key=lambda d: d.index)
+        ]
+        return [doc for doc, _, _ in batch], vectors
+
+    # ---------- 非同期版：終わったバッチから順に返す ----------
+    async def aembed(
+        self, chunks: Union[Iterable[Document], AsyncIterable[Document]]
+    ) -> AsyncIterator[tuple[list[Document], list[list[float]]]]:
+        """(チャンクのリスト, ベクトルのリスト) を完了順に返す（async for の入力も可）"""
+        client = AsyncOpenAI(
+            base_url=self.base_url, api_key=self.api_key, max_retries=0
+        )  # 再送は自前で行う
+        limiter = AdaptiveLimiter(self.max_concurrency)
+        self.stats = EmbeddingStats()
+        pending: set[asyncio.Task] = set()
+        batches = apack_by_tokens(chunks, self.encoding, self.max_tokens_per_request)
+
+        async def next_batch() -> Optional[list[tuple[Document, str, int]]]:
+            """次のバッチを受け取り、同時実行の枠が空くまで待つ（入力が尽きたら None）"""
+            batch = await anext(batches, None)
+            if batch is not None:
+                await limiter.acquire()
+            return batch
+
+        # 入力待ちと埋め込み待ちを同時に待ち、終わったバッチは入力を待たずにすぐ返す
+        # （入力がゆっくり流れてくる場合も、埋め込み済みのチャンクを止めておかない）
+        reader: Optional[asyncio.Task] = asyncio.create_task(next_batch())
+        try:
+            while reader is not None or pending:
+                waiting = pending | {reader} if reader is not None else pending
+                done, _ = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+                if reader in done:
+                    batch = reader.result()
+                    reader = None
+                    if batch is not None:
+                        pending.add(
+                            asyncio.create_task(
+                                self._embed_batch(client, limiter, batch)
+                            )
+                        )
+                        # 枠を取ってから次を読むので、先読みするバッチは 1 つだけ
+                        reader = asyncio.create_task(next_batch())
+                for task in done & pending:
+                    pending.remove(task)
+                    yield task.result()
+        finally:
+            if reader is not None:
+                reader.cancel()
+            for task in pending:
+                task.cancel()
+            self.stats.finished = time.perf_counter()
+            await client.close()
+
+    # ---------- 同期版（スクリプトから使う用） ----------
+    def embed(
+        self, chunks: Iterable[Document]
+    ) -> list[tuple[list[Document], list[list[float]]]]:
+        async def collect():
+            return [result async for result in self.aembed(chunks)]
+
+        return asyncio.run(collect())
@@ -0,0 +1,184 @@
+# =============================================================================
+# 【概要】
+# OpenAI の /v1/embeddings を真似る、ローカル用の「偽」埋め込みサーバです。
+# API キーもネットワークも不要で、embedding_pipeline.py のバッチ化・並列化・
+# 429 対応をオフラインで試すために使います。
+#
+#   - 同じ本文には毎回同じベクトル（sha256 から作る決定論的な値）を返す
+#   - rate_limit_rps を超えるリクエストには 429 + Retry-After を返す
+#   - latency 秒だけ応答を遅らせ、本物の API の往復時間を再現できる
+#
+# 単体起動:
+#   python fake_embedding_server.py --port 8765 --rate-limit-rps 20 --latency 0.05
+#   → base_url="http://127.0.0.1:8765/v1" を OpenAI クライアントに渡す
+# =============================================================================
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def fake_vector(text: str, dimensions: int) -> list[float]:
+    """本文の sha256 を種にした、長さ 1 に正規化済みの疑似ベクトル"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+class _RateLimiter:
+    """1 秒あたり rps 回までを許すトークンバケット（None なら無制限）"""
+
+    def __init__(self, rps: Optional[float]):
+        self.rps = rps
+        self._tokens = rps or 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rps is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rps, self._tokens + (now - self._updated) * self.rps
+            )
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    """設定値とカウンタを持つ HTTP サーバ本体"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        dimensions: int = 1536,
+        rate_limit_rps: Optional[float] = None,
+        latency: float = 0.0,
+    ):
+        super().__init__(address, _Handler)
+        self.dimensions = dimensions
+        self.latency = latency
+        self.limiter = _RateLimiter(rate_limit_rps)
+        self.requests = 0  # 受け付けたリクエスト数
+        self.rejected = 0  # 429 を返した回数
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeEmbeddingServer
+
+    def log_message(self, format, *args) -> None:
+        pass  # アクセスログは出さない
+
+    def _send_json(
+        self, status: int, body: dict, headers: Optional[dict] = None
+    ) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/v1/embeddings":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+
+        if not self.server.limiter.allow():
+            self.server.rejected += 1
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                {"Retry-After": "0.2"},
+            )
+            return
+
+        self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        inputs = payload["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = payload.get("dimensions") or self.server.dimensions
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_vector(str(text), dimensions)
+            if payload.get("encoding_format") == "base64":  # openai>=1.x の既定
+                embedding = base64.b64encode(
+                    struct.pack(f"<{len(vector)}f", *vector)
+                ).decode("ascii")
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        tokens = sum(len(str(text)) for text in inputs)  # 文字数で近似
+        self._send_json(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": payload.get("model", "fake"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+
+def start_fake_server(
+    port: int = 0,
+    dimensions: int = 1536,
+    rate_limit_rps: Optional[float] = None,
+    latency: float = 0.0,
+) -> FakeEmbeddingServer:
+    """別スレッドでサーバを起動して返す（port=0 なら空いているポートを使う）"""
+    server = FakeEmbeddingServer(
+        ("127.0.0.1", port),
+        dimensions=dimensions,
+        rate_limit_rps=rate_limit_rps,
+        latency=latency,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ローカル用の偽埋め込みサーバ")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--rate-limit-rps", type=float, default=None)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeEmbeddingServer(
+        ("127.0.0.1", args.port),
+        dimensions=args.dimensions,
+        rate_limit_rps=args.rate_limit_rps,
+        latency=args.latency,
+    )
+    print(f"fake embedding server: {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,150 @@
+# =============================================================================
+# 【概要】
+# Tavily の /search を真似る、ローカル用の「偽」Web 検索サーバと、
+# そのサーバを使うリトリーバ（FakeSearchRetriever）です。
+# API キーもネットワークも不要で、web_search_cache.py のキャッシュ・
+# stale-while-revalidate・single-flight をオフラインで試すために使います。
+#
+#   - 同じ質問には毎回同じ結果（sha256 から作る決定論的な URL・本文）を返す
+#   - latency 秒だけ応答を遅らせ、本物の API の往復時間を再現できる
+#   - fail=True の間は 500 を返し、検索サービスの障害を再現できる
+#   - requests に受け付けた検索の回数（＝課金される API 呼び出しの回数）を数える
+#
+# 単体起動:
+#   python fake_search_server.py --port 8766 --latency 0.5
+#   → FakeSearchRetriever(base_url="http://127.0.0.1:8766", k=3)
+# =============================================================================
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+def fake_results(query: str, max_results: int) -> list[dict]:
+    """質問の sha256 から作る、Tavily の results と同じ形の疑似検索結果"""
+    digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:12]
+    return [
+        {
+            "title": f"{query} - result {rank}",
+            "url": f"https://example.com/{digest}/{rank}",
+            "content": f"「{query}」についての検索結果 {rank} の本文です。",
+            "score": round(1.0 / rank, 4),
+        }
+        for rank in range(1, max_results + 1)
+    ]
+
+
+class FakeSearchServer(ThreadingHTTPServer):
+    """設定値とカウンタを持つ HTTP サーバ本体"""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], latency: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.fail = False  # True の間は 500 を返す
+        self.requests = 0  # 受け付けた検索の回数
+        self.queries: list[str] = []  # 受け付けた質問（順番どおり）
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeSearchServer
+
+    def log_message(self, format, *args) -> None:
+        pass  # アクセスログは出さない
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/search":
+            self._send_json(404, {"detail": {"error": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        query = payload["query"]
+        with self.server._lock:
+            self.server.requests += 1
+            self.server.queries.append(query)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.fail:
+            self._send_json(500, {"detail": {"error": "search service unavailable"}})
+            return
+        self._send_json(
+            200,
+            {
+                "query": query,
+                "results": fake_results(query, int(payload.get("max_results", 5))),
+                "images": [],
+            },
+        )
+
+
+class FakeSearchRetriever(BaseRetriever):
+    """偽検索サーバを呼ぶリトリーバ（TavilySearchAPIRetriever と同じ形の Document を返す）"""
+
+    base_url: str
+    k: int = 3
+    timeout: float = 10.0
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        request = urllib.request.Request(
+            f"{self.base_url}/search",
+            data=json.dumps({"query": query, "max_results": self.k}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            results = json.loads(response.read())["results"]
+        return [
+            Document(
+                page_content=result["content"],
+                metadata={
+                    "title": result["title"],
+                    "source": result["url"],
+                    "score": result["score"],
+                },
+            )
+            for result in results
+        ]
+
+
+def start_fake_search_server(port: int = 0, latency: float = 0.0) -> FakeSearchServer:
+    """別スレッドでサーバを起動して返す（port=0 なら空いているポートを使う）"""
+    server = FakeSearchServer(("127.0.0.1", port), latency=latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ローカル用の偽 Web 検索サーバ")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSearchServer(("127.0.0.1", args.port), latency=args.latency)
+    print(f"fake search server: {server.base_url}")
+    server.serve_forever()
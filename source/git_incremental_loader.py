@@ -0,0 +1,285 @@
+# =============================================================================
+# 【概要】
+# GitLoader の「差分読み込み」版です。
+# 通常の GitLoader(...).load() は起動のたびにリポジトリ内の全 .mdx を読み直すため、
+# LangChain 公式リポジトリのように数千ファイルある場合は起動に数分かかります。
+#
+# このモジュールでは――
+#   1. HEAD コミットのツリーから各ファイルの「blob SHA」を取得（中身は読まない）
+#   2. 前回実行時に保存したマニフェスト（パス → blob SHA）と比較
+#   3. 追加・変更・削除されたパスを一覧化（中身は後段が必要になった時点で 1 件ずつ読む）
+# することで、`git pull` 後に少しだけ変わったファイルだけを
+# 再分割・再埋め込みできるようにします。
+# 読み込む中身は常に HEAD のコミットのもの（blob SHA と一致するもの）で、
+# 作業ツリーの未コミットの編集は、コミットされた時点で「変更」として取り込まれます。
+#
+# 使い方:
+#   loader = IncrementalGitLoader(repo_path="./langchain", ...)
+#   delta = loader.load_delta()        # 差分（パスだけ）を取得
+#   ...（delta.stale_sources を削除し、loader.iter_upserts(delta) を分割・埋め込み）...
+#   loader.save_manifest(delta, committed)   # 登録し終えたファイルだけを確定
+# =============================================================================
+
+import functools
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+# マニフェストの既定保存先（カレントフォルダ直下の .rag_cache/）
+DEFAULT_MANIFEST_PATH = os.path.join(".rag_cache", "git_manifest.json")
+MANIFEST_VERSION = 1  # 形式を変えたら上げる（古いマニフェストは捨てて全件読み込み）
+# 登録が終わらなかったファイルの blob SHA の代わりに書く値。
+# どの SHA とも一致しないので、次回は「変更」として古いチャンクを消してから登録し直す
+PENDING_SHA = ""
+IGNORE_CHECK_BATCH = 1000  # check-ignore 1 回に渡すパス数（コマンド長の上限対策）
+
+
+@dataclass
+class IngestDelta:
+    """前回実行からの差分（追加／変更／削除）をまとめた入れ物"""
+
+    commit: str  # 今回読み込んだ HEAD コミットの SHA
+    added: list[str] = field(default_factory=list)  # 新規ファイルのパス
+    modified: list[str] = field(default_factory=list)  # 中身が変わったファイルのパス
+    deleted: list[str] = field(default_factory=list)  # 消えたファイルのパス
+    unchanged: list[str] = field(default_factory=list)  # 変化なしのパス
+    files: dict[str, str] = field(default_factory=dict)  # 今回のパス → blob SHA
+    # iter_upserts() で読んだがバイナリ等で登録対象外だったパス（登録済み扱い）
+    skipped: list[str] = field(default_factory=list)
+
+    @property
+    def upsert_paths(self) -> list[str]:
+        """分割・埋め込みし直す必要があるパス（追加＋変更）"""
+        return self.added + self.modified
+
+    @property
+    def stale_sources(self) -> list[str]:
+        """古いチャンクを削除すべき source パス（変更＋削除）"""
+        return self.modified + self.deleted
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.modified or self.deleted)
+
+    def reingest(self, paths: Iterable[str]) -> None:
+        """変化なしのパスのうち paths に含まれるものを「変更」に移し、読み直させる"""
+        paths = set(paths)
+        self.modified.extend(path for path in self.unchanged if path in paths)
+        self.unchanged = [path for path in self.unchanged if path not in paths]
+
+
+def git_blob_sha(content: bytes) -> str:
+    """`git hash-object` と同じ blob SHA（"blob <サイズ>\\0" + 中身 の sha1）"""
+    header = f"blob {len(content)}\0".encode("ascii")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _open_odb_repo(repo_path: str):
+    from git import Repo  # GitPython（GitLoader と同じ依存）
+
+    return Repo(repo_path)
+
+
+def read_blob(repo_path: str, blob_sha: str) -> bytes:
+    """コミット済みの中身（blob）をオブジェクトデータベースから読む"""
+    return _open_odb_repo(repo_path).odb.stream(bytes.fromhex(blob_sha)).read()
+
+
+def read_document(repo_path: str, path: str, blob_sha: str) -> Optional[Document]:
+    """
+    リポジトリ内の 1 ファイルを GitLoader と同じ形の Document にする。
+    中身は blob_sha のもの（HEAD のツリーの内容）を返す。作業ツリーのファイルが
+    未コミットの編集などで blob_sha と一致しない場合は、blob を Git から直接読む
+    （SHA と中身がずれたまま登録すると、その編集が変更として検出されなくなるため）。
+    """
+    file_path = os.path.join(repo_path, path)
+    try:
+        with open(file_path, "rb") as f:
+            content = f.read()
+    except OSError:
+        content = None  # 作業ツリーから消えていても、コミット済みの中身は読める
+    if content is None or git_blob_sha(content) != blob_sha:
+        try:
+            content = read_blob(repo_path, blob_sha)
+        except Exception as e:
+            print(f"Error reading blob {blob_sha} ({file_path}): {e}")
+            return None
+    try:
+        text_content = content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None  # バイナリファイルは GitLoader と同じくスキップ
+
+    metadata = {  # GitLoader と同じキー + blob_sha
+        "source": path,
+        "file_path": path,
+        "file_name": os.path.basename(path),
+        "file_type": os.path.splitext(path)[1],
+        "blob_sha": blob_sha,
+    }
+    return Document(page_content=text_content, metadata=metadata)
+
+
+class IncrementalGitLoader(BaseLoader):
+    """blob SHA をキーに、変化したファイルだけを読み込む GitLoader"""
+
+    def __init__(
+        self,
+        repo_path: str,
+        clone_url: Optional[str] = None,
+        branch: Optional[str] = "main",
+        file_filter: Optional[Callable[[str], bool]] = None,
+        manifest_path: str = DEFAULT_MANIFEST_PATH,
+    ):
+        self.repo_path = repo_path
+        self.clone_url = clone_url
+        self.branch = branch
+        self.file_filter = file_filter
+        self.manifest_path = manifest_path
+
+    # ---------- リポジトリを開く（無ければクローン） ----------
+    def _open_repo(self):
+        from git import Repo  # GitPython（GitLoader と同じ依存）
+
+        if not os.path.exists(self.repo_path) and self.clone_url is None:
+            raise ValueError(f"Path {self.repo_path} not found")
+
+        if self.clone_url:
+            if os.path.isdir(os.path.join(self.repo_path, ".git")):
+                repo = Repo(self.repo_path)
+                if repo.remotes.origin.url != self.clone_url:
+                    raise ValueError(
+                        "A different repository is already cloned at this path."
+                    )
+            else:
+                repo = Repo.clone_from(self.clone_url, self.repo_path)
+        else:
+            repo = Repo(self.repo_path)
+        repo.git.checkout(self.branch)
+        return repo
+
+    # ---------- HEAD のツリーを走査して「パス → blob SHA」を作る ----------
+    def scan(self, repo=None) -> tuple[str, dict[str, str]]:
+        """ファイルの中身は読まずに、対象ファイルの blob SHA だけを集める"""
+        from git import Blob
+
+        repo = repo or self._open_repo()
+        commit = repo.head.commit
+        files = {}
+        for item in commit.tree.traverse():
+            if not isinstance(item, Blob):
+                continue
+            file_path = os.path.join(self.repo_path, item.path)
+            if self.file_filter and not self.file_filter(file_path):
+                continue
+            files[item.path] = item.hexsha  # blob SHA ＝ 中身のハッシュ
+
+        # GitLoader は 1 ファイルごとに `git check-ignore` を呼ぶので遅い。
+        # ここでは IGNORE_CHECK_BATCH 件ずつまとめて問い合わせる。
+        paths = [os.path.join(self.repo_path, p) for p in files]
+        for start in range(0, len(paths), IGNORE_CHECK_BATCH):
+            batch = paths[start : start + IGNORE_CHECK_BATCH]
+            for ignored_path in repo.ignored(*batch):
+                files.pop(os.path.relpath(ignored_path, self.repo_path), None)
+        return commit.hexsha, files
+
+    # ---------- 1 ファイルを Document 化 ----------
+    def _read_document(self, path: str, blob_sha: str) -> Optional[Document]:
+        return read_document(self.repo_path, path, blob_sha)
+
+    # ---------- マニフェストの読み書き ----------
+    def read_manifest(self) -> dict[str, str]:
+        """前回のパス → blob SHA を返す（無い・形式違いなら空）"""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        if manifest.get("repo_path") != os.path.abspath(self.repo_path):
+            return {}
+        return manifest.get("files", {})
+
+    @staticmethod
+    def manifest_files(
+        delta: IngestDelta, committed: Optional[Iterable[str]] = None
+    ) -> dict[str, str]:
+        """
+        save_manifest() が書くパス → blob SHA。
+        committed を渡すと、追加・変更のうち committed（と skipped）に無いパスは
+        PENDING_SHA にする（途中で失敗した場合用）。
+        """
+        if committed is None:
+            return delta.files
+        done = set(committed) | set(delta.skipped)
+        files = dict(delta.files)
+        for path in delta.upsert_paths:
+            if path not in done:
+                files[path] = PENDING_SHA
+        return files
+
+    def save_manifest(
+        self, delta: IngestDelta, committed: Optional[Iterable[str]] = None
+    ) -> None:
+        """
+        後段（分割・埋め込み・登録）の後に呼んで差分を確定する。
+        committed を渡すと、登録し終えていないパスは PENDING_SHA で記録し、
+        次回もう一度読み直させる（manifest_files() を参照）。
+        """
+        files = self.manifest_files(delta, committed)
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "repo_path": os.path.abspath(self.repo_path),
+            "branch": self.branch,
+            "commit": delta.commit,
+            "files": files,
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)  # 途中で落ちても壊れないように置換
+
+    # ---------- 差分の取得 ----------
+    def load_delta(self) -> IngestDelta:
+        """前回のマニフェストと比べて、追加・変更・削除のパスを返す（中身は読まない）"""
+        commit, files = self.scan()
+        previous = self.read_manifest()
+
+        delta = IngestDelta(commit=commit, files=files)
+        for path, blob_sha in files.items():
+            old_sha = previous.get(path)
+            if old_sha == blob_sha:
+                delta.unchanged.append(path)
+            elif old_sha is None:
+                delta.added.append(path)
+            else:
+                delta.modified.append(path)
+        delta.deleted.extend(path for path in previous if path not in files)
+        return delta
+
+    def iter_upserts(self, delta: IngestDelta) -> Iterator[Document]:
+        """
+        追加・変更されたファイルを 1 件ずつ読んで返す（全件をメモリに持たない）。
+        バイナリ等は delta.skipped に記録して飛ばす（SHA だけ確定し、次回は読み直さない）。
+        """
+        for path in delta.upsert_paths:
+            doc = self._read_document(path, delta.files[path])
+            if doc is None:
+                delta.skipped.append(path)
+                continue
+            yield doc
+
+    # ---------- 全件読み込み（BaseLoader 互換） ----------
+    def lazy_load(self) -> Iterator[Document]:
+        """全ファイルを Document として順に返す（ignore 判定は一括）"""
+        _, files = self.scan()
+        for path, blob_sha in files.items():
+            doc = self._read_document(path, blob_sha)
+            if doc is not None:
+                yield doc
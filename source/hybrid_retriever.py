@@ -0,0 +1,181 @@
+# =============================================================================
+# 【概要】
+# 複数の検索（Chroma・BM25 など）を並列に走らせ、締め切りまでに
+# 返ってきた結果だけを統合するハイブリッドリトリーバです。
+#
+# section6_5_2.py の hybrid_retriever は RunnableParallel で両方の検索を待つため、
+# どちらか一方が遅い（埋め込み API が詰まっている など）と、
+# リクエスト全体がいちばん遅い検索に引きずられます。
+#
+# DeadlineHybridRetriever は――
+#   1. 各検索（leg）を共有のスレッドプールで同時に開始する
+#   2. leg ごとの締め切り（timeouts、開始からの秒数）までに終わった結果だけを集める
+#      （締め切りを過ぎた leg の結果は捨てる。失敗した leg も同様に飛ばす）
+#   3. 集まった結果を reciprocal_rank_fusion で統合する
+#   4. どの leg が間に合わなかったか・失敗したかを数える（直近 max_records 件は records に残す）
+# を行い、待ち時間の上限を「いちばん長い締め切り」に抑えます。
+# 使い終わったら close() でスレッドプールを閉じてください。
+# =============================================================================
+
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from rank_fusion import DEFAULT_RRF_K, reciprocal_rank_fusion
+
+DEFAULT_TIMEOUT = 2.0  # timeouts に無い leg の締め切り（秒）
+CHROMA_TIMEOUT = 3.0  # ベクトル検索の締め切り（埋め込み API を待つので長め）
+BM25_TIMEOUT = 0.5  # BM25 の締め切り（ローカルで完結するので短め）
+DEFAULT_MAX_RECORDS = 1000  # records に残す直近の記録の数
+
+
+@dataclass
+class HybridRetrievalRecord:
+    """1 回の検索で、各 leg がどうなったかの記録"""
+
+    question: str
+    elapsed: float  # この検索全体にかかった秒数
+    # 間に合った leg → 秒数、間に合わなかった leg、例外を出した leg → 例外の内容
+    latencies: dict[str, float] = field(default_factory=dict)
+    timed_out: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+
+
+class DeadlineHybridRetriever(BaseRetriever):
+    """leg ごとの締め切りまでに届いた検索結果だけを RRF で統合する"""
+
+    legs: dict[str, Any]  # leg の名前 → Retriever（Runnable）
+    timeouts: dict[str, float] = {}  # leg の名前 → 締め切り（秒）
+    default_timeout: float = DEFAULT_TIMEOUT
+    rrf_k: int = DEFAULT_RRF_K
+    top_n: Optional[int] = None  # 統合後に残す件数（None なら全件）
+    verbose: bool = True  # 間に合わなかった leg を print する
+    executor: Any = None  # ThreadPoolExecutor（None なら leg の数 × 4 スレッドで作る）
+    max_records: int = DEFAULT_MAX_RECORDS
+    # 内部状態（_records の長さは model_post_init で max_records に合わせる）
+    _records: deque = PrivateAttr(default_factory=deque)  # 直近の HybridRetrievalRecord
+    # 起動からの累計（queries / timed_out / failed / elapsed）
+    _counts: dict = PrivateAttr(
+        default_factory=lambda: {
+            "queries": 0,
+            "timed_out": Counter(),
+            "failed": Counter(),
+            "total_elapsed": 0.0,
+            "max_elapsed": 0.0,
+        }
+    )
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.executor is None:
+            # with 文で閉じると遅い leg の終了まで待ってしまうので、プールは使い回す
+            self.executor = ThreadPoolExecutor(
+                max_workers=4 * len(self.legs), thread_name_prefix="hybrid-leg"
+            )
+        self._records = deque(maxlen=self.max_records)
+
+    @property
+    def records(self) -> list[HybridRetrievalRecord]:
+        """直近 max_records 件の記録（古い順）"""
+        with self._lock:
+            return list(self._records)
+
+    def _timeout(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        started = time.perf_counter()
+        record = HybridRetrievalRecord(question=query, elapsed=0.0)
+
+        # ① 全 leg を同時に開始
+        def run_leg(leg: Any) -> tuple[list[Document], float]:
+            leg_started = time.perf_counter()
+            documents = leg.invoke(query, config={"callbacks": run_manager.get_child()})
+            return documents, time.perf_counter() - leg_started
+
+        futures: dict[Future, str] = {
+            self.executor.submit(run_leg, leg): name for name, leg in self.legs.items()
+        }
+
+        # ② 締め切りの早い leg から順に、締め切りまでに終わったものだけを集める
+        results: dict[str, list[Document]] = {}
+        pending = set(futures)
+        while pending:
+            now = time.perf_counter() - started
+            for future in [f for f in pending if self._timeout(futures[f]) <= now]:
+                if not future.done():  # 締め切りちょうどに終わったものは拾う
+                    pending.discard(future)
+                    record.timed_out.append(futures[future])
+            if not pending:
+                break
+            next_deadline = min(self._timeout(futures[f]) for f in pending)
+            done, pending = wait(
+                pending, timeout=next_deadline - now, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                name = futures[future]
+                try:
+                    results[name], record.latencies[name] = future.result()
+                except Exception as e:  # 1 つの leg の失敗で全体を失敗させない
+                    record.failed[name] = repr(e)
+
+        # ③ 間に合った結果を leg の定義順に並べて統合
+        outputs = [results[name] for name in self.legs if name in results]
+        documents = reciprocal_rank_fusion(outputs, k=self.rrf_k) if outputs else []
+        if self.top_n is not None:
+            documents = documents[: self.top_n]
+
+        # ④ 記録
+        record.elapsed = time.perf_counter() - started
+        with self._lock:
+            self._records.append(record)
+            self._counts["queries"] += 1
+            self._counts["timed_out"].update(record.timed_out)
+            self._counts["failed"].update(record.failed)
+            self._counts["total_elapsed"] += record.elapsed
+            self._counts["max_elapsed"] = max(
+                self._counts["max_elapsed"], record.elapsed
+            )
+        if self.verbose and (record.timed_out or record.failed):
+            print(
+                f"[hybrid] timed out: {record.timed_out or '-'} "
+                f"failed: {list(record.failed) or '-'} "
+                f"{record.elapsed:.2f}s ({query[:40]})"
+            )
+        return documents
+
+    def stats(self) -> dict:
+        """
+        leg ごとの間に合わなかった回数・失敗回数と、全体の所要時間（累計）。
+        p99_elapsed だけは直近 max_records 件から計算する。
+        """
+        with self._lock:
+            counts = self._counts
+            queries = counts["queries"]
+            elapsed = sorted(record.elapsed for record in self._records)
+            return {
+                "queries": queries,
+                "timed_out": {name: counts["timed_out"][name] for name in self.legs},
+                "failed": {name: counts["failed"][name] for name in self.legs},
+                "p99_elapsed": (
+                    elapsed[min(len(elapsed) - 1, int(0.99 * len(elapsed)))]
+                    if elapsed
+                    else 0.0
+                ),
+                "max_elapsed": counts["max_elapsed"],
+                "mean_elapsed": counts["total_elapsed"] / queries if queries else 0.0,
+            }
+
+    def close(self) -> None:
+        """スレッドプールを閉じる（締め切りを過ぎて走り続けている leg は待たない）"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
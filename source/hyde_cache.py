@@ -0,0 +1,71 @@
+# =============================================================================
+# 【概要】
+# HyDE（仮想回答で検索する手法）の「仮想回答」と「その埋め込み」を
+# キャッシュするリトリーバです。
+#
+# section6_3_1.py の hyde_rag_chain は、呼び出しのたびに
+#   質問 → LLM で仮想回答を生成 → 仮想回答を埋め込み API へ → ベクトル検索
+# を行うため、同じ質問（表記ゆれ程度の違いも含む）でも毎回 LLM と埋め込み API を
+# 1 往復ずつ待つことになります。
+#
+# CachedHyDERetriever は――
+#   1. 質問を正規化（全角/半角・大文字小文字・空白・末尾の「？」などをそろえる）
+#   2. 正規化した質問をキーに、(仮想回答, 埋め込みベクトル) を TTLCache から引く
+#   3. ヒットすれば生成も埋め込みも飛ばし、ベクトルで直接 similarity search する
+# ことで、2 回目以降の同じ質問は検索 1 回分の時間で文脈を返します。
+# =============================================================================
+
+import re
+import unicodedata
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from ttl_cache import TTLCache
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# 日本語の前後の空白（「LangChain の」と「LangChainの」）は意味を変えないので消す
+_CJK_SPACE_RE = re.compile(r"(?<=[^\x00-\x7f]) | (?=[^\x00-\x7f])")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?？!！。．.、,]+$")
+
+
+def normalize_question(question: str) -> str:
+    """表記ゆれ（全角/半角・大文字小文字・空白・末尾の記号）をそろえたキャッシュキー"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    text = _CJK_SPACE_RE.sub("", text)
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+class CachedHyDERetriever(BaseRetriever):
+    """仮想回答とその埋め込みをキャッシュして検索する HyDE リトリーバ"""
+
+    hypothetical_chain: Any  # 質問 → 仮想回答（文字列）を返す Runnable
+    vectorstore: Any  # similarity_search_by_vector を持つベクトルストア（Chroma など）
+    cache: Any = None  # TTLCache（None なら既定の設定で作る）
+    search_kwargs: dict = {"k": 4}
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.cache is None:
+            self.cache = TTLCache(max_entries=256, ttl=3600.0)
+
+    def hypothetical_document(self, question: str) -> tuple[str, list[float]]:
+        """(仮想回答, 埋め込み) を返す。キャッシュに無ければ生成して埋め込む"""
+        key = normalize_question(question)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        hypothetical = self.hypothetical_chain.invoke(question)
+        vector = self.vectorstore.embeddings.embed_query(hypothetical)
+        self.cache.set(key, (hypothetical, vector))
+        return hypothetical, vector
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        _, vector = self.hypothetical_document(query)
+        return self.vectorstore.similarity_search_by_vector(
+            vector, **self.search_kwargs
+        )
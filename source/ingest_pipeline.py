@@ -0,0 +1,236 @@
+# =============================================================================
+# 【概要】
+# ローダ → スプリッタ → 埋め込み → ベクトルストア登録 を
+# 「1 件ずつ流れるパイプライン」としてつなぐモジュールです。
+#
+# section4_6_1.py のような書き方では
+#   raw_docs = loader.load()                          # コーパス全体（1 つ目のコピー）
+#   docs = text_splitter.split_documents(raw_docs)    # チャンク全体（2 つ目のコピー）
+#   Chroma.from_documents(docs, embeddings)           # ベクトル全体（3 つ目）
+# と、各段階で全件をメモリに持つうえ、全部終わるまで 1 件も検索できません。
+#
+# stream_ingest() は――
+#   1. ローダ（lazy_load() などのジェネレータ）を別スレッドで 1 件ずつ読み、
+#      その場で分割して上限付きキューへ流す（キューが満杯なら読み込みを待たせる）
+#      dedup を渡すと、ほぼ同じ内容のチャンクはここで捨てる（near_dedup.py）
+#   2. キューから取り出したチャンクをバッチ単位で埋め込む
+#   3. 埋め込み終わったバッチから順に Chroma へ upsert（すぐ検索可能になる）
+#   4. あるドキュメントのチャンクがすべて upsert されたら on_committed(source) を呼ぶ
+#      （途中で失敗しても、どのファイルまで登録できたかを呼び出し側が記録できる）
+# という流れで、メモリ使用量を「コーパス全体」ではなく「キュー＋バッチ分」に抑えます。
+# documents には IncrementalGitLoader.iter_upserts() や GitLoader.lazy_load() のような
+# 「1 件ずつ読むジェネレータ」を渡してください（リストを渡すとコーパス全体を持つことになる）。
+# =============================================================================
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import TextSplitter
+
+from embedding_pipeline import EmbeddingPipeline
+from near_dedup import NearDuplicateFilter
+
+DEFAULT_QUEUE_SIZE = 256  # スプリッタと埋め込みの間にためるチャンク数の上限
+DEFAULT_BATCH_SIZE = 64  # Embeddings を直接使うときの 1 バッチのチャンク数
+
+_DONE = object()  # キューの終わりを知らせる目印
+
+
+@dataclass
+class IngestStats:
+    """ストリーミング登録の計測結果"""
+
+    documents: int = 0  # 読み込んだ元ドキュメント数
+    chunks: int = 0  # 登録したチャンク数
+    duplicates: int = 0  # 重複として捨てたチャンク数
+    batches: int = 0  # upsert した回数
+    first_searchable: Optional[float] = None  # 最初のバッチが検索可能になるまでの秒数
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def __str__(self) -> str:
+        first = f"{self.first_searchable:.2f}s" if self.first_searchable else "-"
+        return (
+            f"{self.documents} documents -> {self.chunks} chunks "
+            f"({self.duplicates} duplicates skipped) in {self.batches} batches, "
+            f"{self.elapsed:.2f}s (first searchable: {first})"
+        )
+
+
+def chunk_ids(chunks: list[Document]) -> list[str]:
+    """source・blob SHA・ファイル内の通し番号から決まる安定したチャンク ID"""
+    ids = []
+    counters: dict[str, int] = {}
+    for chunk in chunks:
+        source = chunk.metadata["source"]
+        index = counters.get(source, 0)
+        counters[source] = index + 1
+        ids.append(f"{source}@{chunk.metadata.get('blob_sha', '')}#{index}")
+    return ids
+
+
+def _upsert(db: Chroma, chunks: list[Document], vectors: list[list[float]]) -> None:
+    """埋め込み済みのチャンクをそのまま登録（Chroma 側で埋め込み直さない）"""
+    # langchain_chroma の add_documents / add_texts はベクトルを受け取らず必ず
+    # embedding_function で埋め込み直すため、公開 API では埋め込み済みのベクトルを渡せない。
+    # そのため、ここ 1 か所だけ chromadb の Collection（db._collection）に直接書き込む。
+    db._collection.upsert(
+        ids=[chunk.id for chunk in chunks],
+        embeddings=vectors,
+        # ID をメタデータにも残す（検索結果の Document から ID を引けるように）
+        metadatas=[{**chunk.metadata, "chunk_id": chunk.id} for chunk in chunks],
+        documents=[chunk.page_content for chunk in chunks],
+    )
+
+
+async def _embed_in_batches(
+    embeddings: Embeddings, chunks: AsyncIterator[Document], batch_size: int
+) -> AsyncIterator[tuple[list[Document], list[list[float]]]]:
+    """EmbeddingPipeline を使わない場合：batch_size 件ずつ Embeddings に渡す"""
+    batch: list[Document] = []
+    async for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            texts = [doc.page_content for doc in batch]
+            yield batch, await asyncio.to_thread(embeddings.embed_documents, texts)
+            batch = []
+    if batch:
+        texts = [doc.page_content for doc in batch]
+        yield batch, await asyncio.to_thread(embeddings.embed_documents, texts)
+
+
+async def astream_ingest(
+    documents: Iterable[Document],
+    db: Chroma,
+    text_splitter: Optional[TextSplitter] = None,
+    pipeline: Optional[EmbeddingPipeline] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dedup: Optional[NearDuplicateFilter] = None,
+    on_committed: Optional[Callable[[str], None]] = None,
+) -> IngestStats:
+    """
+    documents を 1 件ずつ 分割 →（重複除去）→ 埋め込み → upsert する。
+    pipeline を渡さなければ db の埋め込みモデル（CachedEmbeddings なども可）を使う。
+    on_committed はドキュメントのチャンクがすべて登録されたときに source を渡して呼ばれる
+    （読み込みスレッドから呼ばれることもある）。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()  # 後段が失敗したとき読み込みスレッドを止める
+    stats = IngestStats()
+    pending: dict[str, int] = {}  # source → まだ登録されていないチャンク数
+    pending_lock = threading.Lock()
+
+    def committed(source: str, count: int) -> None:
+        """source のチャンクが count 件登録された（残りが 0 なら on_committed）"""
+        with pending_lock:
+            pending[source] -= count
+            done = pending[source] == 0
+            if done:
+                del pending[source]
+        if done and on_committed is not None:
+            on_committed(source)
+
+    # ---------- ① 読み込み＋分割（ファイル I/O はブロッキングなので別スレッド） ----------
+    def produce() -> None:
+        try:
+            for doc in documents:
+                if stop.is_set():
+                    return
+                chunks = (
+                    text_splitter.split_documents([doc]) if text_splitter else [doc]
+                )
+                # ID は重複除去の前に振る（残ったチャンクの ID が変わらないように）
+                source = doc.metadata["source"]
+                kept = []
+                for chunk, chunk_id in zip(chunks, chunk_ids(chunks)):
+                    # source / blob_sha を渡し、捨てたチャンクが何に依存するかを記録させる
+                    if dedup is not None and dedup.add(
+                        chunk.page_content,
+                        chunk_id=chunk_id,
+                        source=source,
+                        blob_sha=chunk.metadata.get("blob_sha", ""),
+                    ):
+                        stats.duplicates += 1
+                        continue
+                    chunk.id = chunk_id
+                    kept.append(chunk)
+                # 登録待ちの件数を先に数えておく（キューに入れた直後に登録されても数えられる）
+                with pending_lock:
+                    pending[source] = pending.get(source, 0) + len(kept) + 1
+                for chunk in kept:
+                    # キューが満杯ならここで待つ（＝読み込みが埋め込みを追い越さない）
+                    asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+                # 読み込み側の分の 1 を引く（全チャンクが登録済みならここで完了）
+                committed(source, 1)
+                stats.documents += 1
+        finally:
+            asyncio.run_coroutine_threadsafe(queue.put(_DONE), loop).result()
+
+    async def chunk_stream() -> AsyncIterator[Document]:
+        while (chunk := await queue.get()) is not _DONE:
+            yield chunk
+
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    try:
+        # ---------- ② 埋め込み ----------
+        if pipeline is not None:
+            embedded = pipeline.aembed(chunk_stream())
+        else:
+            embedded = _embed_in_batches(db.embeddings, chunk_stream(), batch_size)
+
+        # ---------- ③ 埋め込み終わったバッチから順に登録 ----------
+        async for chunks, vectors in embedded:
+            await asyncio.to_thread(_upsert, db, chunks, vectors)
+            for chunk in chunks:
+                committed(chunk.metadata["source"], 1)
+            stats.chunks += len(chunks)
+            stats.batches += 1
+            if stats.first_searchable is None:
+                stats.first_searchable = stats.elapsed
+        await producer  # 読み込み側の例外はここで表に出す
+    finally:
+        # 途中で失敗した場合も、満杯のキューで待っているスレッドを解放する
+        stop.set()
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+        stats.finished = time.perf_counter()
+    return stats
+
+
+def stream_ingest(
+    documents: Iterable[Document],
+    db: Chroma,
+    text_splitter: Optional[TextSplitter] = None,
+    pipeline: Optional[EmbeddingPipeline] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dedup: Optional[NearDuplicateFilter] = None,
+    on_committed: Optional[Callable[[str], None]] = None,
+) -> IngestStats:
+    """astream_ingest の同期版（スクリプトから使う用）"""
+    return asyncio.run(
+        astream_ingest(
+            documents,
+            db,
+            text_splitter,
+            pipeline,
+            queue_size,
+            batch_size,
+            dedup,
+            on_committed,
+        )
+    )
@@ -0,0 +1,219 @@
+# =============================================================================
+# 【概要】
+# ChatOpenAI などの LLM 呼び出しの結果をディスクに保存する「完全一致」キャッシュです。
+#
+# サンプルの多くは ChatOpenAI(model="gpt-4.1-nano", temperature=0) で、
+# 同じプロンプトには同じ答えを期待していますが、section5_1_1.py のように
+# 「カレー」を invoke した後にもう一度 batch するだけで同じプロンプトが再送されます。
+# 開発中の再実行や評価のやり直しでも、プロンプトが変わっていなければ
+# API を呼ぶ必要はありません。
+#
+# PersistentLLMCache は――
+#   1. キーを sha256(llm_string + プロンプト) にする
+#      （llm_string はモデル名・temperature などのパラメータ・stop を含む文字列、
+#        プロンプトはメッセージ列をシリアライズしたもの。どちらも LangChain が渡す）
+#   2. 結果（Generation のリスト）を langchain_core.load.dumps で JSON にして
+#      SQLite（.rag_cache/llm.sqlite3）に保存する
+#   3. WAL モード＋書き込みは BEGIN IMMEDIATE のトランザクションで行い、
+#      複数プロセスから同じファイルを共有できるようにする
+#   4. 合計サイズが max_bytes を超えたら、最後に使われたのが古いものから捨てる（LRU）
+#   5. 既定では temperature=0 の呼び出しだけを保存・再利用する
+#      （temperature>0 の呼び出しは毎回違う答えを期待しているので素通しする）
+# を行い、変わっていないプロンプトの API 呼び出しを 0 回にします。
+#
+# 使い方:
+#   from langchain_core.globals import set_llm_cache
+#   set_llm_cache(PersistentLLMCache())   # 以降の ChatOpenAI すべてに効く
+#   # または ChatOpenAI(model="gpt-4.1-nano", temperature=0, cache=PersistentLLMCache())
+#
+# ※ LangChain の仕様で、stream() はキャッシュを使わずに毎回 API を呼びます
+#    （invoke / batch はキャッシュを使います）。
+# =============================================================================
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+DEFAULT_CACHE_PATH = os.path.join(".rag_cache", "llm.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 保存する結果の合計サイズの上限
+EVICT_TO = 0.9  # 上限を超えたら、上限の 90% まで減らす（毎回の追い出しを避ける）
+
+# llm_string 中の temperature（ChatOpenAI の JSON 形式と、それ以外の repr 形式）
+_TEMPERATURE_RE = re.compile(
+    r"\"temperature\":\s*(-?[0-9.eE+-]+)|\('temperature',\s*(-?[0-9.eE+-]+)\)"
+)
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """(モデル・パラメータ, メッセージ列) のキャッシュキー"""
+    return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def is_deterministic(llm_string: str) -> bool:
+    """temperature=0 の呼び出しか（temperature が見つからなければ既定値＝非 0 とみなす）"""
+    match = _TEMPERATURE_RE.search(llm_string)
+    if match is None:
+        return False
+    try:
+        return float(match.group(1) or match.group(2)) == 0.0
+    except ValueError:
+        return False
+
+
+class PersistentLLMCache(BaseCache):
+    """sha256(llm_string + プロンプト) をキーに SQLite へ LLM の結果を保存するキャッシュ"""
+
+    def __init__(
+        self,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        only_deterministic: bool = True,
+    ):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.only_deterministic = only_deterministic
+        self.hits = 0  # キャッシュから返せた回数
+        self.misses = 0  # LLM を呼んだ回数
+        self.skipped = 0  # temperature>0 で素通しした回数
+        self.evictions = 0  # 上限超えで捨てた件数
+        self._lock = threading.Lock()  # 1 つの接続を複数スレッドで共有するため
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        # isolation_level=None: トランザクションは BEGIN IMMEDIATE で自分で張る
+        # timeout: 他プロセスが書き込み中なら最大 30 秒待つ
+        self._conn = sqlite3.connect(
+            cache_path, timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")  # 複数プロセスからの読み書き用
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key       TEXT PRIMARY KEY,
+                value     TEXT NOT NULL,
+                size      INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)"
+        )
+
+    def _cacheable(self, llm_string: str) -> bool:
+        return not self.only_deterministic or is_deterministic(llm_string)
+
+    # ---------- BaseCache インタフェース ----------
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if not self._cacheable(llm_string):
+            with self._lock:  # 複数スレッドから同時に呼ばれても数え漏らさない
+                self.skipped += 1
+            return None
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ?", [key]
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            # LRU 用に「最後に使った時刻」を更新（失敗しても結果は返せる）
+            try:
+                self._conn.execute(
+                    "UPDATE llm_cache SET last_used = ? WHERE key = ?",
+                    [time.time(), key],
+                )
+            except sqlite3.OperationalError:
+                pass
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # loads() の beta 警告を出さない
+                generations = [loads(item) for item in json.loads(row[0])]
+        except (ValueError, TypeError, KeyError):
+            generations = None  # 壊れた・読めない形式のエントリはミス扱い
+        with self._lock:
+            if generations is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if not self._cacheable(llm_string):
+            return
+        value = json.dumps([dumps(generation) for generation in return_val])
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return  # 1 件で上限を超えるものは保存しない
+
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # 他プロセスの書き込みと直列化
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, size, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    [key, value, size, time.time()],
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self) -> None:
+        """合計サイズが上限を超えていたら、古い順に上限の EVICT_TO 倍まで捨てる"""
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO
+        victims = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY last_used"
+        ):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self.evictions += len(victims)  # update() が self._lock を持って呼ぶ
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    # ---------- 統計 ----------
+    def stats(self) -> dict[str, float]:
+        """ヒット率・素通しした回数・保存件数・保存バイト数を返す"""
+        with self._lock:
+            count, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+            hits, misses = self.hits, self.misses
+            skipped, evictions = self.skipped, self.evictions
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "skipped": skipped,
+            "evictions": evictions,
+            "entries": count,
+            "bytes_stored": stored_bytes,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,260 @@
+# =============================================================================
+# 【概要】
+# Chroma を使わずに、NumPy だけでベクトル検索を行うローカルインデックスです。
+# オフライン環境やテストで、db.as_retriever() と同じ使い方ができる
+# Retriever を提供します。
+#
+#   - exact モード：全ベクトルとの内積を一括計算する総当たり検索（小規模向け・厳密）
+#   - ivf   モード：k-means でベクトルを n_lists 個の「リスト」に分け、質問に近い
+#                   nprobe 個のリストの中だけを探す近似検索（大規模向け・高速）
+#
+# 保存形式（ディレクトリ 1 つ）
+#   meta.json         : 件数・次元・モードなど
+#   vectors.f32       : 正規化済み float32 行列 (件数 × 次元) をそのまま並べたもの
+#   documents.docstore: document_store.py の形式（i 行目のベクトル ↔ i 番目の Document）
+#   ivf_*.npy         : IVF の重心・リストの並び・区切り位置（ivf モードのみ）
+# 読み込み時は行列を np.memmap で開くため、起動時にベクトル全体を RAM に読みません。
+# =============================================================================
+
+import json
+import os
+from collections.abc import Sequence
+from typing import Any, Optional
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from document_store import DocumentStore
+
+DEFAULT_INDEX_DIRECTORY = os.path.join(".rag_cache", "local_index")
+FORMAT_VERSION = 1
+IVF_MIN_VECTORS = 50_000  # mode="auto" のとき、これ以上の件数なら IVF を作る
+DEFAULT_NPROBE = 8  # IVF で探すリストの数（多いほど正確・遅い）
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 256  # k-means の学習に使う 1 リストあたりのサンプル数
+ASSIGN_BATCH_SIZE = 16_384  # リスト割り当て時に一度に内積を取る行数
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """行ごとに長さ 1 にそろえる（内積＝コサイン類似度にするため）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """scores の大きい順に k 個の位置を返す（全件ソートせず argpartition を使う）"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class LocalVectorIndex:
+    """正規化済み float32 行列と Document 列を持つ、インプロセスのベクトルインデックス"""
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        documents: Sequence[Document],
+        centroids: Optional[np.ndarray] = None,
+        list_order: Optional[np.ndarray] = None,
+        list_offsets: Optional[np.ndarray] = None,
+    ):
+        if len(vectors) != len(documents):
+            raise ValueError("vectors and documents must have the same length")
+        self.vectors = vectors
+        self.documents = documents
+        # IVF：list_order[list_offsets[c]:list_offsets[c+1]] がリスト c に属する行番号
+        self.centroids = centroids
+        self.list_order = list_order
+        self.list_offsets = list_offsets
+
+    @property
+    def mode(self) -> str:
+        return "exact" if self.centroids is None else "ivf"
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    # ---------- 構築 ----------
+    @classmethod
+    def build(
+        cls,
+        documents: Sequence[Document],
+        vectors: np.ndarray,
+        mode: str = "auto",
+        n_lists: Optional[int] = None,
+        random_state: int = 0,
+    ) -> "LocalVectorIndex":
+        """ベクトルを正規化してインデックスを作る（mode: exact / ivf / auto）"""
+        if mode not in ("auto", "exact", "ivf"):
+            raise ValueError(f"unknown mode: {mode}")
+        index = cls(_normalize(vectors), documents)
+        if mode == "ivf" or (mode == "auto" and len(index) >= IVF_MIN_VECTORS):
+            index.train_ivf(n_lists, random_state=random_state)
+        return index
+
+    @classmethod
+    def from_chroma(cls, db: Chroma, **kwargs: Any) -> "LocalVectorIndex":
+        """Chroma のコレクションから埋め込み済みベクトルと本文を取り出して作る"""
+        result = db.get(include=["embeddings", "documents", "metadatas"])
+        documents = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(result["documents"], result["metadatas"])
+        ]
+        return cls.build(documents, np.asarray(result["embeddings"]), **kwargs)
+
+    def train_ivf(self, n_lists: Optional[int] = None, random_state: int = 0) -> None:
+        """球面 k-means で重心を学習し、全ベクトルを最も近いリストへ割り当てる"""
+        n = len(self.vectors)
+        n_lists = min(n, n_lists or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(random_state)
+
+        # ① サンプルで k-means（内積が最大の重心へ割り当て → 平均して正規化）
+        sample_size = min(n, n_lists * KMEANS_SAMPLE_PER_LIST)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(n, sample_size, False))])
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            # リストごとの合計（割り当て順に並べ替えて区間ごとに足す）
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=n_lists)
+            filled = counts > 0  # 空のリストは元の重心のまま
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+            centroids[filled] = np.add.reduceat(sample[order], starts, axis=0)
+            centroids = _normalize(centroids)
+
+        # ② 全ベクトルを割り当て（メモリを抑えるため ASSIGN_BATCH_SIZE 行ずつ）
+        assignment = np.empty(n, dtype=np.int32)
+        for start in range(0, n, ASSIGN_BATCH_SIZE):
+            batch = np.asarray(self.vectors[start : start + ASSIGN_BATCH_SIZE])
+            assignment[start : start + len(batch)] = np.argmax(
+                batch @ centroids.T, axis=1
+            )
+
+        self.centroids = centroids
+        self.list_order = np.argsort(assignment, kind="stable").astype(np.int64)
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=self.list_offsets[1:])
+
+    # ---------- 検索 ----------
+    def search(
+        self, query_vector: np.ndarray, k: int = 4, nprobe: int = DEFAULT_NPROBE
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(類似度, 行番号) を類似度の高い順に最大 k 件返す"""
+        query = _normalize(query_vector).reshape(-1)
+        if self.centroids is None:
+            scores = self.vectors @ query
+            top = _top_k(scores, k)
+            return scores[top], top
+
+        # 質問に近い nprobe 個のリストに属する行だけを候補にする
+        lists = _top_k(self.centroids @ query, min(nprobe, len(self.centroids)))
+        candidates = np.concatenate(
+            [
+                self.list_order[self.list_offsets[c] : self.list_offsets[c + 1]]
+                for c in lists
+            ]
+        )
+        candidates.sort()  # memmap を前から順に読むため
+        scores = self.vectors[candidates] @ query
+        top = _top_k(scores, k)
+        return scores[top], candidates[top]
+
+    def similarity_search_with_score_by_vector(
+        self, query_vector: np.ndarray, k: int = 4, nprobe: int = DEFAULT_NPROBE
+    ) -> list[tuple[Document, float]]:
+        scores, ids = self.search(query_vector, k=k, nprobe=nprobe)
+        return [(self.documents[i], float(s)) for s, i in zip(scores, ids)]
+
+    def as_retriever(
+        self, embeddings: Embeddings, **kwargs: Any
+    ) -> "LocalVectorRetriever":
+        """db.as_retriever() と同じく search_kwargs={"k": 4} などを受け取る"""
+        return LocalVectorRetriever(index=self, embeddings=embeddings, **kwargs)
+
+    # ---------- 保存・読み込み ----------
+    def save(self, directory: str = DEFAULT_INDEX_DIRECTORY) -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.ascontiguousarray(self.vectors, dtype=np.float32).tofile(
+            os.path.join(directory, "vectors.f32")
+        )
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "count": len(self.vectors),
+            "dimensions": int(self.vectors.shape[1]) if len(self.vectors) else 0,
+            "mode": self.mode,
+        }
+        DocumentStore.write(
+            os.path.join(directory, "documents.docstore"), self.documents, meta
+        )
+        if self.centroids is not None:
+            np.save(os.path.join(directory, "ivf_centroids.npy"), self.centroids)
+            np.save(os.path.join(directory, "ivf_order.npy"), self.list_order)
+            np.save(os.path.join(directory, "ivf_offsets.npy"), self.list_offsets)
+        # meta.json は最後に書く（途中で落ちた保存は読み込み時に弾く）
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory: str = DEFAULT_INDEX_DIRECTORY) -> "LocalVectorIndex":
+        """行列・IVF の配列は mmap で開き、必要な部分だけ OS に読ませる"""
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{directory} was saved in an unsupported format")
+
+        vectors = np.memmap(
+            os.path.join(directory, "vectors.f32"),
+            dtype=np.float32,
+            mode="r",
+            shape=(meta["count"], meta["dimensions"]),
+        )
+        documents = DocumentStore(os.path.join(directory, "documents.docstore"))
+        ivf = {}
+        if meta["mode"] == "ivf":
+            for name in ("centroids", "order", "offsets"):
+                path = os.path.join(directory, f"ivf_{name}.npy")
+                ivf[name] = np.load(path, mmap_mode="r")
+        return cls(
+            vectors,
+            documents,
+            centroids=ivf.get("centroids"),
+            list_order=ivf.get("order"),
+            list_offsets=ivf.get("offsets"),
+        )
+
+    # ---------- 後片付け ----------
+    def close(self) -> None:
+        """mmap を手放す（Windows では開いたままのファイルを削除できないため）"""
+        if isinstance(self.documents, DocumentStore):
+            self.documents.close()
+        self.vectors = self.centroids = self.list_order = self.list_offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class LocalVectorRetriever(BaseRetriever):
+    """LocalVectorIndex を LangChain の Retriever として使うためのラッパー"""
+
+    index: Any  # LocalVectorIndex（pydantic の型検査を避けるため Any）
+    embeddings: Embeddings
+    search_kwargs: dict = {"k": 4}
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        query_vector = np.asarray(self.embeddings.embed_query(query))
+        results = self.index.similarity_search_with_score_by_vector(
+            query_vector, **self.search_kwargs
+        )
+        return [doc for doc, _ in results]
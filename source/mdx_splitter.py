@@ -0,0 +1,292 @@
+# =============================================================================
+# 【概要】
+# .mdx（Markdown + JSX）の構造を理解し、トークン数で大きさを決める
+# テキストスプリッタです。
+#
+# section4_6_1.py の CharacterTextSplitter(chunk_size=1000, chunk_overlap=0) は
+#   - 見出し・コードブロック・JSX の途中でも文字数だけで切ってしまう
+#   - 「1,000 文字」がモデルにとって何トークンかは文章次第（日本語と英語で大違い）
+# という問題がありました。
+#
+# MdxTextSplitter は――
+#   1. 本文を「ブロック」（frontmatter / 見出し / コードフェンス / JSX / 段落）に分解
+#   2. コードフェンスと JSX ブロックは途中で切らない（大きすぎる場合だけ行単位で分け、
+#      コードフェンスは各チャンクで ``` を閉じ直す）
+#   3. 見出しの手前で必ずチャンクを区切り、見出しの階層を metadata["headings"] に記録
+#   4. 大きさは tiktoken のトークン数で測り、chunk_size トークン以内に詰める
+#      （ブロック単位で詰めるため chunk_overlap は 0 のみ対応）
+# ことで、埋め込み・プロンプトの予算にぴったり収まるチャンクを作ります。
+# =============================================================================
+
+import re
+from typing import Any, Iterable, Optional
+
+import tiktoken
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+# 閉じタグを持たない HTML 要素（JSX ブロックの入れ子計算から除外する）
+_VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "source", "col", "wbr"}
+_TAG_RE = re.compile(r"<(/?)([A-Za-z][\w.]*)\b[^<>]*?(/?)>", re.S)
+_TAG_START_RE = re.compile(r"<(/?[A-Za-z]|>)")  # 「<100ms」のような本文と区別する
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})")
+_SENTENCE_RE = re.compile(r"(?<=[。．！？.!?])\s*")
+
+
+class _Block:
+    """分解したブロック 1 つ分（kind: frontmatter / heading / code / jsx / text）"""
+
+    __slots__ = ("kind", "text", "level")
+
+    def __init__(self, kind: str, text: str, level: int = 0):
+        self.kind = kind
+        self.text = text
+        self.level = level  # 見出しレベル（heading のときだけ）
+
+
+def _jsx_end(lines: list[str], start: int) -> Optional[int]:
+    """
+    lines[start] から始まる JSX の、タグの入れ子が閉じた次の行番号（閉じなければ None）。
+    1 行ずつ読みながら「開きタグ数 − 閉じタグ数」を数える（読んだ行は読み直さない）。
+    複数行にまたがるタグ（<Tabs\n  groupId="x">）は、閉じる > が来るまで持ち越す。
+    """
+    balance, seen = 0, False
+    carry = ""  # まだ > が来ていないタグの書きかけ
+    for j in range(start, len(lines)):
+        if not lines[j].strip() and not seen:
+            return None  # 空行までにタグが 1 つも開いていない：JSX ブロックではない
+        text = carry + lines[j] + "\n"
+        last = 0
+        for match in _TAG_RE.finditer(text):
+            closing, tag, self_closing = match.groups()
+            last = match.end()
+            if tag.lower() in _VOID_TAGS:
+                continue
+            seen = True
+            if closing:
+                balance -= 1
+            elif not self_closing:
+                balance += 1
+        if seen and balance <= 0:
+            return j + 1
+        rest = text[last:]
+        opening = rest.rfind("<")
+        carry = rest[opening:] if opening >= 0 and ">" not in rest[opening:] else ""
+    return None
+
+
+def parse_mdx_blocks(text: str) -> list[_Block]:
+    """MDX 本文をブロックの列に分解する"""
+    lines = text.split("\n")
+    blocks: list[_Block] = []
+    i, n = 0, len(lines)
+
+    # ---------- frontmatter（先頭の --- ～ ---） ----------
+    if lines and lines[0].strip() == "---":
+        for j in range(1, n):
+            if lines[j].strip() == "---":
+                blocks.append(_Block("frontmatter", "\n".join(lines[: j + 1])))
+                i = j + 1
+                break
+
+    def paragraph_end(start: int) -> int:
+        """空行・見出し・フェンス・JSX の手前までを段落とみなす"""
+        j = start + 1
+        starts_with_tag = lines[start].lstrip().startswith("<")
+        while j < n and lines[j].strip():
+            if _HEADING_RE.match(lines[j]) or _FENCE_RE.match(lines[j]):
+                break
+            if lines[j].lstrip().startswith("<") and not starts_with_tag:
+                break
+            j += 1
+        return j
+
+    while i < n:
+        line = lines[i]
+        stripped = line.lstrip()
+
+        if not stripped:  # 空行はブロックの区切り
+            i += 1
+            continue
+
+        # ---------- コードフェンス（閉じフェンスまで丸ごと 1 ブロック） ----------
+        fence = _FENCE_RE.match(line)
+        if fence:
+            marker = fence.group(1)
+            j = i + 1
+            while j < n and not lines[j].lstrip().startswith(marker):
+                j += 1
+            blocks.append(_Block("code", "\n".join(lines[i : j + 1])))
+            i = j + 1
+            continue
+
+        # ---------- 見出し ----------
+        heading = _HEADING_RE.match(line)
+        if heading:
+            blocks.append(_Block("heading", line, level=len(heading.group(1))))
+            i += 1
+            continue
+
+        # ---------- import / export 文（MDX 冒頭に多い） ----------
+        if stripped.startswith(("import ", "export ")):
+            j = paragraph_end(i)
+            blocks.append(_Block("jsx", "\n".join(lines[i:j])))
+            i = j
+            continue
+
+        # ---------- JSX ブロック（タグの入れ子が閉じるまで） ----------
+        if _TAG_START_RE.match(stripped):
+            end = _jsx_end(lines, i)
+            if end is None:  # 閉じタグが見つからない場合は段落として扱う
+                end = paragraph_end(i)
+            blocks.append(_Block("jsx", "\n".join(lines[i:end])))
+            i = end
+            continue
+
+        # ---------- 通常の段落 ----------
+        j = paragraph_end(i)
+        blocks.append(_Block("text", "\n".join(lines[i:j])))
+        i = j
+
+    return blocks
+
+
+class MdxTextSplitter(TextSplitter):
+    """MDX の構造（見出し・コードフェンス・JSX）を保ちつつ、トークン数で分割する"""
+
+    def __init__(
+        self,
+        chunk_size: int = 512,
+        model_name: str = "text-embedding-3-small",
+        **kwargs: Any,
+    ):
+        encoding = tiktoken.encoding_for_model(model_name)  # section2_5_3.py と同じ
+        # ブロック単位で詰めるため、チャンク同士の重なり（overlap）には対応していない
+        if kwargs.setdefault("chunk_overlap", 0):
+            raise ValueError("MdxTextSplitter does not support chunk_overlap")
+        super().__init__(
+            chunk_size=chunk_size,
+            length_function=lambda text: len(encoding.encode(text)),
+            **kwargs,
+        )
+        self._encoding = encoding
+
+    # ---------- 大きすぎるブロックを chunk_size 以内に分ける ----------
+    def _pack_units(self, units: Iterable[str], joiner: str, budget: int) -> list[str]:
+        """units を joiner でつなぎ、budget トークン以内の塊に詰める"""
+        pieces: list[str] = []
+        current: list[str] = []
+        for unit in units:
+            if self._length_function(unit) > budget:
+                # 1 行・1 文でも入り切らない場合はトークン列で機械的に切る
+                if current:
+                    pieces.append(joiner.join(current))
+                    current = []
+                tokens = self._encoding.encode(unit)
+                for start in range(0, len(tokens), budget):
+                    pieces.append(self._encoding.decode(tokens[start : start + budget]))
+                continue
+            candidate = joiner.join(current + [unit])
+            if current and self._length_function(candidate) > budget:
+                pieces.append(joiner.join(current))
+                current = [unit]
+            else:
+                current.append(unit)
+        if current:
+            pieces.append(joiner.join(current))
+        return pieces
+
+    def _split_block(self, block: _Block) -> list[str]:
+        if self._length_function(block.text) <= self._chunk_size:
+            return [block.text]
+
+        if block.kind == "code":
+            # 各チャンクがそれだけで正しいコードブロックになるよう ``` を付け直す
+            lines = block.text.split("\n")
+            opening = lines[0]
+            marker = _FENCE_RE.match(opening).group(1)
+            has_closing = len(lines) > 1 and lines[-1].lstrip().startswith(marker)
+            body = lines[1:-1] if has_closing else lines[1:]
+            overhead = self._length_function(f"{opening}\n\n{marker}")
+            budget = max(1, self._chunk_size - overhead)
+            return [
+                f"{opening}\n{piece}\n{marker}"
+                for piece in self._pack_units(body, "\n", budget)
+            ]
+
+        # 段落・JSX：まず行単位、それでも大きい行は文単位で詰める
+        units: list[str] = []
+        for line in block.text.split("\n"):
+            if self._length_function(line) > self._chunk_size:
+                units.extend(s for s in _SENTENCE_RE.split(line) if s)
+            else:
+                units.append(line)
+        return self._pack_units(units, "\n", self._chunk_size)
+
+    # ---------- 本体：ブロックをチャンクに詰める ----------
+    def split_text_with_headings(self, text: str) -> list[tuple[str, str]]:
+        """(チャンク本文, 見出しの階層 "A > B") のリストを返す"""
+        chunks: list[tuple[str, str]] = []
+        current: list[str] = []
+        current_tokens = 0
+        current_headings = ""
+        heading_only = False  # current が見出し行だけか
+        heading_stack: list[tuple[int, str]] = []
+        separator_tokens = self._length_function("\n\n")
+
+        def flush(last: bool = False) -> None:
+            nonlocal current, current_tokens, heading_only
+            # 見出し行だけのチャンクは作らない（階層は次のチャンクの headings に残る）。
+            # ただし文書末尾の見出しは続く本文が無いので、消えないようそのまま残す
+            if current and (not heading_only or last):
+                chunks.append(("\n\n".join(current), current_headings))
+            current, current_tokens, heading_only = [], 0, False
+
+        for block in parse_mdx_blocks(text):
+            if block.kind == "heading":
+                # 見出しの階層を更新（同じか浅いレベルの見出しは置き換える）
+                while heading_stack and heading_stack[-1][0] >= block.level:
+                    heading_stack.pop()
+                title = _HEADING_RE.match(block.text).group(2)
+                heading_stack.append((block.level, title))
+                # 見出しの手前では必ず区切る（短い節でも次の節と混ぜない）。
+                # 見出し行だけがたまっている場合（# A の直後の ## B）は同じチャンクに続ける
+                if current and not heading_only:
+                    flush()
+
+            for piece in self._split_block(block):
+                piece_tokens = self._length_function(piece)
+                if current and (
+                    current_tokens + separator_tokens + piece_tokens > self._chunk_size
+                ):
+                    flush()
+                if not current or heading_only:
+                    current_headings = " > ".join(t for _, t in heading_stack)
+                if not current:
+                    heading_only = block.kind == "heading"
+                elif block.kind != "heading":
+                    heading_only = False
+                current.append(piece)
+                if current_tokens:
+                    current_tokens += separator_tokens
+                current_tokens += piece_tokens
+        flush(last=True)
+        return chunks
+
+    def split_text(self, text: str) -> list[str]:
+        return [chunk for chunk, _ in self.split_text_with_headings(text)]
+
+    def create_documents(
+        self, texts: list[str], metadatas: Optional[list[dict]] = None
+    ) -> list[Document]:
+        """チャンクごとに metadata["headings"] を付けた Document を作る"""
+        _metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, _metadatas):
+            for chunk, headings in self.split_text_with_headings(text):
+                chunk_metadata = dict(metadata)
+                if headings:
+                    chunk_metadata["headings"] = headings  # Chroma 用に文字列で保持
+                documents.append(Document(page_content=chunk, metadata=chunk_metadata))
+        return documents
@@ -0,0 +1,108 @@
+# =============================================================================
+# 【概要】
+# LLM が生成した複数の検索クエリを「まとめて」検索するリトリーバです。
+#
+# section6_3_2.py の `query_generation_chain | retriever.map()` は
+#   クエリ 1 → 埋め込み API → ベクトル検索
+#   クエリ 2 → 埋め込み API → ベクトル検索
+#   ...
+# とクエリごとに往復するため、検索の待ち時間がクエリ数に比例して増えます。
+#
+# MultiQueryVectorRetriever は――
+#   1. 全クエリを embed_query() でスレッドから同時に埋め込む
+#   2. Chroma の query() に全クエリのベクトルを一度に渡し、1 回で全件を検索する
+#      （Chroma 以外のベクトルストアはスレッドで並列に検索）
+#   3. 複数のクエリでヒットした同じチャンクは 1 つの Document にまとめる
+# ことで、クエリが 3 個でも 1 クエリとほぼ同じ時間で検索を終えます。
+# =============================================================================
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from rank_fusion import chunk_key
+
+DEFAULT_K = 4  # db.as_retriever() の既定と同じ
+
+
+def interleave_unique(results: list[list[Document]]) -> list[Document]:
+    """各リストの 1 位 → 各リストの 2 位 … の順に、重複を除いて 1 列に並べる"""
+    merged: dict[str, Document] = {}
+    for rank in range(max((len(docs) for docs in results), default=0)):
+        for docs in results:
+            if rank < len(docs):
+                merged.setdefault(chunk_key(docs[rank]), docs[rank])
+    return list(merged.values())
+
+
+class MultiQueryVectorRetriever:
+    """複数クエリの埋め込みと検索を 1 回にまとめ、重複したヒットを統合する"""
+
+    def __init__(
+        self, vectorstore: VectorStore, k: int = DEFAULT_K, max_workers: int = 8
+    ):
+        self.vectorstore = vectorstore
+        self.k = k
+        self.max_workers = max_workers
+
+    # ---------- 1〜2. 同時に埋め込み → まとめて検索 ----------
+    def _query_chroma(self, vectors: list[list[float]]) -> list[list[Document]]:
+        """全クエリのベクトルを Chroma に 1 回で問い合わせる"""
+        # langchain_chroma の公開 API（similarity_search_by_vector など）は
+        # 1 回に 1 ベクトルしか受け取らないため、複数ベクトルを 1 回で検索できない。
+        # そのため、ここ 1 か所だけ chromadb の Collection（_collection）を直接使う。
+        result = self.vectorstore._collection.query(
+            query_embeddings=vectors,
+            n_results=self.k,
+            include=["documents", "metadatas"],
+        )
+        return [
+            [
+                Document(id=chunk_id, page_content=text, metadata=metadata or {})
+                for chunk_id, text, metadata in zip(ids, texts, metadatas)
+            ]
+            for ids, texts, metadatas in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        ]
+
+    def _search(self, queries: list[str]) -> list[list[Document]]:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # 検索クエリなので embed_documents ではなく embed_query で埋め込む
+            vectors = list(
+                executor.map(self.vectorstore.embeddings.embed_query, queries)
+            )
+            if isinstance(self.vectorstore, Chroma):
+                return self._query_chroma(vectors)
+            return list(
+                executor.map(
+                    lambda vector: self.vectorstore.similarity_search_by_vector(
+                        vector, k=self.k
+                    ),
+                    vectors,
+                )
+            )
+
+    # ---------- 3. 重複したヒットの統合 ----------
+    def retrieve_lists(self, queries: list[str]) -> list[list[Document]]:
+        """
+        クエリごとの検索結果を返す。複数のクエリに出てきたチャンクは
+        同じ Document オブジェクトを共有する（RRF などの前段に使う）。
+        """
+        if not queries:
+            return []
+        shared: dict[str, Document] = {}
+        return [
+            [shared.setdefault(chunk_key(doc), doc) for doc in docs]
+            for docs in self._search(queries)
+        ]
+
+    def retrieve(
+        self, queries: list[str], limit: Optional[int] = None
+    ) -> list[Document]:
+        """全クエリの結果を重複なしの 1 つのリストにする（interleave_unique の順）"""
+        documents = interleave_unique(self.retrieve_lists(queries))
+        return documents if limit is None else documents[:limit]
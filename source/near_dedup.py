@@ -0,0 +1,369 @@
+# =============================================================================
+# 【概要】
+# 分割後・埋め込み前のチャンクから「ほぼ同じ内容」のものを取り除く
+# MinHash + LSH（局所性鋭敏ハッシュ）による重複除去モジュールです。
+#
+# LangChain のドキュメントには、バージョン違いのコピーやインテグレーションの
+# 定型文など、ほとんど同じ .mdx が大量にあります。これらをすべて埋め込むと
+#   - 埋め込み API の料金とインデックスのサイズが無駄に増える
+#   - retriever.invoke() の上位 k 件が同じ内容で埋まってしまう
+# という問題が起きます。
+#
+# NearDuplicateFilter は――
+#   1. 本文を正規化（空白の圧縮・小文字化）し、文字 n-gram（shingle）の集合にする
+#   2. num_perm 個のハッシュ関数で MinHash シグネチャ（集合の要約）を作る
+#   3. シグネチャを bands 個の帯に分け、どれかの帯が一致したチャンクだけを候補にする
+#   4. 候補とのシグネチャ一致率（≒ Jaccard 類似度）が threshold 以上なら重複と判定
+# を行い、最初に現れたチャンクだけを残します。日本語にも効くよう単語ではなく
+# 文字 n-gram を使います。
+#
+# インデックスと一緒に使う場合（vector_index.open_persistent_index）は――
+#   5. 残したチャンクのシグネチャと LSH の帯のキーを save() でディスクに保存し、
+#      次回は load() で開くだけにする（毎回コレクション全体を MinHash し直さない）
+#   6. 捨てたチャンクごとに「どのファイルのどのチャンクを残したから捨てたか」を記録し、
+#      残した側のファイルが変更・削除されたら dependent_sources() で捨てた側の
+#      ファイルを割り出して読み直させる（元が消えて内容ごと失われるのを防ぐ）
+# ことで、差分の分だけで重複判定を続けられるようにします。
+#
+# 保存形式（directory/ 以下）
+#   meta.json               : 形式・設定（threshold など）・世代番号
+#   signatures_N.npy        : 残したチャンクのシグネチャ（uint32、行＝エントリ）
+#   band_keys_N.npy         : 帯ごとのキー（uint64）を昇順に並べたもの（二分探索で引く）
+#   band_order_N.npy        : band_keys の各要素が何行目のエントリか
+#   entries_N.json          : エントリ（チャンク ID・source・blob SHA）と捨てた記録
+# meta.json を最後に os.replace で書き換えるので、途中で落ちても前の状態で開けます。
+# エントリはマニフェストの blob SHA と一致するものだけを有効とみなすので、
+# 登録に失敗したファイルのチャンクが「残した」扱いのまま残ることもありません。
+# =============================================================================
+
+import glob
+import json
+import os
+import re
+import zlib
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+DEFAULT_THRESHOLD = 0.85  # これ以上似ていれば重複とみなす（Jaccard 類似度）
+DEFAULT_NUM_PERM = 128  # MinHash のハッシュ関数の数（多いほど正確・遅い）
+DEFAULT_SHINGLE_SIZE = 5  # 文字 n-gram の n
+FORMAT_VERSION = 1  # 保存形式を変えたら上げる（古い状態は使わない）
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_FNV_OFFSET = np.uint64(14695981039346656037)
+_FNV_PRIME = np.uint64(1099511628211)
+_WHITESPACE_RE = re.compile(r"\s+")
+# NumPy 2.0 で np.trapz は非推奨になり np.trapezoid に改名された（古い NumPy 用に残す）
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def _lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    """
+    帯の数 bands と 1 帯の行数 rows を決める。
+    候補漏れ（偽陰性）と余計な候補（偽陽性）の面積の加重和が最小になる組を選ぶ。
+    偽陽性はシグネチャの一致率で後から除けるので、偽陰性を重く見る。
+    """
+    below = np.linspace(0.0, threshold, 64)
+    above = np.linspace(threshold, 1.0, 64)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = _trapezoid(1 - (1 - below**rows) ** bands, below)
+            false_negative = _trapezoid((1 - above**rows) ** bands, above)
+            error = 0.3 * false_positive + 0.7 * false_negative
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateFilter:
+    """MinHash + LSH で、これまでに見たチャンクとほぼ同じものを検出する"""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        random_state: int = 1,
+    ):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.random_state = random_state
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+
+        # ハッシュ関数 h(x) = (a * x + b) mod p の係数（random_state で固定）
+        rng = np.random.RandomState(random_state)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        # load() した分（ディスク上の配列を mmap で開く。行番号 0 〜 _base_count-1）
+        self._base_count = 0
+        self._base_signatures: Optional[np.ndarray] = None
+        self._base_keys: Optional[np.ndarray] = None  # (bands, 件数) 昇順
+        self._base_order: Optional[np.ndarray] = None  # (bands, 件数)
+        # このプロセスで追加した分（行番号 _base_count 〜）
+        self._signatures: list[np.ndarray] = []
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(self.bands)]
+        # 全エントリ（行番号順）：(チャンク ID, source, blob SHA)
+        self._entries: list[tuple[Optional[str], Optional[str], str]] = []
+        self._dead: set[int] = set()  # remove_sources() で無効にした行番号
+        # 捨てたチャンクの記録：(捨てた側の source, その blob SHA, 残した側の source, 残したチャンク ID)
+        self._aliases: list[tuple[str, str, str, Optional[str]]] = []
+        self.seen = 0  # 判定したチャンク数
+        self.duplicates = 0  # 重複として除いたチャンク数
+
+    @property
+    def settings(self) -> dict:
+        """保存した状態を使い回してよいかの判定に使う設定"""
+        return {
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "shingle_size": self.shingle_size,
+            "random_state": self.random_state,
+        }
+
+    # ---------- 1〜2. 本文 → MinHash シグネチャ ----------
+    def signature(self, text: str) -> np.ndarray:
+        normalized = _WHITESPACE_RE.sub(" ", text).strip().lower()
+        n = self.shingle_size
+        shingles = {
+            normalized[i : i + n] for i in range(max(1, len(normalized) - n + 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        # (num_perm, shingle 数) の行列で一括計算し、行ごとの最小値を取る
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(件数, num_perm) のシグネチャ → (件数, bands) の帯のキー（帯の値の FNV-1a）"""
+        bands = signatures[:, : self.bands * self.rows].reshape(
+            len(signatures), self.bands, self.rows
+        )
+        keys = np.full((len(signatures), self.bands), _FNV_OFFSET, dtype=np.uint64)
+        for row in range(self.rows):
+            keys = (keys ^ bands[:, :, row].astype(np.uint64)) * _FNV_PRIME
+        return keys
+
+    def _signature_of(self, index: int) -> np.ndarray:
+        if index < self._base_count:
+            return self._base_signatures[index]
+        return self._signatures[index - self._base_count]
+
+    def _candidates(self, keys: np.ndarray) -> set[int]:
+        candidates = set()
+        for band, key in enumerate(keys.tolist()):
+            if self._base_count:
+                band_keys = self._base_keys[band]
+                lo = np.searchsorted(band_keys, key, side="left")
+                hi = np.searchsorted(band_keys, key, side="right")
+                candidates.update(self._base_order[band, lo:hi].tolist())
+            candidates.update(self._buckets[band].get(key, ()))
+        return candidates - self._dead
+
+    # ---------- 3〜4. 候補検索と判定 ----------
+    def add(
+        self,
+        text: str,
+        chunk_id: Optional[str] = None,
+        source: Optional[str] = None,
+        blob_sha: str = "",
+    ) -> bool:
+        """
+        text を登録する。既存のチャンクとほぼ同じなら登録せず True（重複）を返す。
+        source を渡すと、重複で捨てたときに「どのチャンクを残したから捨てたか」を記録する。
+        """
+        self.seen += 1
+        signature = self.signature(text)
+        keys = self._band_keys(signature[None, :])[0]
+
+        for index in self._candidates(keys):
+            similarity = np.mean(self._signature_of(index) == signature)
+            if similarity >= self.threshold:
+                self.duplicates += 1
+                if source is not None:
+                    kept_id, kept_source, _ = self._entries[index]
+                    self._aliases.append((source, blob_sha, kept_source, kept_id))
+                return True
+
+        self._insert(signature, keys, (chunk_id, source, blob_sha))
+        return False
+
+    def _insert(self, signature: np.ndarray, keys: np.ndarray, entry: tuple) -> None:
+        index = len(self._entries)
+        self._entries.append(entry)
+        self._signatures.append(signature)
+        for band, key in enumerate(keys.tolist()):
+            self._buckets[band].setdefault(key, []).append(index)
+
+    def seed_documents(self, documents: Iterable[Document]) -> None:
+        """
+        インデックス済みのチャンクを（重複判定せずに）登録する。
+        保存した状態が無いコレクションを初めて開いたときだけ使う。
+        """
+        for doc in documents:
+            signature = self.signature(doc.page_content)
+            keys = self._band_keys(signature[None, :])[0]
+            entry = (
+                doc.metadata.get("chunk_id") or doc.id,
+                doc.metadata.get("source"),
+                doc.metadata.get("blob_sha", ""),
+            )
+            self._insert(signature, keys, entry)
+
+    def filter_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """重複でない Document だけを順に返す（ストリームのまま使える）"""
+        for doc in documents:
+            if not self.add(doc.page_content):
+                yield doc
+
+    # ---------- 6. ファイルの変更・削除への追従 ----------
+    def dependent_sources(self, sources: Iterable[str]) -> set[str]:
+        """
+        sources のチャンクを残したために重複として捨てられたチャンクを持つファイル。
+        そのファイルのチャンクも捨てられていればさらにたどる（sources 自身は含めない）。
+        """
+        dropped_by: dict[str, set[str]] = {}
+        for dropped_source, _, kept_source, _ in self._aliases:
+            if dropped_source != kept_source:
+                dropped_by.setdefault(kept_source, set()).add(dropped_source)
+        visited = set(sources)
+        stack = list(visited)
+        dependents = set()
+        while stack:
+            for dropped_source in dropped_by.get(stack.pop(), ()):
+                if dropped_source not in visited:
+                    visited.add(dropped_source)
+                    dependents.add(dropped_source)
+                    stack.append(dropped_source)
+        return dependents
+
+    def remove_sources(self, sources: Iterable[str]) -> None:
+        """sources のエントリと、sources で捨てたチャンクの記録を無効にする"""
+        sources = set(sources)
+        if not sources:
+            return
+        for index, (_, source, _) in enumerate(self._entries):
+            if source in sources:
+                self._dead.add(index)
+        self._aliases = [a for a in self._aliases if a[0] not in sources]
+
+    def _retain(self, files: dict[str, str]) -> None:
+        """マニフェスト（パス → blob SHA）と一致しないエントリと記録を無効にする"""
+        for index, (_, source, blob_sha) in enumerate(self._entries):
+            if files.get(source) != blob_sha:
+                self._dead.add(index)
+        self._aliases = [a for a in self._aliases if files.get(a[0]) == a[1]]
+
+    # ---------- 5. 保存と読み込み ----------
+    def load(self, directory: str, files: dict[str, str]) -> bool:
+        """
+        save() した状態を開く（シグネチャと帯のキーは mmap で開くだけ）。
+        files（前回のマニフェスト）と blob SHA が一致するエントリだけを有効にする。
+        状態が無い・設定が違う場合は何もせず False を返す。
+        """
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION or meta["settings"] != self.settings:
+            return False
+
+        generation = meta["generation"]
+        with open(
+            os.path.join(directory, f"entries_{generation}.json"), encoding="utf-8"
+        ) as f:
+            stored = json.load(f)
+        self._entries = [tuple(entry) for entry in stored["entries"]]
+        self._aliases = [tuple(alias) for alias in stored["aliases"]]
+        self._base_count = len(self._entries)
+        if self._base_count:
+            self._base_signatures = np.load(
+                os.path.join(directory, f"signatures_{generation}.npy"), mmap_mode="r"
+            )
+            self._base_keys = np.load(
+                os.path.join(directory, f"band_keys_{generation}.npy"), mmap_mode="r"
+            )
+            self._base_order = np.load(
+                os.path.join(directory, f"band_order_{generation}.npy"), mmap_mode="r"
+            )
+        self._signatures = []
+        self._buckets = [{} for _ in range(self.bands)]
+        self._dead = set()
+        self._retain(files)
+        return True
+
+    def save(self, directory: str, files: dict[str, str]) -> None:
+        """
+        files（これから保存するマニフェスト）と blob SHA が一致するエントリだけを保存する。
+        帯のキーは帯ごとに昇順に並べ替えて保存し、次回は二分探索で候補を引く。
+        """
+        self._retain(files)
+        alive = [i for i in range(len(self._entries)) if i not in self._dead]
+        signatures = np.array(
+            [self._signature_of(i) for i in alive], dtype=np.uint32
+        ).reshape(len(alive), self.num_perm)
+        keys = self._band_keys(signatures).T  # (bands, 件数)
+        order = np.argsort(keys, axis=1, kind="stable")
+        sorted_keys = np.take_along_axis(keys, order, axis=1)
+
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        generation = 0
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                generation = json.load(f).get("generation", -1) + 1
+
+        np.save(os.path.join(directory, f"signatures_{generation}.npy"), signatures)
+        np.save(os.path.join(directory, f"band_keys_{generation}.npy"), sorted_keys)
+        np.save(os.path.join(directory, f"band_order_{generation}.npy"), order)
+        with open(
+            os.path.join(directory, f"entries_{generation}.json"), "w", encoding="utf-8"
+        ) as f:
+            json.dump(
+                {
+                    "entries": [self._entries[i] for i in alive],
+                    "aliases": self._aliases,
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "settings": self.settings,
+            "generation": generation,
+            "count": len(alive),
+            "aliases": len(self._aliases),
+        }
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)  # ここで新しい世代に切り替わる
+
+        # 古い世代のファイルを消す（開いている mmap があっても POSIX では安全）
+        for path in glob.glob(os.path.join(directory, "*_*.*")):
+            name = os.path.basename(path)
+            stem = os.path.splitext(name)[0]
+            if stem.rsplit("_", 1)[-1] != str(generation):
+                os.remove(path)
+
+    def stats(self) -> dict:
+        return {
+            "seen": self.seen,
+            "duplicates": self.duplicates,
+            "duplicate_ratio": self.duplicates / self.seen if self.seen else 0.0,
+            "indexed": len(self._entries) - len(self._dead),
+            "bands": self.bands,
+            "rows": self.rows,
+        }
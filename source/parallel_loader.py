@@ -0,0 +1,107 @@
+# =============================================================================
+# 【概要】
+# GitLoader の「読み込み」と CharacterTextSplitter の「分割」を
+# 複数プロセスで並列に行うローダです。
+#
+# GitLoader はファイルの読み込み・デコード・分割を 1 コアで順番に行うため、
+# 大きなモノレポでは CPU が余っていても時間がかかります。
+#
+# ParallelGitLoader は――
+#   1. HEAD のツリーから対象ファイル一覧（file_filter 適用済み）を作る
+#   2. パス順に並べたファイル一覧を「シャード（小分けの束）」に分ける
+#   3. ProcessPoolExecutor の各ワーカーが担当シャードを 読み込み → デコード → 分割
+#   4. 結果をシャード順に連結（実行順に関係なく、毎回同じ順番になる）
+# という流れで、コア数にほぼ比例して取り込み時間を短くします。
+#
+# ※ Windows ではプロセス生成に spawn を使うため、呼び出し側のスクリプトは
+#    `if __name__ == "__main__":` の中で実行してください。
+# =============================================================================
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, Optional
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+from git_incremental_loader import IncrementalGitLoader, read_document
+
+DEFAULT_SHARDS_PER_WORKER = 4  # ワーカー 1 つあたりのシャード数（負荷の偏り対策）
+
+
+def _load_shard(
+    repo_path: str,
+    items: list[tuple[str, str]],
+    text_splitter: Optional[TextSplitter],
+) -> list[Document]:
+    """ワーカープロセスで実行：1 シャード分を読み込んで（あれば）分割する"""
+    documents = []
+    for path, blob_sha in items:
+        doc = read_document(repo_path, path, blob_sha)
+        if doc is None:
+            continue
+        if text_splitter is not None:
+            documents.extend(text_splitter.split_documents([doc]))
+        else:
+            documents.append(doc)
+    return documents
+
+
+class ParallelGitLoader(BaseLoader):
+    """ファイル一覧をシャードに分け、プロセスプールで読み込み・分割するローダ"""
+
+    def __init__(
+        self,
+        repo_path: str,
+        clone_url: Optional[str] = None,
+        branch: Optional[str] = "main",
+        file_filter: Optional[Callable[[str], bool]] = None,
+        text_splitter: Optional[TextSplitter] = None,
+        max_workers: Optional[int] = None,
+        shards_per_worker: int = DEFAULT_SHARDS_PER_WORKER,
+    ):
+        # ツリーの走査（clone/checkout・ignore 判定）は IncrementalGitLoader に任せる
+        self._scanner = IncrementalGitLoader(
+            repo_path=repo_path,
+            clone_url=clone_url,
+            branch=branch,
+            file_filter=file_filter,
+        )
+        self.repo_path = repo_path
+        self.text_splitter = text_splitter
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shards_per_worker = shards_per_worker
+
+    def _shards(self, files: dict[str, str]) -> list[list[tuple[str, str]]]:
+        """パス順に並べて、ほぼ同じ件数の連続したシャードに分ける"""
+        items = sorted(files.items())
+        n_shards = min(len(items), self.max_workers * self.shards_per_worker) or 1
+        size, rest = divmod(len(items), n_shards)
+        shards, start = [], 0
+        for i in range(n_shards):
+            end = start + size + (1 if i < rest else 0)
+            shards.append(items[start:end])
+            start = end
+        return shards
+
+    def lazy_load(self) -> Iterator[Document]:
+        """シャード順に Document（text_splitter があればチャンク）を返す"""
+        _, files = self._scanner.scan()
+        shards = self._shards(files)
+
+        if self.max_workers == 1:  # 1 プロセスならプールを作らない
+            for shard in shards:
+                yield from _load_shard(self.repo_path, shard, self.text_splitter)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            # map は投入順に結果を返すので、並び順は実行順に左右されない
+            results = executor.map(
+                _load_shard,
+                [self.repo_path] * len(shards),
+                shards,
+                [self.text_splitter] * len(shards),
+            )
+            for documents in results:
+                yield from documents
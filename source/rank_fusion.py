@@ -0,0 +1,110 @@
+# =============================================================================
+# 【概要】
+# 複数の検索結果（クエリごと・検索器ごとのランキング）を 1 つにまとめる
+# Reciprocal Rank Fusion（RRF）の共通実装です。
+#
+# section6_3_3.py / section6_5_2.py の recipocal_rank_fusion() は
+#   - チャンク本文（page_content）全体を辞書のキーにしていた
+#   - スコアを Python の float で 1 件ずつ足していた
+#   - 本文の文字列だけを返すため、source などのメタデータ（出典）が失われていた
+# という作りでした。
+#
+# reciprocal_rank_fusion() は――
+#   1. チャンク ID（metadata["chunk_id"]。無ければ本文）を整数の通し番号に置き換え
+#   2. 各結果のスコア weight / (k + rank) を NumPy の配列でまとめて計算し、
+#      np.bincount で通し番号ごとに一括集計（件数が少ないときは Python のまま足す）
+#   3. スコア順に、最初に見つかった Document オブジェクトそのものを返す
+# ことで、メタデータを保ったまま（＝出典を示せる形で）結果を統合します。
+# =============================================================================
+
+from typing import Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+DEFAULT_RRF_K = 60  # 順位の差をどれだけならすかの定数（論文の既定値）
+NUMPY_MIN_ENTRIES = 512  # これより少ない件数は NumPy を使わない方が速い
+
+
+def chunk_key(doc: Document) -> str:
+    """
+    チャンクを識別するキー。metadata["chunk_id"] が無ければ本文で代用する。
+    Document.id は使わない：Chroma の検索結果には id が付かず、BM25Index の結果には
+    Chroma の ID が付くため、id を使うと同じチャンクが検索器ごとに別のキーになる。
+    （chunk_id は ingest_pipeline が付ける。Chroma.from_documents などで作った
+      古いコレクションでは本文で突き合わせるので、同じ本文のチャンクは 1 つにまとまる）
+    """
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def reciprocal_rank_fusion_with_scores(
+    retriever_outputs: Sequence[Sequence[Document]],
+    k: int = DEFAULT_RRF_K,
+    weights: Optional[Sequence[float]] = None,
+    top_n: Optional[int] = None,
+) -> list[tuple[Document, float]]:
+    """
+    (Document, RRF スコア) をスコアの高い順に返す。
+    weights を渡すと、結果リストごとにスコアへ重みを掛ける（重み付き RRF）。
+    """
+    if weights is not None and len(weights) != len(retriever_outputs):
+        raise ValueError("weights must have one entry per retriever output")
+
+    # ① チャンクキー → 通し番号（最初に見つかった Document を代表として残す）
+    index_of: dict[str, int] = {}
+    unique_docs: list[Document] = []
+    codes: list[int] = []
+    for docs in retriever_outputs:
+        for doc in docs:
+            key = chunk_key(doc)
+            code = index_of.get(key)
+            if code is None:
+                code = index_of[key] = len(unique_docs)
+                unique_docs.append(doc)
+            codes.append(code)
+    if not unique_docs:
+        return []
+
+    # ② スコア weight / (k + rank) を計算して通し番号ごとに合計し、
+    # ③ スコアの高い順に並べる（同点は先に見つかった順）
+    lengths = [len(docs) for docs in retriever_outputs]
+    list_weights = weights if weights is not None else [1.0] * len(lengths)
+    if len(codes) < NUMPY_MIN_ENTRIES:  # 少量なら配列を作らず Python で足す
+        totals = [0.0] * len(unique_docs)
+        position = 0
+        for n, weight in zip(lengths, list_weights):
+            for rank in range(n):
+                totals[codes[position]] += weight / (k + rank)
+                position += 1
+        order = sorted(range(len(totals)), key=totals.__getitem__, reverse=True)
+        scores = [totals[i] for i in order]
+    else:
+        ranks = np.concatenate([np.arange(n, dtype=np.float64) for n in lengths])
+        contributions = np.repeat(np.asarray(list_weights, dtype=np.float64), lengths)
+        contributions /= k + ranks
+        totals = np.bincount(codes, weights=contributions, minlength=len(unique_docs))
+        sorted_order = np.argsort(-totals, kind="stable")
+        order, scores = sorted_order.tolist(), totals[sorted_order].tolist()
+
+    if top_n is not None:
+        order, scores = order[:top_n], scores[:top_n]
+    return [(unique_docs[i], score) for i, score in zip(order, scores)]
+
+
+def reciprocal_rank_fusion(
+    retriever_outputs: Sequence[Sequence[Document]],
+    k: int = DEFAULT_RRF_K,
+    weights: Optional[Sequence[float]] = None,
+    top_n: Optional[int] = None,
+) -> list[Document]:
+    """RRF で統合した Document のリスト（LCEL のチェーンにそのままつなげられる）"""
+    fused = reciprocal_rank_fusion_with_scores(retriever_outputs, k, weights, top_n)
+    return [doc for doc, _ in fused]
+
+
+def format_documents(docs: Sequence[Document]) -> str:
+    """プロンプトの文脈用に、番号と出典（source）付きでチャンクを並べる"""
+    return "\n\n".join(
+        f"[{number}] {doc.metadata.get('source', 'unknown')}\n{doc.page_content}"
+        for number, doc in enumerate(docs, start=1)
+    )
@@ -0,0 +1,257 @@
+# =============================================================================
+# 【概要】
+# 検索結果の並べ替え（リランク）を差し替え可能にするモジュールです。
+#
+# section6_4.py の rerank() は呼び出しのたびに CohereRerank を作り直し、
+# しかも Cohere の API に届かないと動きません。
+#
+# ここでは――
+#   1. StageTimer：検索・リランクなど段階ごとの所要時間を記録する
+#   2. Reranker（共通インタフェース）：score() を実装すれば rerank() が使える
+#   3. BM25Reranker：CPU だけで動くローカル実装（rank_bm25＋text_tokenizer の分かち書き）
+#   4. CrossEncoderReranker：sentence-transformers があれば小さな cross-encoder を使う
+#   5. CohereReranker：CohereRerank のクライアントを 1 度だけ作って使い回す
+#   6. make_reranker()：API キーやライブラリが無ければローカル実装に切り替える
+# を用意し、オフラインでもリランク付きの RAG を試せるようにします。
+# =============================================================================
+
+import importlib.util
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.tracers.schemas import Run
+from rank_bm25 import BM25Plus
+
+from text_tokenizer import tokenize
+
+DEFAULT_TOP_N = 3
+DEFAULT_MAX_SAMPLES = 1000  # 段階ごとに残す直近の所要時間の数（p50 / p99 用）
+DEFAULT_COHERE_MODEL = "rerank-multilingual-v3.0"
+DEFAULT_CROSS_ENCODER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # 多言語・CPU 可
+
+
+# ---------- 1. 段階ごとの所要時間 ----------
+class StageTimer:
+    """段階名ごとの所要時間（秒）をためておき、平均などを返す"""
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        # 段階名 → 直近の所要時間（古いものから捨てる）と、起動からの回数・合計
+        self._timings: dict[str, deque[float]] = {}
+        self._totals: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            if stage not in self._timings:
+                self._timings[stage] = deque(maxlen=self.max_samples)
+                self._totals[stage] = [0, 0.0]
+            self._timings[stage].append(seconds)
+            self._totals[stage][0] += 1
+            self._totals[stage][1] += seconds
+
+    def wrap(self, stage: str, runnable: Runnable) -> Runnable:
+        """
+        runnable の実行にかかった時間を stage として記録する Runnable を返す。
+        実行の開始・終了のコールバックで測るので、stream() / transform() / batch() も
+        そのまま使える（stream は最後のチャンクを返し終えるまでの時間になる）。
+        """
+
+        def on_finish(run: Run) -> None:
+            self.record(stage, (run.end_time - run.start_time).total_seconds())
+
+        return runnable.with_listeners(
+            on_end=on_finish, on_error=on_finish
+        ).with_config(run_name=stage)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """回数・平均は累計、p50 / p99 は直近 max_samples 回から計算する"""
+        with self._lock:
+            return {
+                stage: {
+                    "calls": self._totals[stage][0],
+                    "mean": self._totals[stage][1] / self._totals[stage][0],
+                    "p50": _percentile(seconds, 0.50),
+                    "p99": _percentile(seconds, 0.99),
+                    "last": seconds[-1],
+                }
+                for stage, seconds in self._timings.items()
+            }
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ---------- 2. 共通インタフェース ----------
+class Reranker(ABC):
+    """
+    リランカーの基底クラス。サブクラスは score() で各文書の関連度を返す。
+    rerank() は関連度の高い順に top_n 件を、relevance_score を metadata に付けて返す。
+    """
+
+    name = "reranker"
+
+    def __init__(self, timer: Optional[StageTimer] = None):
+        self.timer = timer or StageTimer()
+
+    @abstractmethod
+    def score(self, query: str, documents: Sequence[Document]) -> list[float]:
+        """documents の各文書の、query に対する関連度（大きいほど関連が強い）"""
+
+    def score_batch(
+        self, requests: Sequence[tuple[str, Sequence[Document]]]
+    ) -> list[list[float]]:
+        """複数の (質問, 文書) をまとめて採点する。1 回で処理できる実装は上書きする"""
+        return [self.score(query, documents) for query, documents in requests]
+
+    def rerank(
+        self, query: str, documents: Sequence[Document], top_n: int = DEFAULT_TOP_N
+    ) -> list[Document]:
+        if not documents:
+            return []
+        started = time.perf_counter()
+        scores = self.score(query, documents)
+        # 同点は元の検索順を保つ（sorted は安定ソート）
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])[:top_n]
+        reranked = [
+            Document(
+                id=documents[i].id,
+                page_content=documents[i].page_content,
+                metadata={**documents[i].metadata, "relevance_score": scores[i]},
+            )
+            for i in order
+        ]
+        self.timer.record(f"rerank:{self.name}", time.perf_counter() - started)
+        return reranked
+
+    def as_runnable(self, top_n: int = DEFAULT_TOP_N) -> Runnable:
+        """{"question", "documents"} を受け取るリランク用 Runnable（LCEL 用）"""
+        return RunnableLambda(
+            lambda inp: self.rerank(inp["question"], inp["documents"], top_n),
+            name=f"rerank:{self.name}",
+        )
+
+
+# ---------- 3. ローカル（BM25） ----------
+class BM25Reranker(Reranker):
+    """検索で集めた候補だけを対象に BM25 で採点する（API もモデルも不要）"""
+
+    name = "bm25"
+
+    def __init__(
+        self,
+        tokenizer: Callable[[str], list[str]] = tokenize,
+        timer: Optional[StageTimer] = None,
+    ):
+        super().__init__(timer)
+        self.tokenizer = tokenizer
+
+    def score(self, query: str, documents: Sequence[Document]) -> list[float]:
+        # 候補は数件しかないので、半数の文書に出る語の IDF が 0 になる BM25Okapi ではなく
+        # IDF が常に正の BM25Plus を使う
+        corpus = [self.tokenizer(doc.page_content) or [""] for doc in documents]
+        return BM25Plus(corpus).get_scores(self.tokenizer(query)).tolist()
+
+
+# ---------- 4. ローカル（cross-encoder） ----------
+class CrossEncoderReranker(Reranker):
+    """sentence-transformers の CrossEncoder で (質問, 文書) の組を直接採点する"""
+
+    name = "cross-encoder"
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_CROSS_ENCODER,
+        batch_size: int = 16,
+        timer: Optional[StageTimer] = None,
+    ):
+        super().__init__(timer)
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "CrossEncoderReranker には sentence-transformers が必要です: "
+                "pip install sentence-transformers"
+            ) from e
+        self.model = CrossEncoder(model_name, device="cpu")  # 読み込みは 1 回だけ
+        self.batch_size = batch_size
+
+    def score(self, query: str, documents: Sequence[Document]) -> list[float]:
+        return self.score_batch([(query, documents)])[0]
+
+    def score_batch(
+        self, requests: Sequence[tuple[str, Sequence[Document]]]
+    ) -> list[list[float]]:
+        # 全リクエストの組を 1 回の predict に流し、あとで元のリクエストごとに切り分ける
+        pairs = [(query, doc.page_content) for query, docs in requests for doc in docs]
+        scores = self.model.predict(pairs, batch_size=self.batch_size).tolist()
+        results, start = [], 0
+        for _, docs in requests:
+            results.append(scores[start : start + len(docs)])
+            start += len(docs)
+        return results
+
+
+# ---------- 5. リモート（Cohere） ----------
+_cohere_clients: dict[str, Any] = {}
+_cohere_lock = threading.Lock()
+
+
+def cohere_client(model: str = DEFAULT_COHERE_MODEL) -> Any:
+    """CohereRerank をモデルごとに 1 つだけ作って使い回す"""
+    with _cohere_lock:
+        client = _cohere_clients.get(model)
+        if client is None:
+            from langchain_cohere import CohereRerank
+
+            client = _cohere_clients[model] = CohereRerank(model=model)
+        return client
+
+
+class CohereReranker(Reranker):
+    """Cohere の Rerank API で採点する（クライアントはプロセス内で共有）"""
+
+    name = "cohere"
+
+    def __init__(
+        self, model: str = DEFAULT_COHERE_MODEL, timer: Optional[StageTimer] = None
+    ):
+        super().__init__(timer)
+        self.client = cohere_client(model)
+
+    def score(self, query: str, documents: Sequence[Document]) -> list[float]:
+        # 全件の点数が欲しいので top_n は候補数にする（並べ替えは rerank() 側で行う）
+        results = self.client.rerank(
+            documents=list(documents), query=query, top_n=len(documents)
+        )
+        scores = [float("-inf")] * len(documents)
+        for result in results:
+            scores[result["index"]] = result["relevance_score"]
+        return scores
+
+
+# ---------- 6. 使える実装を選ぶ ----------
+def make_reranker(kind: str = "auto", timer: Optional[StageTimer] = None) -> Reranker:
+    """
+    kind: "cohere" / "cross-encoder" / "bm25" / "auto"。
+    "auto" は COHERE_API_KEY と langchain_cohere があれば Cohere、
+    無ければ BM25 を使う（オフラインでも動く）。
+    """
+    if kind == "auto":
+        has_cohere = importlib.util.find_spec("langchain_cohere") is not None
+        kind = "cohere" if has_cohere and os.environ.get("COHERE_API_KEY") else "bm25"
+    if kind == "cohere":
+        return CohereReranker(timer=timer)
+    if kind == "cross-encoder":
+        return CrossEncoderReranker(timer=timer)
+    if kind == "bm25":
+        return BM25Reranker(timer=timer)
+    raise ValueError(f"unknown reranker: {kind}")
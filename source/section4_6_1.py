@@ -7,9 +7,15 @@ LangChain の `GitLoader` で読み込み、さらに 1,000 文字ごとに分
 処理の流れは次の 5 ステップ:
  1) **フィルタ関数 `file_filter`** を用意し、読み込む対象を .mdx ファイルに限定。
  2) **`GitLoader` を初期化** し、どのリポジトリ／ブランチ／ローカルパスを使うか設定。
- 3) **`load()` を実行** してドキュメントを取得（clone/pull → 走査 → フィルタ → Document 生成）。
- 4) **取得した件数を `print`** して動作確認。
- 5) **`CharacterTextSplitter` でチャンク化** し、再度件数を `print`。
+ 3) **`lazy_load()` を実行** してドキュメントを 1 件ずつ取り出すジェネレータを得る
+    （clone/pull → 走査 → フィルタ → Document 生成 を必要になった分だけ行う）。
+ 4) **`CharacterTextSplitter` で 1 件ずつチャンク化** しながら件数を数える。
+ 5) **ドキュメント数とチャンク数を `print`** して動作確認。
+
+`load()` → `split_documents()` のように全件をリストにすると、元の文書とチャンクの
+両方をコーパス全体ぶんメモリに持つことになります。ここでは 1 件ずつ流すので、
+メモリに載るのは常に「いま処理している 1 ファイル分」だけです。
+（埋め込み・Chroma への登録まで 1 件ずつ流すには ingest_pipeline.stream_ingest を使います）
 
 このスクリプトを実行すると、カレントフォルダ直下に `./langchain` というローカル
 リポジトリが作成（もしくは更新）され、その中から `.mdx` ファイルだけが対象となります。
@@ -50,18 +56,14 @@ loder = GitLoader(  # ← インスタンス生成（※typo を残す方針）
 )
 
 # ------------------------------------------------------------
-# ③ ドキュメントの読み込みを実行
-#    .load() は clone/pull → 走査 → フィルタ → Document 化 を一括で行います。
-# ------------------------------------------------------------
-raw_docs = loder.load()  # ← List[Document] が返る
-
-# ------------------------------------------------------------
-# ④ 読み込んだドキュメント件数を表示
+# ③ ドキュメントを 1 件ずつ読み込むジェネレータを用意
+#    .lazy_load() は clone/pull → 走査 → フィルタ → Document 化 を
+#    1 ファイルずつ行います（.load() は全件をリストにして返す）。
 # ------------------------------------------------------------
-print(len(raw_docs))  # ← 取得した .mdx ドキュメント数を確認
+raw_docs = loder.lazy_load()  # ← Iterator[Document] が返る（まだ何も読んでいない）
 
 # ============================================================
-# ⑤ ドキュメントを 1,000 文字ごとにチャンク化
+# ④ ドキュメントを 1,000 文字ごとにチャンク化（1 件ずつ）
 #    - chunk_size    : 1 チャンクあたりの最大文字数
 #    - chunk_overlap : チャンク間の重なり（0 なら重複なし）
 # ============================================================
@@ -74,5 +76,15 @@ text_splitter = CharacterTextSplitter(
     chunk_overlap=0,  # ← 重複なし
 )
 
-docs = text_splitter.split_documents(raw_docs)  # ← 分割後の Document を取得
-print(len(docs))  # ← チャンク総数を表示
+doc_count = 0
+chunk_count = 0
+for raw_doc in raw_docs:  # ← 読んだそばから分割し、チャンクはその場で捨てる
+    docs = text_splitter.split_documents([raw_doc])  # ← この 1 件分のチャンク
+    doc_count += 1
+    chunk_count += len(docs)
+
+# ------------------------------------------------------------
+# ⑤ ドキュメント数とチャンク数を表示
+# ------------------------------------------------------------
+print(doc_count)  # ← 取得した .mdx ドキュメント数を確認
+print(chunk_count)  # ← チャンク総数を表示
@@ -11,10 +11,10 @@
 # ――という一連の流れを実装しています。
 # ==============================================================
 
-from langchain_chroma import Chroma  # ← ベクトルストア実装
 from langchain_openai import OpenAIEmbeddings  # ← OpenAI の埋め込みモデル
-from langchain_community.document_loaders import (  # ← 複数行 import の書き方
-    GitLoader,  #    Git リポジトリ用ローダ
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import (  # ← 複数行 import の書き方
+    open_persistent_index,  #    永続化した Chroma を差分更新して開く
 )
 
 
@@ -29,20 +29,7 @@ def file_filter(file_path: str) -> bool:
 
 
 # ----------------------------------------------------------------
-# ② Git リポジトリをローカルにクローンしつつドキュメントを読み込む
-#    ※変数名 loder は loader の typo だが、指示に合わせてそのまま使用
-# ----------------------------------------------------------------
-loder = GitLoader(  # ← ローダーのインスタンスを生成
-    clone_url="http://github.com/langchain-ai/langchain",  # ← 取得元リポジトリ
-    repo_path="./langchain",  # ← クローン先ディレクトリ
-    branch="master",  # ← 対象ブランチ
-    file_filter=file_filter,  # ← .mdx ファイルだけ絞り込み
-)
-
-raw_docs = loder.load()  # ← Git から取得した List[Document] が返る
-
-# ----------------------------------------------------------------
-# ③ ドキュメントを 1,000 文字単位で分割（チャンク化）
+# ② ドキュメントを 1,000 文字単位で分割（チャンク化）するスプリッタ
 #    大きなテキストをそのまま embed すると性能が落ちるため、
 #    chunk_overlap=0 で切れ目が重ならないようにしている。
 # ----------------------------------------------------------------
@@ -53,19 +40,28 @@ text_splitter = CharacterTextSplitter(
     chunk_overlap=0,  # ← チャンク間の重複は 0
 )
 
-docs = text_splitter.split_documents(raw_docs)  # ← 分割後の List[Document]
-
 # ----------------------------------------------------------------
-# ④ OpenAIEmbeddings で各チャンクをベクトル化
+# ③ OpenAIEmbeddings で各チャンクをベクトル化
 #    "text-embedding-3-small" は 1,536 次元のベクトルを返す。
 # ----------------------------------------------------------------
 embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
 
 # ----------------------------------------------------------------
-# ⑤ Chroma にドキュメントを登録
-#    ※メソッド名 form_documnets は from_documents の typo だが指示に従い保持
+# ④⑤ Git リポジトリをクローンしつつ、永続化した Chroma に登録
+#    - 初回     : 全 .mdx を読み込み → 分割 → 埋め込み → .rag_cache/chroma へ保存
+#    - 2 回目以降: 保存済みコレクションを開き、変更のあったファイルだけ登録し直す
+#    分割方法が違うインデックスと混ざらないよう collection_name を分けている。
 # ----------------------------------------------------------------
-db = Chroma.from_documents(docs, embeddings)
+db = open_persistent_index(
+    repo_path="./langchain",  # ← クローン先ディレクトリ
+    embeddings=embeddings,
+    clone_url="http://github.com/langchain-ai/langchain",  # ← 取得元リポジトリ
+    branch="master",  # ← 対象ブランチ
+    file_filter=file_filter,  # ← .mdx ファイルだけ絞り込み
+    text_splitter=text_splitter,  # ← 追加・変更分だけを分割
+    collection_name="langchain_docs_char1000",
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 
 # ----------------------------------------------------------------
 # ⑥ ベクトルストアを検索用インターフェース（Retriever）として公開
@@ -12,12 +12,13 @@
 #   ここでは「ベクトルストア／Embeddings／ドキュメントローダ」という
 #   主要 3 コンポーネントを読み込む。
 #   ─────────────────────────────────
-from langchain_chroma import Chroma  # Chroma = ベクトルストア実装
 from langchain_openai import (
     OpenAIEmbeddings,
 )  # OpenAI の埋め込みモデル（ラッパークラス）
-from langchain_community.document_loaders import (  # LangChain コミュニティ提供のローダ集
-    GitLoader,  #   └ Git リポジトリを丸ごと読み込むローダ
+from embedding_cache import CachedEmbeddings  # 埋め込みの永続キャッシュ
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import (  # 永続化した Chroma を開く共通関数（source/vector_index.py）
+    open_persistent_index,  #   └ Git の差分だけを分割・埋め込みして登録
 )
 
 
@@ -31,23 +32,7 @@ def file_filter(file_path: str) -> bool:
     return file_path.endswith(".mdx")  # 末尾判定だけのシンプル実装
 
 
-# ---------- 2. Git からドキュメント取得 --------------------------------
-#   GitLoader は以下 4 つのパラメータで挙動が決まる：
-#   ① clone_url  : 取得元リポジトリ（HTTPS URL でも OK）
-#   ② repo_path  : ローカルにクローンするパス
-#   ③ branch     : 対象ブランチ（main / develop など）
-#   ④ file_filter: 取得対象ファイルを制限するコールバック
-loader = GitLoader(
-    clone_url="http://github.com/langchain-ai/langchain",  # ① 取得元 URL
-    repo_path="./langchain",  # ② ローカル保存先
-    branch="master",  # ③ 対象ブランチ
-    file_filter=file_filter,  # ④ 拡張子フィルタ
-)
-
-raw_docs = loader.load()  # Git から取得した Document オブジェクトのリスト
-
-
-# ---------- 3. 1,000 文字ごとにチャンク化 ------------------------------
+# ---------- 2. 1,000 文字ごとにチャンク化するスプリッタ ----------------
 #   “巨大なドキュメント” を “検索しやすい粒度” に割く作業。
 #   LangChain では TextSplitter 系のユーティリティが豊富。
 from langchain_text_splitters import CharacterTextSplitter
@@ -57,20 +42,34 @@ text_splitter = CharacterTextSplitter(
     chunk_overlap=0,  # チャンク間の重複なし（今回は学習用途なので 0）
 )
 
-docs = text_splitter.split_documents(raw_docs)  # チャンク後のドキュメント一覧
-
 
-# ---------- 4. OpenAI Embeddings でベクトル化 ---------------------------
+# ---------- 3. OpenAI Embeddings でベクトル化 ---------------------------
 #   text-embedding-3-small = 1,536 次元の軽量モデル。
 #   高精度が欲しい場合は *-large を選択すると次元数が増える（＝計算コスト増）。
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 1,536 次元ベクトル
+#   CachedEmbeddings で包むと、同じ本文・質問の埋め込みは 2 回目から API を呼ばない。
+embeddings = CachedEmbeddings(
+    OpenAIEmbeddings(model="text-embedding-3-small")
+)  # 1,536 次元ベクトル
 
 
-# ---------- 5. Chroma へ登録 -------------------------------------------
-#   Chroma は in-process DB（DuckDB + Parquet）なのでローカル実行が手軽。
-#   from_documents() が「ドキュメント＋エンベッディング」をまとめて登録。
-#   ★注意: コメントの誤 typo `from_documnets` は残しておく（あくまでコメント）。
-db = Chroma.from_documents(docs, embeddings)  # ベクトルストアへ一括登録
+# ---------- 4-5. Git から取得して永続化した Chroma へ登録 --------------
+#   open_persistent_index() は以下のパラメータで挙動が決まる：
+#   ① clone_url  : 取得元リポジトリ（HTTPS URL でも OK）
+#   ② repo_path  : ローカルにクローンするパス
+#   ③ branch     : 対象ブランチ（main / develop など）
+#   ④ file_filter: 取得対象ファイルを制限するコールバック
+#   初回はクローン → 分割 → 埋め込み → .rag_cache/chroma へ保存。
+#   2 回目以降は保存済みコレクションを開き、変更のあったファイルだけ登録し直す。
+db = open_persistent_index(
+    repo_path="./langchain",  # ② ローカル保存先
+    embeddings=embeddings,
+    clone_url="http://github.com/langchain-ai/langchain",  # ① 取得元 URL
+    branch="master",  # ③ 対象ブランチ
+    file_filter=file_filter,  # ④ 拡張子フィルタ
+    text_splitter=text_splitter,  # 追加・変更分だけを分割
+    collection_name="langchain_docs_char1000",  # 分割方法ごとにコレクションを分ける
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 
 
 # ---------- 6. Retriever 化 --------------------------------------------
@@ -105,17 +104,28 @@ prompt = ChatPromptTemplate.from_template(
 model = ChatOpenAI(model_name="gpt-4.1-nano", temperature=0)  # 0 = 完全決定論的
 
 from langchain_core.output_parsers import StrOutputParser  # 出力を str に変換
-from langchain_core.runnables import RunnablePassthrough  # 値をそのまま流すパススルー
+from semantic_cache import SemanticResponseCache  # 意味の近い質問の回答キャッシュ
 
 
 # ■ Runnable チェーン定義
 #   ① Retriever で文脈作成 → ② Prompt 成形 → ③ LLM 推論 → ④ 文字列抽出
-chain = (
-    {"context": retriever, "question": RunnablePassthrough()}  # ①
-    | prompt  # ②
-    | model  # ③
-    | StrOutputParser()  # ④
+#   ① は SemanticResponseCache が行い、②〜④ を generate として渡す
+generate = (
+    prompt  # ② Prompt 成形（context と question を差し込む）
+    | model  # ③ LLM 推論
+    | StrOutputParser()  # ④ 文字列抽出
 )
 
-output = chain.invoke(query)  # チェーン実行
+# ■ セマンティックキャッシュ
+#   質問の埋め込みが保存済みの質問と十分近く、検索した文脈も同じなら
+#   ②〜④（LLM 呼び出し）を飛ばして保存済みの回答を返す。
+response_cache = SemanticResponseCache(  # ①
+    embeddings, retriever, generate, verbose=True  # ヒットしたら print する
+)
+cached_chain = response_cache.as_runnable()  # 質問 → 回答 のチェーン
+
+output = cached_chain.invoke(query)  # チェーン実行（初回は検索＋生成）
 print(output)  # 検索結果（最初の回答）を表示
+
+output = cached_chain.invoke(query)  # 同じ質問は保存済みの回答を返す
+print(response_cache.stats())  # ヒット・ミスの回数とヒット率
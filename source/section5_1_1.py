@@ -16,6 +16,13 @@
 from langchain_core.output_parsers import StrOutputParser  # 文字列だけを取り出すパーサ
 from langchain_core.prompts import ChatPromptTemplate  # プロンプト生成テンプレート
 from langchain_openai import ChatOpenAI  # OpenAI LLM ラッパ
+from langchain_core.globals import set_llm_cache  # 全 LLM 共通のキャッシュを設定
+from llm_cache import PersistentLLMCache  # LLM の結果をディスクに保存するキャッシュ
+
+# -------- ⓪ LLM の結果キャッシュを有効化 --------
+#   temperature=0 で同じプロンプトなら、2 回目以降（再実行も含む）は API を呼ばない
+llm_cache = PersistentLLMCache()
+set_llm_cache(llm_cache)
 
 # -------- ② プロンプトを定義 --------
 #   - "system" は AI への指示（必ずレシピを答えること）
@@ -73,3 +80,6 @@ print("-------------------------------------------------------------------------
 # batch: 複数リクエストをまとめて処理する例
 output3 = chain.batch([{"dish": "カレー"}, {"dish": "うどん"}])
 print(output3)  # ← ２品分のレシピがリストで返る
+
+# 「カレー」は invoke 済みなのでキャッシュから返る（stream はキャッシュを使わない）
+print(llm_cache.stats())
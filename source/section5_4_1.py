@@ -42,7 +42,12 @@ from langchain_community.retrievers import (
     TavilySearchAPIRetriever,
 )  # ❻ Tavily Web 検索用リトリーバをインポート
 
-retriever = TavilySearchAPIRetriever(k=3)  # ❼ 上位 3 件の検索結果を取得するよう設定
+from web_search_cache import (
+    CachedWebRetriever,
+)  # 同じ質問の検索結果を TTL 付きでキャッシュするラッパー
+
+# ❼ 上位 3 件の検索結果を取得するよう設定（同じ質問は有効期限内ならキャッシュから返す）
+retriever = CachedWebRetriever(retriever=TavilySearchAPIRetriever(k=3))
 
 from langchain_core.runnables import (
     RunnablePassthrough,
@@ -63,3 +68,9 @@ chain = (
 # ⓭ 実際にチェーンを呼び出して回答を取得
 output = chain.invoke("東京の今日の天気は？")
 print(output)  # ⓮ コンソールに回答を表示
+
+# ⓯ 同じ質問（表記ゆれは正規化される）は Web 検索を呼ばずにキャッシュから文脈を取得
+output = chain.invoke("東京の今日の天気は")
+print(output)
+print(retriever.stats())  # ヒット・ミス・相乗りの回数
+retriever.close()  # 取り直し用のスレッドプールを閉じる
@@ -43,7 +43,12 @@ from langchain_community.retrievers import (
     TavilySearchAPIRetriever,  # Tavily Web 検索 API 用リトリーバ
 )
 
-retriever = TavilySearchAPIRetriever(k=3)  # 上位３件を文脈として取得する設定
+from web_search_cache import (
+    CachedWebRetriever,  # 同じ質問の検索結果を TTL 付きでキャッシュするラッパー
+)
+
+# 上位３件を文脈として取得する設定（同じ質問は有効期限内ならキャッシュから返す）
+retriever = CachedWebRetriever(retriever=TavilySearchAPIRetriever(k=3))
 
 # --- Runnable ユーティリティのインポート ------------------------------------------
 from langchain_core.runnables import (
@@ -71,3 +76,4 @@ chain = {
 # --- チェーンを実行して結果を表示 --------------------------------------------------
 output = chain.invoke("東京の今日の天気は？")  # 質問を投入してパイプライン実行
 pprint.pprint(output)  # 辞書形式の結果を整形出力
+retriever.close()  # 取り直し用のスレッドプールを閉じる
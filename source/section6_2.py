@@ -11,8 +11,9 @@
 # - ステップ4 : ユーザ質問＋検索結果をプロンプトに渡して LLM で回答生成
 # =============================================================================
 
-import os
-from langchain_community.document_loaders import GitLoader  # Git リポ読み込みに使用
+from embedding_cache import CachedEmbeddings  # 埋め込みの永続キャッシュ
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import open_persistent_index  # 永続化した Chroma を差分更新して開く
 
 
 # --- 対象ファイルを .mdx に限定するフィルタ関数 -------------------------------
@@ -22,38 +23,25 @@ def file_filter(file_path: str) -> bool:  # GitLoader から呼ばれる
 
 # --- Git リポジトリをクローンしてドキュメントを取得 ---------------------------
 repo_path = "./langchain"
-if not os.path.exists(repo_path):
-    # リポジトリが存在しない場合のみクローンする
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",  # 公式 LangChain リポ
-        repo_path=repo_path,  # ローカル保存先
-        branch="master",  # 取得ブランチ
-        file_filter=file_filter,  # 上記フィルタ適用
-    )
-    documents = loder.load()  # .mdx を Document 化
-else:
-    # 既にリポジトリが存在する場合はそのまま読み込む
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",  # 公式 LangChain リポ
-        repo_path=repo_path,  # ローカル保存先
-        branch="master",  # 取得ブランチ
-        file_filter=file_filter,  # 上記フィルタ適用
-    )
-    documents = loder.load()  # .mdx を Document 化
-
-print(len(documents))  # 取得件数を確認
 
 # --- ドキュメントをベクトル化し Chroma に登録 -------------------------------
-from langchain_chroma import Chroma
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 埋め込み用モデル
-db = Chroma.from_documents(documents, embeddings)  # Vector Store 構築
+# 埋め込み用モデル（同じ本文・質問は 2 回目から API 不要）
+embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
+db = open_persistent_index(  # 2 回目以降は保存済みコレクションを開き、差分だけ登録
+    repo_path=repo_path,
+    embeddings=embeddings,
+    clone_url="https://github.com/langchain-ai/langchain",
+    branch="master",
+    file_filter=file_filter,
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 
 # --- LCEL（LangChain Expression Language）の部品 ----------------------------
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from semantic_cache import SemanticResponseCache  # 意味の近い質問の回答キャッシュ
 
 # プロンプトテンプレート：検索結果（context）と質問（question）を差し込む
 prompt = ChatPromptTemplate.from_template(
@@ -73,17 +61,24 @@ model = ChatOpenAI(model="gpt-4.1-nano", temperature=0)  # 応答生成モデル
 retriever = db.as_retriever()  # ベクトル検索インタフェース
 
 # --- 質問→検索→生成をひとつのチェーンに結合 -------------------------------
-chain = (
-    {
-        "question": RunnablePassthrough(),  # 質問文字列をそのまま渡す
-        "context": retriever,  # 検索結果（文脈）を渡す
-    }
-    | prompt  # プロンプトを組み立て
+# 検索（retriever）は SemanticResponseCache が行い、生成部分だけを渡す
+generate = (
+    prompt  # 検索結果（context）と質問（question）からプロンプトを組み立て
     | model  # LLM で回答生成
     | StrOutputParser()  # 出力を純粋な文字列に変換
 )
 
+# 意味の近い質問は、文脈が同じなら保存済みの回答を返す
+response_cache = SemanticResponseCache(
+    embeddings, retriever, generate, verbose=True  # ヒットしたら print する
+)
+cached_chain = response_cache.as_runnable()  # 質問 → 回答
+
 # --- チェーン実行例 ----------------------------------------------------------
-output = chain.invoke("Langchainの概要を教えて")  # 結果は戻り値で取得
+output = cached_chain.invoke("Langchainの概要を教えて")  # 結果は戻り値で取得
 
 print(output)
+
+# 表記が違っても意味が近く、文脈も同じなら LLM を呼ばずに保存済みの回答を返す
+output = cached_chain.invoke("LangChain の概要を教えて")
+print(response_cache.stats())  # ヒット・ミスの回数とヒット率
@@ -14,8 +14,8 @@ HyDE（Hypothetical Document Embeddings）テクニックを利用し、
 5. プロンプトに質問 + context を挿入し GPT-4.1-nano が回答
 """
 
-import os
-from langchain_community.document_loaders import GitLoader  # GitHub リポジトリを扱う
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import open_persistent_index  # 永続化した Chroma を差分更新して開く
 
 
 # ---------- .mdx だけを読み込むフィルタ関数 ----------------------------------
@@ -25,33 +25,19 @@ def file_filter(file_path: str) -> bool:
 
 # ---------- リポジトリのクローン & ドキュメント読み込み -----------------------
 repo_path = "./langchain"
-if not os.path.exists(repo_path):
-    # 初回実行時: リポジトリが無ければクローン
-    loder = GitLoader(  # NOTE: 変数名は元コードに合わせて loder のまま
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path=repo_path,
-        branch="master",
-        file_filter=file_filter,
-    )
-    documents = loder.load()  # .mdx を Document オブジェクトに変換
-else:
-    # 既にクローン済み: そのまま読み込み
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path=repo_path,
-        branch="master",
-        file_filter=file_filter,
-    )
-    documents = loder.load()
-
-print(len(documents))  # 何件読み込めたか確認
 
 # ---------- ドキュメントをベクトル化して Chroma に登録 -----------------------
-from langchain_chroma import Chroma
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 埋め込みモデル
-db = Chroma.from_documents(documents, embeddings)  # Vector Store を作成
+db = open_persistent_index(  # 2 回目以降は保存済みコレクションを開き、差分だけ登録
+    repo_path=repo_path,
+    embeddings=embeddings,
+    clone_url="https://github.com/langchain-ai/langchain",
+    branch="master",
+    file_filter=file_filter,
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 
 # ---------- LCEL（LangChain Expression Language）部品 ------------------------
 from langchain_core.output_parsers import StrOutputParser
@@ -84,11 +70,19 @@ hypotheical_prompt = ChatPromptTemplate.from_template(
 
 hypotheical_chain = hypotheical_prompt | model | StrOutputParser()  # 仮想回答を生成
 
+from hyde_cache import CachedHyDERetriever
+
+# 同じ質問なら仮想回答の生成と埋め込みを飛ばし、キャッシュ済みのベクトルで検索する
+hyde_retriever = CachedHyDERetriever(
+    hypothetical_chain=hypotheical_chain,
+    vectorstore=db,
+)
+
 # ---------- HyDE + RAG を組み合わせた最終チェーン ---------------------------
 hyde_rag_chain = (
     {
         "question": RunnablePassthrough(),  # 質問をそのまま渡す
-        "context": hypotheical_chain | retriever,  # 仮想回答を検索クエリに
+        "context": hyde_retriever,  # 仮想回答（キャッシュ付き）を検索クエリに
     }
     | prompt  # プロンプトへ挿入
     | model  # LLM で回答
@@ -97,3 +91,30 @@ hyde_rag_chain = (
 
 output = hyde_rag_chain.invoke("LangChainの概要を教えて")  # 動作確認
 print(output)
+
+# 表記ゆれのある同じ質問：仮想回答の生成と埋め込みはキャッシュから
+output = hyde_rag_chain.invoke("LangChain の概要を教えて？")
+print(output)
+print(hyde_retriever.cache.stats())
+
+# ---------- 適応型 HyDE：直接検索で十分なときは仮想回答を作らない ----------
+from adaptive_hyde import AdaptiveHyDERetriever
+
+adaptive_retriever = AdaptiveHyDERetriever(
+    vectorstore=db,
+    hyde_retriever=hyde_retriever,  # 自信が無いときだけキャッシュ付き HyDE を使う
+    verbose=True,  # 質問ごとの判断（direct / hyde）を print する
+)
+adaptive_rag_chain = (
+    {
+        "question": RunnablePassthrough(),
+        "context": adaptive_retriever,  # 質問ごとに direct / hyde を判断（print される）
+    }
+    | prompt
+    | model
+    | StrOutputParser()
+)
+
+for question in ["LangChainの概要を教えて", "RunnableParallel の使い方は？"]:
+    print(adaptive_rag_chain.invoke(question))
+print(adaptive_retriever.stats())
@@ -8,9 +8,8 @@ OpenAI の埋め込みモデルでベクトル化したうえで Chroma に格
 """
 
 import os
-from langchain_community.document_loaders import (
-    GitLoader,
-)  # GitHub リポジトリ操作クラス
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import open_persistent_index  # 永続化した Chroma を差分更新して開く
 
 # ---------- LangSmith（LangChain のログ可視化サービス）の設定 ----------
 os.environ["LANGCHAIN_TRACING_V2"] = "true"  # トレーシングを有効化
@@ -27,31 +26,19 @@ def file_filter(file_path: str) -> bool:
 
 # ---------- リポジトリのクローンとドキュメント読み込み ----------
 repo_path = "./langchain"  # クローン先フォルダ
-if not os.path.exists(repo_path):  # フォルダ未作成＝初回実行
-    loder = GitLoader(  # ※オリジナルの綴りどおり “loder” にしています
-        clone_url="https://github.com/langchain-ai/langchain",  # リポジトリ URL
-        repo_path=repo_path,  # クローン先
-        branch="master",  # 取得ブランチ
-        file_filter=file_filter,  # .mdx だけ読み込む
-    )
-    documents = loder.load()  # ドキュメントを読み込む
-else:  # すでにクローン済み
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path=repo_path,
-        branch="master",
-        file_filter=file_filter,
-    )
-    documents = loder.load()  # ドキュメントを再読み込み
-
-print(len(documents))  # 読み込めたドキュメント数を確認
 
 # ---------- ドキュメントをベクトル化して Chroma に登録 ----------
-from langchain_chroma import Chroma
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 埋め込みモデルを初期化
-db = Chroma.from_documents(documents, embeddings)  # ベクトルストアを構築
+db = open_persistent_index(  # 2 回目以降は保存済みコレクションを開き、差分だけ登録
+    repo_path=repo_path,
+    embeddings=embeddings,
+    clone_url="https://github.com/langchain-ai/langchain",
+    branch="master",
+    file_filter=file_filter,
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 
 # ---------- LCEL（LangChain Expression Language）部品 ----------
 from langchain_core.output_parsers import StrOutputParser
@@ -76,6 +63,11 @@ model = ChatOpenAI(
 )  # 生成モデル（温度 0 で決定論的）
 retriever = db.as_retriever()  # ベクトル検索インタフェースを取得
 
+from multi_query_retriever import MultiQueryVectorRetriever
+
+# 生成した複数クエリを 1 回の埋め込み呼び出し＋1 回の検索でまとめて処理する
+multi_query_retriever = MultiQueryVectorRetriever(db)
+
 from pydantic import BaseModel, Field
 
 
@@ -111,7 +103,7 @@ multi_query_rag_chain = (
     {
         "question": RunnablePassthrough(),  # ユーザ質問をそのまま渡す
         "context": query_generation_chain
-        | retriever.map(),  # 生成した各クエリで検索した結果を結合
+        | multi_query_retriever.retrieve,  # 全クエリをまとめて検索し、重複を除いて結合
     }
     | prompt  # プロンプトに埋め込む
     | model  # LLM で回答生成
@@ -120,3 +112,25 @@ multi_query_rag_chain = (
 
 output = multi_query_rag_chain.invoke("LangChain の概要を教えて")  # 実行例
 print(output)  # 生成された回答を表示
+
+# ---------- ストリーミング版：クエリを書き終えた順に検索を始める ----------
+from streaming_query_retriever import StreamingQueryRetriever, streaming_query_chain
+
+# 構造化出力を途中経過つきで受け取り、確定したクエリから順に検索する
+streaming_retriever = StreamingQueryRetriever(
+    streaming_query_chain(query_generation_prompt, model, QueryGenerationOutput),
+    multi_query_retriever,
+)
+streaming_rag_chain = (
+    {
+        "question": RunnablePassthrough(),
+        "context": streaming_retriever.as_runnable(),  # 生成と検索を重ねて実行
+    }
+    | prompt
+    | model
+    | StrOutputParser()
+)
+
+for chunk in streaming_rag_chain.stream("LangChain の概要を教えて"):
+    print(chunk, end="", flush=True)  # 回答をトークンごとに表示
+print()
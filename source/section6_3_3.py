@@ -25,9 +25,8 @@ OpenAI の埋め込みモデルでベクトル化したうえで Chroma に格
 
 # ---------- 必要なライブラリのインポート ----------
 import os  # OS の環境変数操作に使う標準ライブラリ
-from langchain_community.document_loaders import (
-    GitLoader,  # GitHub リポジトリを扱う LangChain クラス
-)
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import open_persistent_index  # 永続化した Chroma を差分更新して開く
 
 # ---------- LangSmith（LangChain のログ可視化サービス）の設定 ----------
 os.environ["LANGCHAIN_TRACING_V2"] = "true"  # トレーシングを有効化
@@ -44,33 +43,26 @@ def file_filter(file_path: str) -> bool:  # 引数はファイルのパス文字
 
 # ---------- リポジトリのクローンとドキュメント読み込み ----------
 repo_path = "./langchain"  # クローン先のフォルダ名
-if not os.path.exists(repo_path):  # フォルダが無い＝初回実行
-    loder = GitLoader(  # ※綴りが「loder」なのは原文そのまま
-        clone_url="https://github.com/langchain-ai/langchain",  # 公式リポジトリ
-        repo_path=repo_path,  # 保存先
-        branch="master",  # 取得ブランチ
-        file_filter=file_filter,  # .mdx だけ読み込むためのフィルタ
-    )
-    documents = loder.load()  # クローンしてドキュメント生成
-else:  # 既にクローン済みなら再利用
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path=repo_path,
-        branch="master",
-        file_filter=file_filter,
-    )
-    documents = loder.load()  # 最新状態に更新して読み込み
-
-print(len(documents))  # 読み込めたドキュメント数を確認
 
 # ---------- ドキュメントをベクトル化して Chroma に登録 ----------
-from langchain_chroma import Chroma  # ベクトルストア実装
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings  # LLM と埋め込み
 
 embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 埋め込みモデル
-db = Chroma.from_documents(documents, embeddings)  # ベクトルストア生成
+db = open_persistent_index(  # 2 回目以降は保存済みコレクションを開き、差分だけ登録
+    repo_path=repo_path,
+    embeddings=embeddings,
+    clone_url="https://github.com/langchain-ai/langchain",
+    branch="master",
+    file_filter=file_filter,
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 retriever = db.as_retriever()  # 検索インタフェース取得
 
+from multi_query_retriever import MultiQueryVectorRetriever
+
+# 生成した複数クエリを 1 回の埋め込み呼び出し＋1 回の検索でまとめて処理する
+multi_query_retriever = MultiQueryVectorRetriever(db)
+
 # ---------- プロンプトとパーサーなど LCEL 部品 ----------
 from langchain_core.output_parsers import StrOutputParser  # 出力を文字列に変換
 from langchain_core.prompts import ChatPromptTemplate  # system/human テンプレ
@@ -128,7 +120,7 @@ multi_query_rag_chain = (
     {
         "question": RunnablePassthrough(),  # ユーザ質問をそのまま渡す
         "context": query_generation_chain
-        | retriever.map(),  # 各クエリを使って検索結果を合体
+        | multi_query_retriever.retrieve,  # 全クエリをまとめて検索し、重複を除いて結合
     }
     | prompt  # プロンプトに組み込む
     | model  # LLM で回答生成
@@ -143,36 +135,18 @@ print("--------------------------------------------------------")
 print("--------------------------------------------------------")
 
 # ---------- Reciprocal Rank Fusion（検索結果の再順位付け） ----------
-from langchain_core.documents import Document  # 取得文書の型
-
-
-def recipocal_rank_fusion(
-    retriever_outputs: list[Document],  # 検索結果のリスト
-    k: int = 60,  # 重み付け用の定数
-) -> list[str]:
-    """
-    検索結果を「上位に来た回数」と「順位」に応じて再スコアリングする
-    かんたんな実装例。ここでは本文（page_content）だけをキーにしている。
-    """
-    content_score_mapping = {}  # 文書内容とスコアを紐づける辞書
-
-    for docs in retriever_outputs:  # 各クエリごとの結果に対して
-        for rank, doc in enumerate(docs):  # 順位と文書を取り出す
-            content = doc.page_content  # 実際のテキスト
-            if content not in content_score_mapping:
-                content_score_mapping[content] = 0
-            content_score_mapping[content] += 1 / (rank + k)  # RRF の公式
-
-    ranked = sorted(  # スコアが高い順に並べ替え
-        content_score_mapping.items(), key=lambda x: x[1], reverse=True
-    )
-    return [content for content, _ in ranked]  # 文書本文だけをリストで返す
-
+from rank_fusion import (  # チャンク ID で統合し、Document（出典付き）のまま返す
+    format_documents,
+    reciprocal_rank_fusion,
+)
 
 rag_fusion_chain = (
     {
         "question": RunnablePassthrough(),  # 質問文
-        "context": query_generation_chain | retriever.map() | recipocal_rank_fusion,
+        "context": query_generation_chain
+        | multi_query_retriever.retrieve_lists  # クエリごとの結果（重複は共有）
+        | reciprocal_rank_fusion
+        | format_documents,  # [番号] source + 本文 の形で文脈に渡す
     }
     | prompt
     | model
@@ -25,9 +25,8 @@ OpenAI の埋め込みモデルでベクトル化したうえで Chroma に格
 
 # ---------- 必要なライブラリのインポート ----------
 import os  # OS の環境変数操作に使う標準ライブラリ
-from langchain_community.document_loaders import (
-    GitLoader,  # GitHub リポジトリを扱う LangChain クラス
-)
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import open_persistent_index  # 永続化した Chroma を差分更新して開く
 
 # ---------- LangSmith（LangChain のログ可視化サービス）の設定 ----------
 os.environ["LANGCHAIN_TRACING_V2"] = "true"  # トレーシングを有効化
@@ -44,31 +43,19 @@ def file_filter(file_path: str) -> bool:  # 引数はファイルのパス文字
 
 # ---------- リポジトリのクローンとドキュメント読み込み ----------
 repo_path = "./langchain"  # クローン先のフォルダ名
-if not os.path.exists(repo_path):  # フォルダが無い＝初回実行
-    loder = GitLoader(  # ※綴りが「loder」なのは原文そのまま
-        clone_url="https://github.com/langchain-ai/langchain",  # 公式リポジトリ
-        repo_path=repo_path,  # 保存先
-        branch="master",  # 取得ブランチ
-        file_filter=file_filter,  # .mdx だけ読み込むためのフィルタ
-    )
-    documents = loder.load()  # クローンしてドキュメント生成
-else:  # 既にクローン済みなら再利用
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path=repo_path,
-        branch="master",
-        file_filter=file_filter,
-    )
-    documents = loder.load()  # 最新状態に更新して読み込み
-
-print(len(documents))  # 読み込めたドキュメント数を確認
 
 # ---------- ドキュメントをベクトル化して Chroma に登録 ----------
-from langchain_chroma import Chroma  # ベクトルストア実装
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings  # LLM と埋め込み
 
 embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 埋め込みモデル
-db = Chroma.from_documents(documents, embeddings)  # ベクトルストア生成
+db = open_persistent_index(  # 2 回目以降は保存済みコレクションを開き、差分だけ登録
+    repo_path=repo_path,
+    embeddings=embeddings,
+    clone_url="https://github.com/langchain-ai/langchain",
+    branch="master",
+    file_filter=file_filter,
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 retriever = db.as_retriever()  # 検索インタフェース取得
 
 # ---------- プロンプトとパーサーなど LCEL 部品 ----------
@@ -92,30 +79,50 @@ prompt = ChatPromptTemplate.from_template(
 model = ChatOpenAI(model="gpt-4.1-nano", temperature=0)  # 決定論的な LLM
 
 
-from typing import Any
-
-from langchain_cohere import CohereRerank
-from langchain_core.documents import Document
-
-
-def rerank(inp: dict[str, Any], top_n: int = 3) -> list[Document]:
-    question = inp["question"]
-    documents = inp["documents"]
-
-    cohere_reranker = CohereRerank(model="rerank-multilingual-v3.0", top_n=top_n)
-    return cohere_reranker.compress_documents(documents=documents, query=question)
+from batching_reranker import BatchingReranker
+from reranker import StageTimer, make_reranker
 
+# RERANKER=cohere / cross-encoder / bm25（既定の auto は Cohere が使えなければ BM25）
+timer = StageTimer()
+# 同時に届いたリランク要求は 5ms の窓でまとめて採点（まとめて採点できる
+# cross-encoder だけ。BM25・Cohere は 1 件ずつなので、まとめずにそのまま呼ぶ）
+reranker = BatchingReranker(
+    make_reranker(os.environ.get("RERANKER", "auto"), timer=timer),  # 1 回だけ作る
+    max_wait=0.005,
+)
 
 rerank_rag_chain = (
     {
         "question": RunnablePassthrough(),
-        "documents": retriever,
+        "documents": timer.wrap("retrieve", retriever),
     }
-    | RunnablePassthrough.assign(context=rerank)
+    | RunnablePassthrough.assign(context=reranker.as_runnable(top_n=3))
     | prompt
-    | model
+    | timer.wrap("generate", model)
     | StrOutputParser()
 )
 
 output = rerank_rag_chain.invoke("Langchainの概要を教えて")
 print(output)
+
+# ---------- 複数の利用者から同時に質問が来た場合 ----------
+questions = [
+    "Langchainの概要を教えて",
+    "LCELとは何ですか",
+    "Retrieverの使い方を教えて",
+    "Chromaとの連携方法は",
+]
+for question, answer in zip(questions, rerank_rag_chain.batch(questions)):
+    print(f"Q: {question}\nA: {answer}\n")
+if reranker.batching:
+    print(f"リランクのバッチ数: {reranker.stats()['batches']}")
+else:  # score_batch を持たない Reranker は 1 件ずつそのまま採点する
+    print("リランクはバッチにまとめずに実行しました")
+reranker.close()
+
+# ---------- 段階ごとの所要時間 ----------
+for stage, stats in timer.stats().items():
+    print(
+        f"{stage}: 平均 {stats['mean'] * 1000:.1f} ms / "
+        f"p99 {stats['p99'] * 1000:.1f} ms（{stats['calls']} 回）"
+    )
@@ -36,36 +36,26 @@ def file_filter(file_path: str) -> bool:  # 引数: ファイルのパス（文
 
 
 # ---------- 4. Git リポジトリのクローンとドキュメント読み込み ----------
-from langchain_community.document_loaders import (
-    GitLoader,
-)  # GitHub リポジトリを読み込むクラス
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from vector_index import open_persistent_index  # 永続化した Chroma を差分更新して開く
 
 repo_path = "./langchain"  # クローン先フォルダ名
-if not os.path.exists(repo_path):  # フォルダが無い＝初回実行と判定
-    loder = GitLoader(  # ★変数名はタイプミスだが既存実装を尊重
-        clone_url="https://github.com/langchain-ai/langchain",  # 取得元リポジトリの URL
-        repo_path=repo_path,  # ローカル保存先
-        branch="master",  # 取得するブランチ
-        file_filter=file_filter,  # .mdx だけ取り込むフィルタ関数
-    )
-    documents = loder.load()  # リポジトリをクローンしてドキュメント化
-else:  # 既にクローン済みなら更新のみ
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path=repo_path,
-        branch="master",
-        file_filter=file_filter,
-    )
-    documents = loder.load()  # ローカル情報を更新して再読込
-
-print(len(documents))  # 取得できたドキュメント数を標準出力
 
 # ---------- 5. ドキュメントをベクトル化して Chroma に登録 ----------
-from langchain_chroma import Chroma  # ベクトルストア実装
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings  # LLM と埋め込み生成クラス
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 埋め込みモデルを指定
-db = Chroma.from_documents(documents, embeddings)  # ドキュメントをベクトル化して保存
+from embedding_cache import CachedEmbeddings  # 埋め込みの永続キャッシュ
+
+# 同じ本文・同じ質問の埋め込みは .rag_cache/embeddings.sqlite3 から返す
+embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
+db = open_persistent_index(  # 2 回目以降は保存済みコレクションを開き、差分だけ登録
+    repo_path=repo_path,
+    embeddings=embeddings,
+    clone_url="https://github.com/langchain-ai/langchain",
+    branch="master",
+    file_filter=file_filter,
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+)
 retriever = db.as_retriever()  # 検索インタフェースを取得
 
 # ---------- 6. プロンプト・パーサーなど LCEL（LangChain Expression Language）部品 ----------
@@ -92,16 +82,15 @@ model = ChatOpenAI(model="gpt-4.1-nano", temperature=0)  # 温度 0＝同じ入
 
 # ---------- 7. Retriever を 2 系統用意（LangChain 文書 / Web） ----------
 from langchain_community.retrievers import TavilySearchAPIRetriever
+from web_search_cache import CachedWebRetriever  # 同じ質問の Web 検索をまとめる
 
 langchain_document_retriever = retriever.with_config(  # LangChain 文書用 Retriever
     {"run_name": "langchain_document_retriever"}
 )
 
-web_retriever = TavilySearchAPIRetriever(
-    k=3
-).with_config(  # Web 用 Retriever（上位 3 件取得）
-    {"run_name": "Web_retriever"}
-)
+# Web 用 Retriever（上位 3 件取得。質問ごとの TTL でキャッシュし、同時の同じ質問は 1 回に）
+web_search = CachedWebRetriever(retriever=TavilySearchAPIRetriever(k=3))
+web_retriever = web_search.with_config({"run_name": "Web_retriever"})
 
 # ---------- 8. ルーティング判定用データモデル ----------
 from enum import Enum  # 列挙型を定義するための標準ライブラリ
@@ -131,6 +120,15 @@ route_chain = (
     | (lambda x: x.route)  # 結果から route フィールドだけ取り出す
 )
 
+# 例文の重心との類似度でルートを決め、迷ったときだけ route_chain（LLM）に任せる
+from semantic_router import SemanticRouter
+
+router = SemanticRouter(
+    embeddings,
+    fallback=route_chain,
+    verbose=True,  # 質問ごとの判定（local / fallback）を print する
+)
+
 # ---------- 10. ルーティングに応じて Retriever を呼び出す関数 ----------
 from typing import Any  # 任意型ヒント用
 from langchain_core.documents import Document  # ドキュメント型
@@ -152,7 +150,7 @@ def routed_retriever(inp: dict[str, Any]) -> list[Document]:  # 引数: question
 route_rag_chain = (
     {
         "question": RunnablePassthrough(),  # 質問を次ステップへそのまま渡す
-        "route": route_chain,  # まずはルート選択
+        "route": router.as_runnable(),  # まずはルート選択（多くは LLM を呼ばない）
     }
     | RunnablePassthrough.assign(
         context=routed_retriever
@@ -162,11 +160,47 @@ route_rag_chain = (
     | StrOutputParser()  # 文字列に整形
 )
 
+# ルート判定と並行して LangChain 文書（ローカルで安い）の検索を先に始め、
+# web と判定されたときだけ先回りの結果を捨てて Web 検索し直す
+from speculative_retriever import SpeculativeRoutedRetriever
+
+speculative_retriever = SpeculativeRoutedRetriever(
+    router.as_runnable(),
+    {
+        Route.langchain_document.value: langchain_document_retriever,
+        Route.web.value: web_retriever,
+    },
+    speculative_route=Route.langchain_document.value,
+    verbose=True,  # 先回りが当たったかを print する
+)
+speculative_route_rag_chain = (
+    {
+        "question": RunnablePassthrough(),
+        "context": speculative_retriever.as_runnable(),  # ルート判定＋検索
+    }
+    | prompt
+    | model
+    | StrOutputParser()
+)
+
+# ROUTE_MODE=serial で従来どおり「ルート判定 → 検索」を順番に行う
+chain = (
+    route_rag_chain
+    if os.environ.get("ROUTE_MODE") == "serial"
+    else speculative_route_rag_chain
+)
+
 # ---------- 12. チェーンを実行して結果を表示 ----------
-output = route_rag_chain.invoke("Langchainの概要を教えて")  # サンプル質問
+output = chain.invoke("Langchainの概要を教えて")  # サンプル質問
 print(output)  # 生成された回答を表示
 
 print("------------------------------------------------")  # 生成された回答を表示
 
-output2 = route_rag_chain.invoke("東京の今日の天気は")  # サンプル質問
+output2 = chain.invoke("東京の今日の天気は")  # サンプル質問
 print(output2)  # 生成された回答を表示
+
+print(router.stats())  # LLM に任せた割合と平均所要時間
+print(speculative_retriever.stats())  # 先回りの当たり率と短縮できた時間
+speculative_retriever.close()  # 先回り検索用のスレッドプールを閉じる
+print(web_search.stats())  # Web 検索のキャッシュヒット・相乗りの回数
+web_search.close()  # 取り直し用のスレッドプールを閉じる
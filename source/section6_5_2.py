@@ -36,36 +36,34 @@ def file_filter(file_path: str) -> bool:  # 引数: ファイルのパス（文
 
 
 # ---------- 4. Git リポジトリのクローンとドキュメント読み込み ----------
-from langchain_community.document_loaders import (
-    GitLoader,
-)  # GitHub リポジトリを読み込むクラス
+from bm25_index import BM25Index  # mmap で開く永続 BM25 インデックス
+from near_dedup import NearDuplicateFilter  # ほぼ同じ内容のチャンクを登録しない
+from text_tokenizer import make_tokenizer  # BM25 用の分かち書き
+from vector_index import open_persistent_index  # 永続化した Chroma を差分更新して開く
 
 repo_path = "./langchain"  # クローン先フォルダ名
-if not os.path.exists(repo_path):  # フォルダが無い＝初回実行と判定
-    loder = GitLoader(  # ★変数名はタイプミスだが既存実装を尊重
-        clone_url="https://github.com/langchain-ai/langchain",  # 取得元リポジトリの URL
-        repo_path=repo_path,  # ローカル保存先
-        branch="master",  # 取得するブランチ
-        file_filter=file_filter,  # .mdx だけ取り込むフィルタ関数
-    )
-    documents = loder.load()  # リポジトリをクローンしてドキュメント化
-else:  # 既にクローン済みなら更新のみ
-    loder = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path=repo_path,
-        branch="master",
-        file_filter=file_filter,
-    )
-    documents = loder.load()  # ローカル情報を更新して再読込
-
-print(len(documents))  # 取得できたドキュメント数を標準出力
 
 # ---------- 5. ドキュメントをベクトル化して Chroma に登録 ----------
-from langchain_chroma import Chroma  # ベクトルストア実装
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings  # LLM と埋め込み生成クラス
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")  # 埋め込みモデルを指定
-db = Chroma.from_documents(documents, embeddings)  # ドキュメントをベクトル化して保存
+from embedding_cache import CachedEmbeddings  # 埋め込みの永続キャッシュ
+
+# 同じ本文の埋め込みは .rag_cache/embeddings.sqlite3 から返す（2 回目以降は API 0 回）
+embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
+# 日本語の質問でもキーワード検索が効くよう、文字 bigram で分かち書きする
+# （BM25_TOKENIZER=morph で janome の形態素解析、whitespace で従来の空白区切り）
+bm25_index = BM25Index(  # .rag_cache/bm25 を開くだけ（全件の分かち書きはしない）
+    tokenizer=make_tokenizer(os.environ.get("BM25_TOKENIZER", "ngram"))
+)
+db = open_persistent_index(  # 2 回目以降は保存済みコレクションを開き、差分だけ登録
+    repo_path=repo_path,
+    embeddings=embeddings,
+    clone_url="https://github.com/langchain-ai/langchain",
+    branch="master",
+    file_filter=file_filter,
+    dedup=NearDuplicateFilter(),  # バージョン違いのコピーなどを埋め込み前に除く
+    bm25_index=bm25_index,  # Chroma と同じ差分を BM25 にも反映
+)
 retriever = db.as_retriever()  # 検索インタフェースを取得
 
 # ---------- 6. プロンプト・パーサーなど LCEL（LangChain Expression Language）部品 ----------
@@ -90,52 +88,26 @@ prompt = ChatPromptTemplate.from_template(
 
 model = ChatOpenAI(model="gpt-4.1-nano", temperature=0)  # 温度 0＝同じ入力で同じ出力
 
-from langchain_core.documents import Document
-
-
-def recipocal_rank_fusion(
-    retriever_outputs: list[Document],  # 検索結果のリスト
-    k: int = 60,  # 重み付け用の定数
-) -> list[str]:
-    """
-    検索結果を「上位に来た回数」と「順位」に応じて再スコアリングする
-    かんたんな実装例。ここでは本文（page_content）だけをキーにしている。
-    """
-    content_score_mapping = {}  # 文書内容とスコアを紐づける辞書
-
-    for docs in retriever_outputs:  # 各クエリごとの結果に対して
-        for rank, doc in enumerate(docs):  # 順位と文書を取り出す
-            content = doc.page_content  # 実際のテキスト
-            if content not in content_score_mapping:
-                content_score_mapping[content] = 0
-            content_score_mapping[content] += 1 / (rank + k)  # RRF の公式
-
-    ranked = sorted(  # スコアが高い順に並べ替え
-        content_score_mapping.items(), key=lambda x: x[1], reverse=True
-    )
-    return [content for content, _ in ranked]  # 文書本文だけをリストで返す
-
-
-from langchain_community.retrievers import BM25Retriever
+from rank_fusion import format_documents  # Document を [番号] source + 本文 の文脈に
 
 chroma_retriever = retriever.with_config({"run:name": "chroma_retriever"})
 
-bm25_retriever = BM25Retriever.from_documents(documents).with_config(
-    {"run:name": "bm25_retriever"}
+bm25_retriever = bm25_index.as_retriever().with_config({"run:name": "bm25_retriever"})
+
+from hybrid_retriever import (  # 締め切り付きのハイブリッド検索と leg ごとの締め切り
+    BM25_TIMEOUT,
+    CHROMA_TIMEOUT,
+    DeadlineHybridRetriever,
 )
 
-from langchain_core.runnables import RunnableParallel
-
-hybrid_retriever = (
-    RunnableParallel(
-        {
-            "chroma_documents": chroma_retriever,
-            "bm25_documents": bm25_retriever,
-        }
-    )
-    | (lambda x: [x["chroma_documents"], x["bm25_documents"]])
-    | recipocal_rank_fusion
+# 両方の検索を同時に始め、締め切りまでに返ってきた結果だけを RRF で統合する
+# （BM25 はローカルなので短く、Chroma は埋め込み API を待つので長めに取る）
+deadline_retriever = DeadlineHybridRetriever(
+    legs={"chroma": chroma_retriever, "bm25": bm25_retriever},
+    timeouts={"chroma": CHROMA_TIMEOUT, "bm25": BM25_TIMEOUT},
 )
+hybrid_retriever = deadline_retriever | format_documents
+
 hybrid_rag_chain = (
     {
         "question": RunnablePassthrough(),
@@ -148,3 +120,10 @@ hybrid_rag_chain = (
 
 output = hybrid_rag_chain.invoke("LangChainの概要を教えて")
 print(output)
+
+# 締め切りに間に合わなかった検索の回数と所要時間を確認
+print(deadline_retriever.stats())
+deadline_retriever.close()
+
+# 埋め込みキャッシュのヒット率と保存サイズを確認
+print(embeddings.stats())
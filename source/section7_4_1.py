@@ -4,8 +4,8 @@
 #     └ 検索で取り出したテキスト（外部知識）を LLM の追加コンテキストにして回答精度を上げる手法
 # ・キャッシュ
 #     └ ネットワークや API コールの回数を減らすために、一度取り出したデータをローカルに保存する仕組み
-# ・pickle
-#     └ Python オブジェクトをそのままバイナリ化して保存／復元できる標準モジュール（※信頼できるデータのみで）
+# ・DocumentStore（document_store.py）
+#     └ ヘッダ（ローダ設定・コミット・フィルタ）付きのキャッシュ。mmap で必要な Document だけ復元できる
 # ・LangChain / LangSmith
 #     └ LangChain は LLM ワークフローの OSS、LangSmith はその実験管理 SaaS
 # ・ragas
@@ -14,18 +14,16 @@
 
 """
 GitHub 上の LangChain リポジトリから `.mdx` だけを読み込み、
-データを pickle でキャッシュしつつ ragas で QA テストセットを作成し、
+データを DocumentStore でキャッシュしつつ ragas で QA テストセットを作成し、
 最終的に LangSmith へアップロードするスクリプト。
 初回実行はネットワークアクセスが発生し、２回目以降はキャッシュを再利用する。
+（リポジトリのコミットや file_filter が変わったらキャッシュは自動で作り直される）
 ドキュメント QA（＝RAG システム）の評価データづくりを自動化できる。
 """
 
 # ===== ここからインポート =====
-# OS 依存のパス操作やファイル存在チェック
-import os
-
-# Python オブジェクトをバイナリ形式で保存／復元する
-import pickle
+# バージョン付きのドキュメントキャッシュ（同じ source フォルダのモジュール）
+from document_store import load_documents_cached
 
 # Git リポジトリからドキュメントを読み込む LangChain コミュニティ実装
 from langchain_community.document_loaders import GitLoader
@@ -75,33 +73,24 @@ def file_filter(file_path: str) -> bool:
 
 
 # ------------------------------------------------------------------------------
-# pickle のキャッシュファイルを置くパス
+# GitLoader は clone → checkout → ファイル走査まで一括でやってくれる
 # ------------------------------------------------------------------------------
-cache_path = "document.pkl"
+loader = GitLoader(
+    clone_url="https://github.com/langchain-ai/langchain",
+    repo_path="./langchain",  # clone 先のローカルフォルダ
+    branch="master",
+    file_filter=file_filter,  # .mdx だけ読むように設定
+)
 
 # ------------------------------------------------------------------------------
-# ① キャッシュが無ければ GitHub から clone → 読み込み → pickle 保存
-# ② あれば pickle から即時ロード
+# ① キャッシュが無い／古い（コミット・フィルタが変わった）なら
+#    GitHub から clone → 読み込み → .rag_cache/documents.docstore へ保存
+# ② 有効なキャッシュがあれば mmap で開くだけ（Document は触った分だけ復元）
 # ------------------------------------------------------------------------------
-if not os.path.exists(cache_path):
-    # GitLoader は clone → checkout → ファイル走査まで一括でやってくれる
-    loader = GitLoader(
-        clone_url="https://github.com/langchain-ai/langchain",
-        repo_path="./langchain",  # clone 先のローカルフォルダ
-        branch="master",
-        file_filter=file_filter,  # .mdx だけ読むように設定
-    )
-    # ネットワーク I/O が発生する重い処理
-    documents = loader.load()
-
-    # 一度取得したら pickle で保存して次回から高速化
-    with open(cache_path, "wb") as f:
-        # なぜ wb か? ― バイナリモードで書き込み(write binary)するため
-        pickle.dump(documents, f)
-else:
-    # キャッシュ利用時は一瞬でロード完了
-    with open(cache_path, "rb") as f:
-        documents = pickle.load(f)
+document_store = load_documents_cached(loader)
+
+# ragas には List[Document] を渡す必要があるのでここで実体化する
+documents = list(document_store)
 
 print(len(documents))  # どのくらいのドキュメントを扱うか可視化しておく
 
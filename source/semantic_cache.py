@@ -0,0 +1,200 @@
+# =============================================================================
+# 【概要】
+# RAG チェーンの前段に置く「意味が近い質問」の回答キャッシュ（セマンティックキャッシュ）です。
+#
+# section4_6_4.py / section6_2.py の chain.invoke(...) は、同じ質問が何度来ても
+# 検索（Retriever）と回答生成（LLM）を最初からやり直します。
+#
+# SemanticResponseCache は――
+#   1. 質問を埋め込み、保存済みの質問の中からコサイン類似度が threshold 以上のものを
+#      高い順に最大 max_candidates 件探す
+#   2. 検索は毎回行い、取得した文脈の指紋（チャンク ID の並びの sha256）を計算する
+#   3. 候補を類似度の高い順に見て、文脈の指紋も保存時と同じものがあれば保存済みの回答を返す
+#      （インデックスが更新されて文脈が変わっていれば、古い回答は使わない。
+#        1 位の候補の文脈が違っても、2 位以下が同じ文脈なら使える）
+#   4. それ以外は generate（prompt | model | StrOutputParser() など）で回答を作って保存する
+#      （文脈が変わっていた候補は、新しい回答で置き換えられるので捨てる）
+#   5. 件数の上限（LRU）と有効期限（TTL）で古いエントリを捨て、
+#      ヒット・ミス・文脈の変化・期限切れの回数を stats() で確認できるようにする
+# を行い、よくある質問では LLM の呼び出しを検索 1 回に置き換えます。
+#
+# ※ 質問の埋め込みと検索で同じ質問を 2 回埋め込むので、embeddings には
+#    CachedEmbeddings を使うと API の呼び出しは 1 回で済みます。
+# ※ threshold は埋め込みモデルで変わります。言い換えをどこまで同じ質問とみなすかを
+#    見ながら調整してください（高すぎるとヒットせず、低すぎると別の質問に答えてしまう）。
+# =============================================================================
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from hyde_cache import normalize_question
+
+DEFAULT_THRESHOLD = 0.92  # これ以上の類似度なら「同じ質問」とみなす
+DEFAULT_TTL = 24 * 3600.0  # 回答を使い回してよい秒数（None なら期限なし）
+DEFAULT_MAX_CANDIDATES = 4  # threshold 以上の質問のうち、何件まで文脈を比べるか
+
+
+def context_fingerprint(documents: list[Document]) -> str:
+    """文脈（検索結果）の指紋。チャンク ID（無ければ本文）の並びの sha256"""
+    digest = hashlib.sha256()
+    for document in documents:
+        chunk_id = document.metadata.get("chunk_id") or document.id
+        if chunk_id is None:
+            chunk_id = hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+        digest.update(str(chunk_id).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class _Entry:
+    """保存済みの 1 つの質問と回答"""
+
+    question: str
+    vector: np.ndarray  # 長さ 1 にそろえた質問の埋め込み
+    answer: Any
+    fingerprint: str  # 回答を作ったときの文脈の指紋
+    created: float  # time.monotonic()
+
+
+class SemanticResponseCache:
+    """意味の近い質問に、文脈が変わっていなければ保存済みの回答を返す"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        retriever: Runnable,
+        generate: Runnable,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = 256,
+        ttl: Optional[float] = DEFAULT_TTL,
+        max_candidates: int = DEFAULT_MAX_CANDIDATES,
+        verbose: bool = False,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.embeddings = embeddings
+        self.retriever = retriever  # 質問 → Document のリスト
+        self.generate = generate  # {"context": ..., "question": ...} → 回答
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_candidates = max_candidates
+        self.verbose = verbose
+        # 正規化した質問 → _Entry（末尾ほど最近使ったもの）
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._keys: list[str] = []  # _matrix の行と対応するキー
+        self._matrix: Optional[np.ndarray] = None  # エントリが変わったら作り直す
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(
+            ("hits", "misses", "context_changed", "expired", "evictions"), 0
+        )
+        self._latency = {"hit": 0.0, "miss": 0.0}
+
+    # ---------- 1. 近い質問を探す ----------
+    def _nearest(self, vector: np.ndarray) -> list[tuple[str, float]]:
+        """
+        類似度が threshold 以上の (キー, 類似度) を、高い順に最大 max_candidates 件返す。
+        ロックを持って呼ぶ
+        """
+        if not self._entries:
+            return []
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key].vector for key in self._keys])
+        similarities = self._matrix @ vector
+        above = np.flatnonzero(similarities >= self.threshold)
+        best = above[np.argsort(-similarities[above], kind="stable")]
+        return [
+            (self._keys[i], float(similarities[i])) for i in best[: self.max_candidates]
+        ]
+
+    def _discard(self, key: str) -> None:
+        del self._entries[key]
+        self._matrix = None
+
+    # ---------- 2〜4. 検索して、使い回せるか判定する ----------
+    def invoke(self, question: str) -> Any:
+        started = time.perf_counter()
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        documents = self.retriever.invoke(question)
+        fingerprint = context_fingerprint(documents)
+
+        with self._lock:
+            changed: list[str] = []  # 文脈が変わっていた候補のキー
+            for key, similarity in self._nearest(vector):
+                entry = self._entries[key]
+                if self.ttl is not None and time.monotonic() - entry.created > self.ttl:
+                    self._discard(key)
+                    self.counts["expired"] += 1
+                elif entry.fingerprint != fingerprint:
+                    changed.append(key)  # 次に近い候補を見る
+                else:
+                    self._entries.move_to_end(key)
+                    self.counts["hits"] += 1
+                    self._latency["hit"] += time.perf_counter() - started
+                    if self.verbose:
+                        print(
+                            f"[semantic cache] hit: similarity={similarity:.3f} "
+                            f"({question[:30]} ≈ {entry.question[:30]})"
+                        )
+                    return entry.answer
+            if changed:
+                self.counts["context_changed"] += 1
+
+        answer = self.generate.invoke({"context": documents, "question": question})
+
+        # ---------- 5. 保存して、上限を超えた分を古い順に捨てる ----------
+        with self._lock:
+            # 文脈が変わっていた候補は今回の回答で置き換わるので、残さずに捨てる
+            # （生成中に別のスレッドが入れ替えた場合に備えて、指紋を見直す）
+            for stale in changed:
+                entry = self._entries.get(stale)
+                if entry is not None and entry.fingerprint != fingerprint:
+                    self._discard(stale)
+            key = normalize_question(question)
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = _Entry(
+                question=question,
+                vector=vector,
+                answer=answer,
+                fingerprint=fingerprint,
+                created=time.monotonic(),
+            )
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))  # 先頭＝いちばん古い
+                self.counts["evictions"] += 1
+            self.counts["misses"] += 1
+            self._latency["miss"] += time.perf_counter() - started
+        return answer
+
+    def as_runnable(self) -> Runnable:
+        """質問（文字列）→ 回答 の Runnable（chain の代わりに使う）"""
+        return RunnableLambda(self.invoke, name="semantic_response_cache")
+
+    def stats(self) -> dict[str, Any]:
+        """ヒット・ミスの回数とヒット率、ヒット時・ミス時の平均所要時間"""
+        with self._lock:
+            counts = dict(self.counts)
+            counts["entries"] = len(self._entries)
+        hits, misses = counts["hits"], counts["misses"]
+        counts["hit_ratio"] = hits / (hits + misses) if hits + misses else 0.0
+        counts["mean_latency_hit"] = self._latency["hit"] / hits if hits else None
+        counts["mean_latency_miss"] = self._latency["miss"] / misses if misses else None
+        return counts
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
@@ -0,0 +1,176 @@
+# =============================================================================
+# 【概要】
+# 質問の埋め込みと「ルートごとの例文の重心」を比べてルートを決める
+# ローカルなルーター（セマンティックルーター）です。
+#
+# section6_5_1.py の route_chain は、langchain_document / web のどちらを使うかを
+# 決めるためだけに、質問のたびに model.with_structured_output(RouteOutput) で
+# LLM を 1 往復呼び出しています。
+#
+# SemanticRouter は――
+#   1. 起動時にルートごとの例文をまとめて埋め込み、平均（重心）を長さ 1 にそろえる
+#   2. 質問を埋め込み、各重心とのコサイン類似度を計算する
+#   3. 1 位と 2 位の差（margin）が min_margin 以上ならそのルートに決める
+#   4. 差が小さい（どちらとも言えない）ときだけ fallback（LLM の route_chain）に任せる
+# を行い、多くの質問で LLM の往復を埋め込み 1 回（CachedEmbeddings なら 0 回）に置き換えます。
+#
+# ※ min_margin は埋め込みモデルと例文で変わるので、bench_semantic_router.py で
+#    正解ラベル付きの質問に対する正解率と LLM 呼び出し率を見ながら調整してください。
+# =============================================================================
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableLambda
+
+DEFAULT_MIN_MARGIN = 0.03  # 1 位と 2 位の類似度の差がこれ未満なら LLM に任せる
+DEFAULT_MAX_DECISIONS = 1000  # decisions に残す直近の判定の数
+
+# section6_5_1.py のルート（Route の値）ごとの例文
+DEFAULT_ROUTE_EXEMPLARS: dict[str, list[str]] = {
+    "langchain_document": [
+        "Langchainの概要を教えて",
+        "LangChain の LCEL とは何ですか",
+        "Retriever の使い方を教えて",
+        "LangChain で Chroma を使う方法は",
+        "プロンプトテンプレートの書き方",
+        "with_structured_output の使い方",
+        "LangChain のエージェントを作るには",
+        "Document Loader の種類を知りたい",
+        "テキストを分割する TextSplitter の設定",
+        "LangSmith でトレースを見る方法",
+        "How do I use a retriever in LangChain?",
+        "What is LangChain Expression Language?",
+    ],
+    "web": [
+        "東京の今日の天気は",
+        "明日の大阪の天気予報",
+        "今日のニュースを教えて",
+        "最新の為替レートは",
+        "今週末のイベント情報",
+        "日経平均株価の今日の終値",
+        "話題の映画のランキング",
+        "近くのおすすめのレストラン",
+        "来週の祝日はいつ",
+        "最近発表されたスマートフォンの評判",
+        "What is the weather in Tokyo today?",
+        "Latest news about the stock market",
+    ],
+}
+
+
+@dataclass
+class RouteDecision:
+    """1 つの質問に対するルーティングの記録"""
+
+    question: str
+    route: str
+    similarities: dict[str, float]  # ルート → 重心とのコサイン類似度
+    margin: float  # 1 位と 2 位の類似度の差
+    used_fallback: bool  # LLM（fallback）に任せたか
+    elapsed: float
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SemanticRouter:
+    """例文の重心との類似度でルートを選び、迷ったときだけ LLM に任せるルーター"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        exemplars: Optional[dict[str, list[str]]] = None,
+        fallback: Optional[Runnable] = None,
+        min_margin: float = DEFAULT_MIN_MARGIN,
+        max_decisions: int = DEFAULT_MAX_DECISIONS,
+        verbose: bool = False,
+    ):
+        exemplars = exemplars or DEFAULT_ROUTE_EXEMPLARS
+        if len(exemplars) < 2:
+            raise ValueError("SemanticRouter needs at least two routes")
+        self.embeddings = embeddings
+        self.fallback = fallback  # {"question": ...} → ルート（route_chain など）
+        self.min_margin = min_margin
+        self.verbose = verbose
+        # 直近の判定だけを残し（古いものから捨てる）、統計は累計で持つ
+        self.decisions: deque[RouteDecision] = deque(maxlen=max_decisions)
+        self.counts = {"local": 0, "fallback": 0}
+        self._elapsed = {"local": 0.0, "fallback": 0.0}
+        self._lock = threading.Lock()
+
+        # ① 全ルートの例文を 1 回の呼び出しで埋め込み、ルートごとの重心を作る
+        self.routes = list(exemplars)
+        texts = [text for route in self.routes for text in exemplars[route]]
+        vectors = _normalize(np.asarray(embeddings.embed_documents(texts)))
+        centroids, start = [], 0
+        for route in self.routes:
+            end = start + len(exemplars[route])
+            centroids.append(vectors[start:end].mean(axis=0))
+            start = end
+        self.centroids = _normalize(np.asarray(centroids))
+
+    def similarities(self, question: str) -> np.ndarray:
+        """② 質問と各ルートの重心とのコサイン類似度（self.routes の順）"""
+        vector = _normalize(np.asarray(self.embeddings.embed_query(question)))
+        return self.centroids @ vector
+
+    def route(self, question: str) -> str:
+        started = time.perf_counter()
+        similarities = self.similarities(question)
+        order = np.argsort(-similarities)
+        margin = float(similarities[order[0]] - similarities[order[1]])
+        route = self.routes[order[0]]
+
+        # ③〜④ 差が小さいときだけ LLM に任せる
+        used_fallback = margin < self.min_margin and self.fallback is not None
+        if used_fallback:
+            decided = self.fallback.invoke({"question": question})
+            route = str(getattr(decided, "value", decided))  # Route 列挙型なら値に
+
+        decision = RouteDecision(
+            question=question,
+            route=route,
+            similarities=dict(zip(self.routes, similarities.tolist())),
+            margin=margin,
+            used_fallback=used_fallback,
+            elapsed=time.perf_counter() - started,
+        )
+        kind = "fallback" if used_fallback else "local"
+        with self._lock:
+            self.decisions.append(decision)
+            self.counts[kind] += 1
+            self._elapsed[kind] += decision.elapsed
+        if self.verbose:
+            print(
+                f"[router] {route} ({'llm' if used_fallback else 'embedding'}): "
+                f"margin={margin:.3f} {decision.elapsed:.2f}s ({question[:40]})"
+            )
+        return route
+
+    def as_runnable(self) -> Runnable:
+        """質問（文字列）→ ルート名 の Runnable（route_chain の代わりに使う）"""
+        return RunnableLambda(self.route, name="semantic_router")
+
+    def stats(self) -> dict[str, Any]:
+        """LLM に任せた割合と平均所要時間（累計）"""
+        with self._lock:
+            counts, elapsed = dict(self.counts), dict(self._elapsed)
+        local, fallback = counts["local"], counts["fallback"]
+        total = local + fallback
+        return {
+            "queries": total,
+            "fallback": fallback,
+            "fallback_ratio": fallback / total if total else 0.0,
+            "mean_latency_local": elapsed["local"] / local if local else None,
+            "mean_latency_fallback": (
+                elapsed["fallback"] / fallback if fallback else None
+            ),
+        }
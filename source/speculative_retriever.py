@@ -0,0 +1,142 @@
+# =============================================================================
+# 【概要】
+# ルートの判定と並行して、いちばん使われるルートの検索を「先回り」で始める
+# リトリーバです。
+#
+# section6_5_1.py の route_rag_chain は
+#   ルート判定（埋め込み or LLM）→ 判定結果のリトリーバで検索
+# を直列に行うため、検索が始まるのはルートが決まった後です。
+#
+# SpeculativeRoutedRetriever は――
+#   1. 質問が来たらすぐ、speculative_route（既定は langchain_document＝ローカルで安い）
+#      の検索をバックグラウンドで始める
+#   2. 同時にルートを判定する
+#   3. 判定が speculative_route なら先回りした検索結果を待って返す
+#      （ルート判定の待ち時間が検索の裏に隠れる）
+#   4. 別のルート（web など）なら先回りの結果は捨て、そのルートで検索し直す
+# を行い、よくある経路ではルート判定の待ち時間をほぼゼロにします。
+# =============================================================================
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableLambda
+
+DEFAULT_MAX_RECORDS = 1000  # records に残す直近の記録の数
+
+
+@dataclass
+class SpeculationRecord:
+    """1 つの質問での先回り検索の結果"""
+
+    question: str
+    route: str
+    hit: bool  # 先回りしたルートが当たったか
+    routing: float  # ルート判定にかかった秒数
+    retrieval: float  # 使った検索にかかった秒数
+    elapsed: float  # 検索結果が出るまでの秒数（ルート判定を含む）
+
+
+class SpeculativeRoutedRetriever:
+    """ルート判定と並行して、よく当たるルートの検索を先に始める"""
+
+    def __init__(
+        self,
+        router: Runnable,
+        retrievers: dict[str, Runnable],
+        speculative_route: str = "langchain_document",
+        max_workers: int = 8,
+        max_records: int = DEFAULT_MAX_RECORDS,
+        verbose: bool = False,
+    ):
+        if speculative_route not in retrievers:
+            raise ValueError(f"no retriever for route: {speculative_route}")
+        self.router = router  # 質問 → ルート名（SemanticRouter.as_runnable() など）
+        self.retrievers = retrievers  # ルート名 → Retriever
+        self.speculative_route = speculative_route
+        self.verbose = verbose
+        # 直近の記録だけを残し（古いものから捨てる）、統計は累計で持つ
+        self.records: deque[SpeculationRecord] = deque(maxlen=max_records)
+        self.counts = {"queries": 0, "hits": 0, "saved_seconds": 0.0, "elapsed": 0.0}
+        self._lock = threading.Lock()
+        # 外れた先回り検索は待たずに捨てるので、with 文で閉じずにプールを使い回す
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="speculative"
+        )
+
+    @staticmethod
+    def _timed(retriever: Runnable, question: str) -> tuple[list[Document], float]:
+        started = time.perf_counter()
+        documents = retriever.invoke(question)
+        return documents, time.perf_counter() - started
+
+    def retrieve(self, question: str) -> list[Document]:
+        started = time.perf_counter()
+
+        # ① 先回りの検索を開始
+        speculative: Future = self._executor.submit(
+            self._timed, self.retrievers[self.speculative_route], question
+        )
+
+        # ② 並行してルートを判定（Route 列挙型も文字列にそろえる）
+        decided = self.router.invoke(question)
+        route = str(getattr(decided, "value", decided))
+        routing = time.perf_counter() - started
+
+        # ③〜④ 当たりなら先回りの結果を使い、外れなら捨てて検索し直す
+        hit = route == self.speculative_route
+        if hit:
+            documents, retrieval = speculative.result()
+        else:
+            speculative.cancel()  # まだ始まっていなければ取り消す（走っていれば結果を捨てる）
+            retriever = self.retrievers.get(route)
+            if retriever is None:
+                raise ValueError(f"Unknown route:{route}")
+            documents, retrieval = self._timed(retriever, question)
+
+        record = SpeculationRecord(
+            question=question,
+            route=route,
+            hit=hit,
+            routing=routing,
+            retrieval=retrieval,
+            elapsed=time.perf_counter() - started,
+        )
+        with self._lock:
+            self.records.append(record)
+            self.counts["queries"] += 1
+            self.counts["elapsed"] += record.elapsed
+            if hit:
+                # 直列なら「ルート判定＋検索」かかっていたところ、実際は elapsed で済んだ
+                self.counts["hits"] += 1
+                self.counts["saved_seconds"] += routing + retrieval - record.elapsed
+        if self.verbose:
+            print(
+                f"[speculative] {route} ({'hit' if hit else 'miss'}): "
+                f"routing {routing:.2f}s total {record.elapsed:.2f}s ({question[:40]})"
+            )
+        return documents
+
+    def as_runnable(self) -> Runnable:
+        """質問（文字列）→ Document のリスト の Runnable（LCEL 用）"""
+        return RunnableLambda(self.retrieve, name="speculative_routed_retriever")
+
+    def stats(self) -> dict[str, Optional[float]]:
+        """先回りの当たり率と、直列に実行した場合と比べて短縮できた時間（累計）"""
+        with self._lock:
+            counts = dict(self.counts)
+        total = counts["queries"]
+        return {
+            "queries": total,
+            "hit_ratio": counts["hits"] / total if total else 0.0,
+            "saved_seconds": counts["saved_seconds"],
+            "mean_elapsed": counts["elapsed"] / total if total else None,
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,94 @@
+# =============================================================================
+# 【概要】
+# LLM が検索クエリを「書き終えた順に」検索を始めるリトリーバです。
+#
+# section6_3_2.py の query_generation_chain は、構造化出力
+# QueryGenerationOutput が最後まで生成されるのを待ってから検索を始めるため、
+#   クエリ生成（全部）→ 検索 → 回答生成
+# が直列につながり、回答の最初のトークンが出るまでの時間が長くなります。
+#
+# StreamingQueryRetriever は――
+#   1. クエリ生成の出力を JSON のままストリーミングし、途中までの JSON を
+#      その都度パースする（{"queries": ["q1", "q2", "q3 の途中...）
+#   2. リストの最後以外の要素は「書き終わった」クエリなので、その時点で
+#      検索をバックグラウンドで開始する
+#   3. 生成が終わったら残りのクエリも検索し、全結果を重複なしで統合する
+# ことで、2 つ目以降のクエリを生成している間に 1 つ目の検索を済ませます。
+# =============================================================================
+
+import asyncio
+from typing import AsyncIterator, Optional
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from multi_query_retriever import MultiQueryVectorRetriever, interleave_unique
+
+
+def streaming_query_chain(
+    prompt: BasePromptTemplate, model: BaseChatModel, schema: type[BaseModel]
+) -> Runnable:
+    """
+    部分的な dict を順に返すクエリ生成チェーン。
+    with_structured_output(Pydantic クラス) は最後にまとめて 1 回しか返さないため、
+    JSON Schema の dict を渡して JsonOutputParser（途中経過も返す）を使わせる。
+    """
+    return prompt | model.with_structured_output(
+        schema.model_json_schema(), method="json_schema"
+    )
+
+
+async def completed_items(
+    partials: AsyncIterator[dict], key: str
+) -> AsyncIterator[str]:
+    """途中経過の dict 列から、書き終わった key の要素を 1 つずつ取り出す"""
+    emitted, items = 0, []
+    async for partial in partials:
+        items = (partial or {}).get(key) or []
+        # 最後の要素はまだ書き途中かもしれないので、それより前だけを出す
+        while emitted < len(items) - 1:
+            yield items[emitted]
+            emitted += 1
+    for item in items[emitted:]:  # 生成完了：最後の要素も確定
+        yield item
+
+
+class StreamingQueryRetriever:
+    """クエリ生成のストリームを読みながら、確定したクエリから順に検索する"""
+
+    def __init__(
+        self,
+        query_chain: Runnable,
+        retriever: MultiQueryVectorRetriever,
+        key: str = "queries",
+        limit: Optional[int] = None,
+    ):
+        self.query_chain = query_chain  # streaming_query_chain() で作ったチェーン
+        self.retriever = retriever
+        self.key = key
+        self.limit = limit
+
+    async def aretrieve(self, question: str) -> list[Document]:
+        searches: list[asyncio.Task] = []
+        partials = self.query_chain.astream({"question": question})
+        async for query in completed_items(partials, self.key):
+            # 検索（埋め込み API＋ベクトル検索）は同期 I/O なので別スレッドで走らせ、
+            # その間もクエリ生成のストリームを読み続ける
+            searches.append(
+                asyncio.create_task(
+                    asyncio.to_thread(self.retriever.retrieve_lists, [query])
+                )
+            )
+        results = [docs for found in await asyncio.gather(*searches) for docs in found]
+        documents = interleave_unique(results)
+        return documents if self.limit is None else documents[: self.limit]
+
+    def retrieve(self, question: str) -> list[Document]:
+        return asyncio.run(self.aretrieve(question))
+
+    def as_runnable(self) -> Runnable:
+        """LCEL の中で使う（invoke でも ainvoke でも動く）"""
+        return RunnableLambda(self.retrieve, afunc=self.aretrieve)
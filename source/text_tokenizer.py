@@ -0,0 +1,105 @@
+# =============================================================================
+# 【概要】
+# BM25（キーワード検索）用の差し替え可能な分かち書き関数です。
+#
+# BM25Retriever の既定は text.split()（空白で区切るだけ）なので、
+# 「Langchainの概要を教えて」のような空白の無い日本語は 1 つの長い語になり、
+# 文書側の語と一致せず、ハイブリッド検索のキーワード側がほとんど効きません。
+#
+# ここでは――
+#   1. WhitespaceTokenizer   ：これまでと同じ空白区切り（比較用）
+#   2. CharNgramTokenizer    ：英数字は単語、日本語などは文字 n-gram に分ける（既定・高速）
+#   3. MorphologicalTokenizer：janome があれば形態素解析で単語に分ける（助詞などは除く）
+#   4. make_tokenizer()      ：名前（"whitespace" / "ngram" / "morph"）から作る
+# を用意します。どれも「文字列 → 語のリスト」の関数として BM25Index や
+# BM25Retriever（preprocess_func）に渡せます。name はインデックスに記録され、
+# 分かち書きを変えたインデックスは自動で作り直されます。
+# =============================================================================
+
+import re
+import unicodedata
+
+# 英数字は単語ごと、それ以外（日本語など）は連続部分を 1 かたまりとして取り出す
+_TOKEN_RE = re.compile(r"[0-9a-z_]+|[^\x00-\x7f\s]+")
+# 日本語の句読点・括弧・中黒（n-gram にしても検索の役に立たない）。
+# 全角の英数字・記号は NFKC で半角になるので不要。々（U+3005）は語の一部なので残す
+_CJK_PUNCT_RE = re.compile(r"[\u3000-\u3004\u3006-\u303f\u30fb]+")
+
+
+def normalize(text: str) -> str:
+    """全角英数字・半角カナなどを NFKC でそろえ、小文字にする"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+# ---------- 1. 空白区切り ----------
+class WhitespaceTokenizer:
+    """BM25Retriever の既定（text.split()）と同じ"""
+
+    name = "whitespace"
+
+    def __call__(self, text: str) -> list[str]:
+        return text.split()
+
+
+# ---------- 2. 文字 n-gram ----------
+class CharNgramTokenizer:
+    """英数字は単語、日本語などの非 ASCII 文字列は n 文字ずつずらして切る"""
+
+    def __init__(self, n: int = 2):
+        if n < 1:
+            raise ValueError("n must be positive")
+        self.n = n
+        self.name = f"char{n}gram"
+
+    def __call__(self, text: str) -> list[str]:
+        n = self.n
+        tokens: list[str] = []
+        text = _CJK_PUNCT_RE.sub(" ", normalize(text))
+        for token in _TOKEN_RE.findall(text):
+            if token.isascii() or len(token) <= n:
+                tokens.append(token)
+            else:  # 空白で区切られない言語は n 文字ずつずらして切る
+                tokens.extend(token[i : i + n] for i in range(len(token) - n + 1))
+        return tokens
+
+
+# ---------- 3. 形態素解析（任意） ----------
+class MorphologicalTokenizer:
+    """janome で単語に分け、助詞・助動詞・記号を除いた基本形を返す"""
+
+    name = "janome"
+    SKIP_POS = ("助詞", "助動詞", "記号")
+
+    def __init__(self):
+        try:
+            from janome.tokenizer import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "MorphologicalTokenizer には janome が必要です: pip install janome"
+            ) from e
+        self._tokenizer = Tokenizer()  # 辞書の読み込みは 1 回だけ
+
+    def __call__(self, text: str) -> list[str]:
+        tokens = []
+        for token in self._tokenizer.tokenize(normalize(text)):
+            if token.part_of_speech.startswith(self.SKIP_POS):
+                continue
+            word = token.base_form if token.base_form != "*" else token.surface
+            if word.strip():
+                tokens.append(word)
+        return tokens
+
+
+# ---------- 4. 名前から作る ----------
+def make_tokenizer(kind: str = "ngram", **kwargs):
+    """kind: "whitespace" / "ngram"（n=2 など）/ "morph"（janome が必要）"""
+    if kind == "whitespace":
+        return WhitespaceTokenizer()
+    if kind == "ngram":
+        return CharNgramTokenizer(**kwargs)
+    if kind == "morph":
+        return MorphologicalTokenizer()
+    raise ValueError(f"unknown tokenizer: {kind}")
+
+
+tokenize = CharNgramTokenizer(2)  # 既定の分かち書き（BM25Index・BM25Reranker）
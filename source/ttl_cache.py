@@ -0,0 +1,76 @@
+# =============================================================================
+# 【概要】
+# 件数の上限（LRU）と有効期限（TTL）を持つ、スレッドセーフなメモリ内キャッシュです。
+#
+#   - max_entries を超えたら、いちばん長く使われていないものから捨てる（LRU）
+#   - ttl 秒を過ぎたエントリは、次に読まれたときに「無かったこと」にする（TTL）
+#   - hits / misses / evictions を数え、stats() でヒット率を確認できる
+#
+# 使い方:
+#   cache = TTLCache(max_entries=256, ttl=3600)
+#   value = cache.get(key)
+#   if value is None:
+#       value = compute()
+#       cache.set(key, value)
+# =============================================================================
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """LRU＋TTL で古いエントリを捨てる辞書（複数スレッドから使ってよい）"""
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = 3600.0):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.ttl = ttl  # None なら期限なし
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # 上限超え・期限切れで捨てた件数
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """有効なエントリがあれば値を返し、最近使ったものとして末尾へ移す"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None:
+                if time.monotonic() - entry[0] > self.ttl:
+                    del self._entries[key]
+                    self.evictions += 1
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # 先頭＝いちばん古い
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,149 @@
+# =============================================================================
+# 【概要】
+# Chroma のコレクションをディスクに永続化し、2 回目以降は「開くだけ」にする
+# 共通のインデックス構築関数です。
+#
+# これまでの各スクリプトは
+#   documents = GitLoader(...).load()
+#   db = Chroma.from_documents(documents, embeddings)
+# のように毎回メモリ上にコレクションを作り直していたため、
+# 起動時間がコーパスの大きさに比例していました。
+#
+# open_persistent_index() は――
+#   1. IncrementalGitLoader で前回からの差分（追加・変更・削除のパス）だけを取得
+#   2. persist_directory に保存済みの Chroma コレクションを開く
+#   3. 変更・削除されたファイルのチャンクを消し、追加・変更分を 1 ファイルずつ読みながら
+#      stream_ingest で upsert（dedup を渡すと、既存チャンクとほぼ同じ内容のチャンクは登録しない）
+#   4. bm25_index を渡すと、同じ差分を BM25 の転置インデックスにも反映
+#   5. 登録し終えたファイルだけをマニフェストに確定（途中で落ちたら残りは次回やり直し）
+# を行います。変更が無ければツリーの走査だけで済むため、起動はほぼ一定時間です。
+# =============================================================================
+
+import os
+from typing import Callable, Optional
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import TextSplitter
+
+from bm25_index import BM25Index
+from embedding_pipeline import EmbeddingPipeline
+from git_incremental_loader import IncrementalGitLoader
+from ingest_pipeline import stream_ingest
+from near_dedup import NearDuplicateFilter
+
+DEFAULT_PERSIST_DIRECTORY = os.path.join(".rag_cache", "chroma")
+DEFAULT_COLLECTION_NAME = "langchain_docs"
+DELETE_BATCH_SIZE = 1000  # 1 回の削除で where に渡す source 数
+
+
+def open_persistent_index(
+    repo_path: str,
+    embeddings: Embeddings,
+    clone_url: Optional[str] = None,
+    branch: Optional[str] = "main",
+    file_filter: Optional[Callable[[str], bool]] = None,
+    text_splitter: Optional[TextSplitter] = None,
+    embedding_pipeline: Optional[EmbeddingPipeline] = None,
+    persist_directory: str = DEFAULT_PERSIST_DIRECTORY,
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    dedup: Optional[NearDuplicateFilter] = None,
+    bm25_index: Optional[BM25Index] = None,
+) -> Chroma:
+    """
+    永続化した Chroma コレクションを開き、Git の差分だけを反映して返す。
+    分割方法（text_splitter）が違うインデックスは collection_name を分けること。
+    embedding_pipeline を渡すと、embeddings の代わりにバッチ＋並列で埋め込む。
+    dedup を渡すと、ほぼ同じ内容のチャンクを埋め込み前に捨てる
+    （残した側のファイルが変更・削除されたら、捨てた側のファイルも読み直す）。
+    bm25_index を渡すと、コレクションと同じチャンクを持つように差分だけ更新する。
+    """
+    # マニフェストはコレクションと 1 対 1 で持つ（コレクションと常に同期させるため）
+    loader = IncrementalGitLoader(
+        repo_path=repo_path,
+        clone_url=clone_url,
+        branch=branch,
+        file_filter=file_filter,
+        manifest_path=os.path.join(
+            persist_directory, f"{collection_name}.manifest.json"
+        ),
+    )
+    db = Chroma(
+        collection_name=collection_name,
+        embedding_function=embeddings,
+        persist_directory=persist_directory,
+    )
+
+    delta = loader.load_delta()
+    if delta.is_empty:
+        if bm25_index is not None:
+            bm25_index.sync(db)  # 初回や前回の失敗でずれていればここでそろえる
+        return db  # 変更なし：開くだけ
+
+    # ① 重複判定の状態を開き、変更・削除されるファイルのチャンクを残したせいで
+    #    捨てられたチャンクがあれば、そのファイルも読み直す
+    dedup_directory = os.path.join(persist_directory, f"{collection_name}.dedup")
+    if dedup is not None:
+        previous = loader.read_manifest()
+        if not dedup.load(dedup_directory, previous) and previous:
+            # 状態を保存する前に作ったコレクション：一度だけ全チャンクを登録する
+            # （捨てたチャンクの記録は無いので、依存関係は次回の登録分から）
+            dedup.seed_documents(stored_documents(db))
+        delta.reingest(dedup.dependent_sources(delta.stale_sources))
+
+    # ② 変更・削除されたファイルの古いチャンクを削除
+    stale_sources = delta.stale_sources
+    for start in range(0, len(stale_sources), DELETE_BATCH_SIZE):
+        batch = stale_sources[start : start + DELETE_BATCH_SIZE]
+        stale_ids = db.get(where={"source": {"$in": batch}}, include=[])["ids"]
+        if stale_ids:
+            db.delete(ids=stale_ids)
+            if bm25_index is not None:
+                bm25_index.delete(stale_ids)
+
+    if dedup is not None:
+        dedup.remove_sources(stale_sources)
+
+    # ③ 追加・変更されたファイルを 1 件ずつ読みながら 分割 → 埋め込み → upsert
+    #    （全チャンクを登録し終えたファイルを committed に記録していく）
+    committed: list[str] = []
+    try:
+        stats = stream_ingest(
+            loader.iter_upserts(delta),
+            db,
+            text_splitter=text_splitter,
+            pipeline=embedding_pipeline,
+            dedup=dedup,
+            on_committed=committed.append,
+        )
+
+        # ④ 登録し終えたファイルのチャンクを BM25 にも登録
+        if bm25_index is not None:
+            upserted_sources = sorted(committed)
+            for start in range(0, len(upserted_sources), DELETE_BATCH_SIZE):
+                batch = upserted_sources[start : start + DELETE_BATCH_SIZE]
+                bm25_index.add(stored_documents(db, where={"source": {"$in": batch}}))
+            bm25_index.sync(db)
+    finally:
+        # ⑤ 登録し終えたファイルだけを確定（失敗しても、済んだ分は次回やり直さない）
+        #    重複判定の状態は、確定するマニフェストと一致する分だけを先に保存する
+        if dedup is not None:
+            dedup.save(dedup_directory, loader.manifest_files(delta, committed))
+        loader.save_manifest(delta, committed)
+    print(
+        f"index updated: +{len(delta.added)} ~{len(delta.modified)} "
+        f"-{len(delta.deleted)} files ({stats})"
+    )
+    return db
+
+
+def stored_documents(db: Chroma, where: Optional[dict] = None) -> list[Document]:
+    """コレクションに保存済みのチャンクを Document として取り出す（BM25 などで使用）"""
+    result = db.get(where=where, include=["documents", "metadatas"])
+    return [
+        Document(id=chunk_id, page_content=text, metadata=metadata or {})
+        for chunk_id, text, metadata in zip(
+            result["ids"], result["documents"], result["metadatas"]
+        )
+    ]
@@ -0,0 +1,158 @@
+# =============================================================================
+# 【概要】
+# Web 検索（TavilySearchAPIRetriever など）の結果をキャッシュするリトリーバです。
+#
+# section5_4_1.py / section5_4_2.py / section6_5_1.py の TavilySearchAPIRetriever(k=3) は、
+# 「東京の今日の天気は？」のような同じ質問でも毎回 Web 検索 API を呼び出します。
+#
+# CachedWebRetriever は――
+#   1. 質問を正規化（hyde_cache.normalize_question）したものをキーに結果を保存する
+#   2. 有効期限（TTL）は質問ごとに決める（「今日」「天気」「ニュース」など
+#      時間で変わる質問は短く、それ以外は長く。ttl_for で差し替え可能）
+#   3. 期限切れでも stale_ttl 秒以内なら古い結果をすぐ返し、裏で取り直す
+#      （stale-while-revalidate。取り直しに失敗しても古い結果を使い続ける）
+#   4. 同じ質問の検索が実行中なら、新しく検索せずにその結果を待つ（single-flight）
+# を行い、繰り返しの質問や同時に届いた同じ質問で API の呼び出しを 1 回にまとめます。
+# 使い終わったら close() で取り直し用のスレッドプールを閉じてください。
+#
+# オフラインでの動作確認には fake_search_server.py（Tavily の /search を真似る
+# ローカルサーバ）と FakeSearchRetriever を使えます。
+# =============================================================================
+
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from hyde_cache import normalize_question
+from ttl_cache import TTLCache
+
+SHORT_TTL = 600.0  # 時間で答えが変わる質問（10 分）
+LONG_TTL = 24 * 3600.0  # それ以外の質問（1 日）
+DEFAULT_STALE_TTL = 3600.0  # 期限切れ後、取り直しの間に古い結果を返してよい秒数
+
+_TIME_SENSITIVE_RE = re.compile(
+    r"今日|今週|明日|昨日|現在|最新|速報|天気|予報|ニュース|株価|為替|レート|"
+    r"\b(?:today|tomorrow|now|latest|current|weather|news|prices?)\b",
+    re.IGNORECASE,
+)
+
+
+def default_ttl_for(question: str) -> float:
+    """時間で答えが変わりそうな質問は短い TTL、それ以外は長い TTL"""
+    return SHORT_TTL if _TIME_SENSITIVE_RE.search(question) else LONG_TTL
+
+
+class CachedWebRetriever(BaseRetriever):
+    """TTL・stale-while-revalidate・single-flight 付きの Web 検索キャッシュ"""
+
+    retriever: Any  # 本物の Web 検索リトリーバ（TavilySearchAPIRetriever など）
+    ttl_for: Callable[[str], float] = default_ttl_for  # 質問 → TTL（秒）
+    stale_ttl: float = DEFAULT_STALE_TTL
+    cache: Any = None  # TTLCache（None なら既定の設定で作る）
+    # 内部状態
+    _inflight: dict = PrivateAttr(default_factory=dict)  # キー → 実行中の検索の Future
+    # hits / stale_hits / misses / coalesced / refreshes / errors の回数
+    _counts: dict = PrivateAttr(
+        default_factory=lambda: dict.fromkeys(
+            ("hits", "stale_hits", "misses", "coalesced", "refreshes", "errors"), 0
+        )
+    )
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _executor: Any = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="web-revalidate"
+        )
+    )
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.cache is None:
+            # 期限の判定はここで行うので TTLCache 側の TTL は使わない（LRU のみ）
+            self.cache = TTLCache(max_entries=1024, ttl=None)
+
+    def _count(self, name: str) -> None:
+        with self._lock:  # 複数スレッドから同時に数えても取りこぼさない
+            self._counts[name] += 1
+
+    # ---------- 4. single-flight ----------
+    def _claim(self, key: str) -> tuple[Future, bool]:
+        """
+        実行中の検索があればその Future を、無ければ新しく登録した Future を返す。
+        (Future, 自分が始める番か)。self._lock を取った状態で呼ぶ。
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            return future, False
+        future = self._inflight[key] = Future()
+        return future, True
+
+    def _run(self, key: str, question: str, future: Future) -> None:
+        """_claim で登録した検索を実行し、結果をキャッシュと Future に入れる"""
+        try:
+            documents = self.retriever.invoke(question)
+            self.cache.set(key, (time.monotonic(), self.ttl_for(question), documents))
+            future.set_result(documents)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _fetch(self, key: str, question: str) -> Future:
+        """key の検索を始める（実行中なら、その Future に相乗りする）"""
+        with self._lock:
+            future, started = self._claim(key)
+            if not started:
+                self._counts["coalesced"] += 1
+        if started:
+            self._run(key, question, future)
+        return future
+
+    def _revalidate(self, key: str, question: str, future: Future) -> None:
+        """裏で取り直す（失敗しても古い結果が残るので、数えるだけ）"""
+        self._run(key, question, future)
+        self._count("errors" if future.exception() is not None else "refreshes")
+
+    # ---------- 1〜3. キャッシュを引く ----------
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        key = normalize_question(query)
+        entry = self.cache.get(key)
+        if entry is not None:
+            fetched_at, ttl, documents = entry
+            age = time.monotonic() - fetched_at
+            if age <= ttl:
+                self._count("hits")
+                return documents
+            if age <= ttl + self.stale_ttl:
+                self._count("stale_hits")
+                # 実行中かの確認と登録を 1 度にロックして、取り直しを二重に始めない
+                with self._lock:
+                    future, started = self._claim(key)
+                if started:
+                    self._executor.submit(self._revalidate, key, query, future)
+                return documents
+
+        self._count("misses")
+        # 相乗りした場合は先に始めた検索の結果（例外も）を待つ
+        return self._fetch(key, query).result()
+
+    def stats(self) -> dict:
+        """ヒット・古い結果のヒット・ミス・相乗り・取り直しの回数と、API を避けた割合"""
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts["hits"] + counts["stale_hits"] + counts["misses"]
+        avoided = counts["hits"] + counts["stale_hits"] + counts["coalesced"]
+        counts["avoided_ratio"] = avoided / lookups if lookups else 0.0
+        return counts
+
+    def close(self) -> None:
+        """取り直し用のスレッドプールを閉じる（実行中の取り直しは待たない）"""
+        self._executor.shutdown(wait=False, cancel_futures=True)